@@ -1,14 +1,20 @@
 import os
 import logging
-import requests
 import random
 import json
-import re
 import time
-from langdetect import detect
+import tempfile
 
 from config import Config
-from models import Message, Conversation, SophiaSettings
+import http_client
+from models import Message, Conversation
+from settings_cache import get_settings
+from keyword_matcher import match_keywords, QUESTION_WORDS, AUXILIARY_QUESTION_RE
+from language_processor import detect_language
+from image_cache import image_cache, make_cache_key
+from sd_client import sd_checkpoints, gpu_slots
+from media_store import Base64Writer, stream_json_strings, STREAM_CHUNK_SIZE
+from piper_pool import piper_pool
 from app import db
 
 # Configure logging
@@ -17,24 +23,15 @@ logger = logging.getLogger(__name__)
 # OpenRouter API integration
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
 
-def query_openrouter(prompt, model_id=None, max_tokens=200, temperature=0.7, top_p=0.9, stop=None, system_prompt=None):
+def _build_openrouter_request(prompt, model_id=None, max_tokens=200, temperature=0.7, top_p=0.9, stop=None, system_prompt=None, stream=False):
     """
-    Generate text using the OpenRouter API to access various LLM models
+    Build the headers and payload for an OpenRouter chat completion request
     
-    Args:
-        prompt (str): The prompt text to generate from
-        model_id (str): The specific model to use (e.g., "gryphe/mythomax-l2-13b")
-        max_tokens (int): Maximum number of tokens to generate
-        temperature (float): Randomness parameter (0.0 to 1.0)
-        top_p (float): Nucleus sampling parameter
-        stop (list): List of stop sequences
-        system_prompt (str, optional): System prompt for instruction models
-        
     Returns:
-        str or None: The generated text or None if there was an error
+        tuple or None: (headers, payload) or None if settings or the API key are missing
     """
     # Get settings from database
-    settings = SophiaSettings.query.first()
+    settings = get_settings()
     if not settings:
         logger.error("No settings found in database")
         return None
@@ -86,13 +83,40 @@ def query_openrouter(prompt, model_id=None, max_tokens=200, temperature=0.7, top
         "stop": stop
     }
     
+    if stream:
+        payload["stream"] = True
+    
+    return headers, payload
+
+def query_openrouter(prompt, model_id=None, max_tokens=200, temperature=0.7, top_p=0.9, stop=None, system_prompt=None):
+    """
+    Generate text using the OpenRouter API to access various LLM models
+    
+    Args:
+        prompt (str): The prompt text to generate from
+        model_id (str): The specific model to use (e.g., "gryphe/mythomax-l2-13b")
+        max_tokens (int): Maximum number of tokens to generate
+        temperature (float): Randomness parameter (0.0 to 1.0)
+        top_p (float): Nucleus sampling parameter
+        stop (list): List of stop sequences
+        system_prompt (str, optional): System prompt for instruction models
+        
+    Returns:
+        str or None: The generated text or None if there was an error
+    """
+    request_data = _build_openrouter_request(prompt, model_id, max_tokens, temperature, top_p, stop, system_prompt)
+    if not request_data:
+        return None
+    
+    headers, payload = request_data
+    
     try:
         # Submit generation request
-        response = requests.post(
+        response = http_client.post(
             OPENROUTER_API_URL,
             headers=headers,
             json=payload,
-            timeout=30
+            read_timeout=30
         )
         
         # Handle API response
@@ -112,6 +136,83 @@ def query_openrouter(prompt, model_id=None, max_tokens=200, temperature=0.7, top
         logger.error(f"Error querying OpenRouter API: {str(e)}")
         return None
 
+class OpenRouterStreamError(Exception):
+    """An OpenRouter stream failed or ended before the reply was complete"""
+
+
+def stream_openrouter(prompt, model_id=None, max_tokens=200, temperature=0.7, top_p=0.9, stop=None, system_prompt=None):
+    """
+    Generate text using the OpenRouter API in streaming mode
+    
+    Reads the server-sent events produced by `stream: true` and yields each
+    content delta as soon as it arrives. Takes the same arguments as query_openrouter.
+    
+    Yields:
+        str: Incremental pieces of the generated text
+        
+    Raises:
+        OpenRouterStreamError: If the request failed, or the stream ended without
+            [DONE] or a finish_reason (e.g. a dropped connection or read timeout),
+            so the pieces yielded so far are not the whole reply
+    """
+    request_data = _build_openrouter_request(prompt, model_id, max_tokens, temperature, top_p, stop, system_prompt, stream=True)
+    if not request_data:
+        return
+    
+    headers, payload = request_data
+    complete = False
+    
+    try:
+        response = http_client.post(
+            OPENROUTER_API_URL,
+            headers=headers,
+            json=payload,
+            stream=True,
+            read_timeout=30  # Maximum gap between two chunks, not the whole reply
+        )
+        
+        with response:
+            if response.status_code != 200:
+                raise OpenRouterStreamError(f"OpenRouter API returned {response.status_code}: {response.text}")
+            
+            for line in response.iter_lines(decode_unicode=True):
+                # Skip keep-alive blank lines and SSE comments (": OPENROUTER PROCESSING")
+                if not line or line.startswith(":"):
+                    continue
+                
+                if not line.startswith("data:"):
+                    continue
+                
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    complete = True
+                    break
+                
+                try:
+                    event = json.loads(data)
+                except ValueError:
+                    logger.warning(f"Skipping malformed OpenRouter stream event: {data[:100]}")
+                    continue
+                
+                choices = event.get("choices") or []
+                if not choices:
+                    continue
+                
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+                
+                if choices[0].get("finish_reason"):
+                    complete = True
+    
+    except OpenRouterStreamError:
+        raise
+    except Exception as e:
+        raise OpenRouterStreamError(f"Error streaming from OpenRouter API: {str(e)}") from e
+    
+    if not complete:
+        raise OpenRouterStreamError("OpenRouter stream ended before the reply was complete")
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
@@ -145,7 +246,7 @@ def transcribe_with_whisper(audio_data, language="en"):
         str or None: The transcribed text or None if there was an error
     """
     # Get settings from database
-    settings = SophiaSettings.query.first()
+    settings = get_settings()
     if not settings:
         logger.error("No settings found in database")
         return None
@@ -173,7 +274,7 @@ def transcribe_with_whisper(audio_data, language="en"):
     }
     
     try:
-        response = requests.post(url, headers=headers, files=files, data=data)
+        response = http_client.post(url, headers=headers, files=files, data=data, read_timeout=60)
         
         if response.status_code == 200:
             result = response.json()
@@ -200,7 +301,7 @@ def generate_speech_with_piper(text, voice_id=None, speed=1.0):
         bytes or None: The audio data or None if there was an error
     """
     # Get settings from database
-    settings = SophiaSettings.query.first()
+    settings = get_settings()
     if not settings:
         logger.error("No settings found in database")
         return None
@@ -209,55 +310,32 @@ def generate_speech_with_piper(text, voice_id=None, speed=1.0):
     if not voice_id:
         voice_id = settings.piper_voice_id
     
-    # Set up subprocess to run Piper locally (it's pre-installed)
     try:
-        # Command to run Piper with specified voice model
-        import subprocess
-        from io import BytesIO
-        
-        # Adjust the path to where Piper is installed
-        cmd = [
-            "piper",
-            "--model", f"/path/to/piper/voices/{voice_id}.onnx",
-            "--output_raw"
-        ]
-        
-        # Run Piper and capture output
-        process = subprocess.Popen(
-            cmd,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        
-        # Send text to Piper
-        audio_data, stderr = process.communicate(input=text)
-        
-        if process.returncode != 0:
-            logger.error(f"Error generating speech with Piper: {stderr}")
+        # Synthesize with the voice's long-lived Piper process (the model stays loaded between calls)
+        result = piper_pool.synthesize(voice_id, text)
+        if result is None:
             return None
+        audio_data, sample_rate = result
         
         # Convert raw audio data to WAV format
         import wave
         import numpy as np
+        from io import BytesIO
         
         # Convert raw audio to numpy array
         audio_array = np.frombuffer(audio_data, dtype=np.int16)
         
-        # Adjust speed if needed
+        # Adjust speed if needed (WSOLA keeps the pitch, unlike resampling)
         if speed != 1.0:
-            # Use scipy for resampling
-            from scipy import signal
-            audio_array = signal.resample(audio_array, int(len(audio_array) / speed))
-            audio_array = audio_array.astype(np.int16)
+            from time_stretch import time_stretch
+            audio_array = time_stretch(audio_array, speed, sample_rate)
         
         # Create WAV file in memory
         wav_buffer = BytesIO()
         with wave.open(wav_buffer, 'wb') as wav_file:
             wav_file.setnchannels(1)  # Mono
             wav_file.setsampwidth(2)  # 16-bit
-            wav_file.setframerate(22050)  # Standard rate for Piper
+            wav_file.setframerate(sample_rate)  # The voice model's rate (22050 for most Piper voices)
             wav_file.writeframes(audio_array.tobytes())
         
         wav_data = wav_buffer.getvalue()
@@ -267,59 +345,23 @@ def generate_speech_with_piper(text, voice_id=None, speed=1.0):
         logger.error(f"Error generating speech with Piper: {str(e)}")
         return None
 
-def analyze_user_message(message):
+def analyze_user_message(message, language=None):
     """
     Analyze user message for intent and sentiment using simple keyword matching
+    
+    All vocabularies are matched in a single pass by the precompiled matcher in keyword_matcher.
+    Pass language if it has already been detected to skip detecting it again.
     """
     try:
-        # Enhanced dictionaries of keywords for various sentiments and intents
-        positive_words = ['happy', 'good', 'great', 'excellent', 'amazing', 'love', 'like', 'thank', 
-                         'thanks', 'wonderful', 'awesome', 'beautiful', 'enjoy', 'pleased', 'smile',
-                         'glad', 'joy', 'excited', 'fun', 'nice', 'perfect', 'fantastic', 'brilliant']
-        
-        negative_words = ['sad', 'bad', 'terrible', 'horrible', 'hate', 'dislike', 'angry', 'upset',
-                         'disappointed', 'awful', 'worse', 'worst', 'sucks', 'sorry', 'unfortunately',
-                         'mad', 'annoyed', 'frustrated', 'unhappy', 'depressed', 'worried', 'tired']
-        
-        question_indicators = [
-            # Question words
-            'what', 'where', 'when', 'who', 'whom', 'whose', 'why', 'how',
-            # Question auxiliaries at start of sentence
-            '^is ', '^are ', '^do ', '^does ', '^did ', '^can ', '^could ', 
-            '^would ', '^will ', '^should ', '^have ', '^has '
-        ]
-        
-        flirty_words = [
-            'cute', 'sexy', 'hot', 'attractive', 'beautiful', 'handsome', 'gorgeous', 
-            'kiss', 'date', 'love', 'like you', 'miss you', 'hug', 'cuddle', 'together',
-            'relationship', 'romantic', 'boyfriend', 'girlfriend', 'partner', 'lover',
-            'marry', 'marriage', 'dating', 'flirt', 'wink', 'crush', 'charming'
-        ]
-        
-        greeting_patterns = [
-            'hi', 'hello', 'hey', 'howdy', 'greetings', 'good morning', 'good afternoon', 
-            'good evening', 'what\'s up', 'sup', 'yo', 'hiya'
-        ]
-        
-        farewell_patterns = [
-            'bye', 'goodbye', 'see you', 'talk to you later', 'have to go', 'gotta go',
-            'farewell', 'until next time', 'catch you later', 'night', 'good night'
-        ]
-        
-        personal_questions = [
-            'how are you', 'how do you feel', 'what are you doing', 'what\'s up with you',
-            'tell me about yourself', 'who are you', 'what do you like', 'what\'s your favorite',
-            'where are you', 'where do you live', 'what do you look like', 'how old are you'
-        ]
-        
-        # Count occurrences and check patterns
+        # Find all keyword hits and check patterns
         message_lower = message.lower()
         message_words = message_lower.split()
+        hits = match_keywords(message_lower)
         
         # Basic counting for simple keywords
-        positive_count = sum(1 for word in positive_words if word in message_lower)
-        negative_count = sum(1 for word in negative_words if word in message_lower)
-        flirty_count = sum(1 for word in flirty_words if word in message_lower)
+        positive_count = len(hits['positive'])
+        negative_count = len(hits['negative'])
+        flirty_count = len(hits['flirty'])
         
         # Check for question pattern using regex for start-of-sentence patterns and word matching
         is_question = False
@@ -329,28 +371,21 @@ def analyze_user_message(message):
         if message.strip().endswith('?'):
             is_question = True
             question_confidence = 0.9
-        else:
-            # Check for question words
-            for q_word in ['what', 'where', 'when', 'who', 'whom', 'whose', 'why', 'how']:
-                if q_word in message_words:
-                    is_question = True
-                    question_confidence = 0.8
-                    break
-            
-            # Check for auxiliary verbs at the beginning
-            if not is_question:
-                for pattern in ['^is ', '^are ', '^do ', '^does ', '^did ', '^can ', '^could ', '^would ']:
-                    if re.search(pattern, message_lower):
-                        is_question = True
-                        question_confidence = 0.7
-                        break
+        # Check for question words
+        elif not QUESTION_WORDS.isdisjoint(message_words):
+            is_question = True
+            question_confidence = 0.8
+        # Check for auxiliary verbs at the beginning
+        elif AUXILIARY_QUESTION_RE.match(message_lower):
+            is_question = True
+            question_confidence = 0.7
         
         # Check for greetings and farewells
-        is_greeting = any(pattern in message_lower for pattern in greeting_patterns)
-        is_farewell = any(pattern in message_lower for pattern in farewell_patterns)
+        is_greeting = bool(hits['greeting'])
+        is_farewell = bool(hits['farewell'])
         
         # Check for personal questions about Sophia
-        is_personal_question = any(pattern in message_lower for pattern in personal_questions)
+        is_personal_question = bool(hits['personal_question'])
         
         # Determine sentiment with improved weighting
         if positive_count > negative_count:
@@ -374,11 +409,9 @@ def analyze_user_message(message):
             "flirty_confidence": min(0.95, 0.2 * flirty_count)
         }
         
-        # Attempt to detect language
-        try:
-            language = detect(message)
-        except:
-            language = "en"  # Default to English if detection fails
+        # Detect language unless the caller already did (detection is cached)
+        if not language:
+            language = detect_language(message)
             
         return {
             "sentiment": sentiment,
@@ -408,9 +441,7 @@ def get_conversation_history(conversation_id, max_messages=5):
     """
     Retrieve recent conversation history for context
     """
-    messages = Message.query.filter_by(conversation_id=conversation_id)\
-        .order_by(Message.timestamp.desc())\
-        .limit(max_messages).all()
+    messages = Message.history(conversation_id).limit(max_messages).all()
     
     # Reverse to get chronological order
     messages = messages[::-1]
@@ -423,27 +454,32 @@ def get_conversation_history(conversation_id, max_messages=5):
     
     return "\n".join(history)
 
-def generate_text_response(user_message, conversation_id=None, flirt_level=5, language="en", model_name=None, nsfw=False):
+def generate_text_response(user_message, conversation_id=None, flirt_level=5, language="en", model_name=None, nsfw=False, on_chunk=None, analysis=None):
     """
     Generate a text response to the user's message using OpenRouter API to access MythoMax-L2, OpenHermes, and Deepseek models
+    
+    Pass analysis if the caller has already run analyze_user_message on this message.
+    
+    If on_chunk is given, the reply is streamed from OpenRouter and on_chunk(text)
+    is called with each piece as it arrives. The full response is still returned.
+    Replies that need translation are not streamed, since only the full text can be translated.
     """
     # Get settings from database
-    settings = SophiaSettings.query.first()
+    settings = get_settings()
     if not settings:
         logger.error("No settings found in database")
         return "I'm sorry, but I'm having trouble accessing my settings. Please try again later."
     
-    # Analyze user message
-    analysis = analyze_user_message(user_message)
+    # Analyze user message unless the caller already did
+    if analysis is None:
+        analysis = analyze_user_message(user_message)
     
     # Get conversation history if available
     context_messages = []
     if conversation_id is not None:
         try:
             # Get last few messages
-            messages = Message.query.filter_by(conversation_id=conversation_id)\
-                .order_by(Message.timestamp.desc())\
-                .limit(3).all()
+            messages = Message.history(conversation_id).limit(3).all()
             
             # Reverse to get chronological order
             context_messages = list(reversed(messages))
@@ -519,14 +555,40 @@ def generate_text_response(user_message, conversation_id=None, flirt_level=5, la
         system_prompt = f"{flirt_instruction} {persona_details}"
         
         # Query OpenRouter API
-        response = query_openrouter(
-            prompt=conversation_text,
-            model_id=selected_model,
-            max_tokens=150,
-            temperature=0.75,
-            top_p=0.9,
-            system_prompt=system_prompt
-        )
+        response = None
+        if on_chunk and language == "en":
+            chunks = []
+            try:
+                for chunk in stream_openrouter(
+                    prompt=conversation_text,
+                    model_id=selected_model,
+                    max_tokens=150,
+                    temperature=0.75,
+                    top_p=0.9,
+                    system_prompt=system_prompt
+                ):
+                    # Drop leading whitespace so the first chunk renders cleanly
+                    if not chunks:
+                        chunk = chunk.lstrip()
+                        if not chunk:
+                            continue
+                    chunks.append(chunk)
+                    on_chunk(chunk)
+                response = "".join(chunks)
+            except OpenRouterStreamError as e:
+                # Never keep a cut-off fragment as the reply; ask again without streaming.
+                # Clients replace the streamed text with the final reply.
+                logger.warning(f"Incomplete OpenRouter stream after {len(chunks)} chunks, retrying without streaming: {str(e)}")
+        
+        if response is None:
+            response = query_openrouter(
+                prompt=conversation_text,
+                model_id=selected_model,
+                max_tokens=150,
+                temperature=0.75,
+                top_p=0.9,
+                system_prompt=system_prompt
+            )
         
         if response:
             # Translate if needed
@@ -548,24 +610,41 @@ def generate_text_response(user_message, conversation_id=None, flirt_level=5, la
     
 # Add image generation integration with Stable Diffusion (Automatic1111) and Google Colab
 
-def generate_image_with_stable_diffusion(prompt, negative_prompt=None, model=None, width=1024, height=1024, steps=30, cfg_scale=7.0):
+def _cached_generation(params, generate):
     """
-    Generate an image using Stable Diffusion via Automatic1111 API
+    Run an image generation through the image cache
+    
+    Only requests with an explicit seed are cached: the same parameters and seed
+    always give the same image, so it is returned from the cache instead of
+    using GPU time again. Without a seed (or with -1) a random seed is drawn and
+    the image is generated fresh, so repeated prompts still get new images.
     
     Args:
-        prompt (str): The text prompt to generate an image from
-        negative_prompt (str, optional): Negative prompt to guide generation away from certain elements
-        model (str, optional): The SD model to use (e.g. "RealisticVision")
-        width (int): Image width in pixels
-        height (int): Image height in pixels
-        steps (int): Number of sampling steps
-        cfg_scale (float): Classifier free guidance scale
+        params (dict): Canonical generation parameters, including 'seed'
+        generate (callable): Called with the resolved seed to produce image bytes
         
     Returns:
-        bytes or None: The image data in bytes or None if there was an error
+        bytes or None: The image data or None if generation failed
+    """
+    seed = params.get('seed')
+    
+    if seed is None or seed == -1:
+        return generate(random.randint(0, 2147483647))
+    
+    if not Config.IMAGE_CACHE_ENABLED:
+        return generate(seed)
+    
+    return image_cache.get_or_generate(params, lambda: generate(seed))
+
+def _sd_generation_params(prompt, negative_prompt=None, model=None, width=None, height=None, steps=None, cfg_scale=None, seed=None):
+    """
+    Resolve Stable Diffusion settings into the canonical generation parameters
+    
+    Returns:
+        tuple or None: (sd_url, params) or None if settings or the SD URL are missing
     """
     # Get settings from database
-    settings = SophiaSettings.query.first()
+    settings = get_settings()
     if not settings:
         logger.error("No settings found in database")
         return None
@@ -587,8 +666,10 @@ def generate_image_with_stable_diffusion(prompt, negative_prompt=None, model=Non
     if not sd_url.endswith('/sdapi/v1'):
         sd_url = sd_url.rstrip('/') + '/sdapi/v1'
     
-    # Prepare API payload
-    payload = {
+    # Canonical generation parameters; these are also the image cache key
+    params = {
+        "backend": "stable_diffusion",
+        "model": model,
         "prompt": prompt,
         "negative_prompt": negative_prompt,
         "width": width if width else settings.sd_width,
@@ -596,73 +677,226 @@ def generate_image_with_stable_diffusion(prompt, negative_prompt=None, model=Non
         "steps": steps if steps else settings.sd_steps,
         "cfg_scale": cfg_scale if cfg_scale else settings.sd_cfg_scale,
         "sampler_name": "Euler a",
-        "batch_size": 1,
-        "seed": random.randint(-1, 2147483647),
         "restore_faces": True,
+        "seed": seed,
     }
     
-    # Add model override if specified
-    if model:
-        headers = {"Content-Type": "application/json"}
-        model_payload = {"sd_model_checkpoint": model}
+    return sd_url, params
+
+def generate_image_with_stable_diffusion(prompt, negative_prompt=None, model=None, width=1024, height=1024, steps=30, cfg_scale=7.0, seed=None):
+    """
+    Generate an image using Stable Diffusion via Automatic1111 API
+    
+    Args:
+        prompt (str): The text prompt to generate an image from
+        negative_prompt (str, optional): Negative prompt to guide generation away from certain elements
+        model (str, optional): The SD model to use (e.g. "RealisticVision")
+        width (int): Image width in pixels
+        height (int): Image height in pixels
+        steps (int): Number of sampling steps
+        cfg_scale (float): Classifier free guidance scale
+        seed (int, optional): Sampling seed; cached when given, random and uncached when omitted
         
-        try:
-            # Set the model first
-            requests.post(
-                f"{sd_url}/options",
-                json=model_payload,
-                headers=headers
-            )
-        except Exception as e:
-            logger.error(f"Error setting SD model: {str(e)}")
+    Returns:
+        bytes or None: The image data in bytes or None if there was an error
+    """
+    resolved = _sd_generation_params(prompt, negative_prompt, model, width, height, steps, cfg_scale, seed)
+    if not resolved:
+        return None
+    
+    sd_url, params = resolved
+    
+    def generate(resolved_seed):
+        images = _txt2img(sd_url, params, resolved_seed, 1)
+        return images[0] if images else None
     
-    # Generate the image
+    return _cached_generation(params, generate)
+
+def generate_images_batch(prompts, negative_prompt=None, model=None, width=None, height=None, steps=None, cfg_scale=None, seeds=None):
+    """
+    Generate several images that share one model and size in as few txt2img calls as possible
+    
+    The txt2img API takes one prompt per request and gives the images of a
+    batch consecutive seeds, so images with the same prompt and consecutive
+    seeds are sent together as a single batch_size/n_iter request. Each image
+    is cached under its own seed, so images already generated (e.g. before a
+    restart) are not generated again.
+    
+    Args:
+        prompts (list): Text prompts, one per image wanted
+        negative_prompt (str, optional): Negative prompt shared by all images
+        model (str, optional): The SD model to use
+        width (int, optional): Image width in pixels
+        height (int, optional): Image height in pixels
+        steps (int, optional): Number of sampling steps
+        cfg_scale (float, optional): Classifier free guidance scale
+        seeds (list, optional): Seed of each image, e.g. as recorded on its post; images
+            without one get random seeds and aren't cached
+        
+    Returns:
+        list: Image bytes (or None where generation failed), in the same order as prompts
+    """
+    results = [None] * len(prompts)
+    seeds = list(seeds) if seeds else [None] * len(prompts)
+    
+    # Group identical prompts so each group is one request
+    groups = {}
+    for index, prompt in enumerate(prompts):
+        groups.setdefault(prompt, []).append(index)
+    
+    for prompt, indexes in groups.items():
+        resolved = _sd_generation_params(prompt, negative_prompt, model, width, height, steps, cfg_scale)
+        if not resolved:
+            return results
+        
+        sd_url, params = resolved
+        
+        # Images without a seed take consecutive seeds from a random start, so they share a request
+        next_random_seed = random.randint(0, 2147483647 - len(indexes))
+        items = []
+        for index in indexes:
+            seed = seeds[index]
+            if seed is None or seed == -1:
+                items.append((next_random_seed, index, False))
+                next_random_seed += 1
+            else:
+                items.append((seed, index, Config.IMAGE_CACHE_ENABLED))
+        
+        for seed, index, use_cache in items:
+            if use_cache:
+                results[index] = image_cache.get(make_cache_key(dict(params, seed=seed)))
+        
+        # Runs of consecutive seeds are one request each
+        runs = []
+        for item in sorted(item for item in items if results[item[1]] is None):
+            if runs and item[0] == runs[-1][-1][0] + 1:
+                runs[-1].append(item)
+            else:
+                runs.append([item])
+        
+        for run in runs:
+            generated = _txt2img(sd_url, params, run[0][0], len(run)) or []
+            for (seed, index, use_cache), data in zip(run, generated):
+                results[index] = data
+                if use_cache and data is not None:
+                    try:
+                        image_cache.put(make_cache_key(dict(params, seed=seed)), data)
+                    except Exception as e:
+                        logger.error(f"Error writing image to cache: {str(e)}")
+    
+    return results
+
+def _txt2img(sd_url, params, seed, count=1):
+    """
+    Call the Automatic1111 txt2img API and return the generated images
+    
+    Up to SD_MAX_BATCH_SIZE images are generated per iteration (batch_size),
+    with enough iterations (n_iter) to make count images.
+    
+    Returns:
+        list or None: count image byte strings, or None if there was an error
+    """
+    n_iter = -(-count // Config.SD_MAX_BATCH_SIZE)
+    batch_size = -(-count // n_iter)
+    
+    # Prepare API payload
+    payload = {
+        "prompt": params["prompt"],
+        "negative_prompt": params["negative_prompt"],
+        "width": params["width"],
+        "height": params["height"],
+        "steps": params["steps"],
+        "cfg_scale": params["cfg_scale"],
+        "sampler_name": params["sampler_name"],
+        "batch_size": batch_size,
+        "n_iter": n_iter,
+        "seed": seed,
+        "restore_faces": params["restore_faces"],
+    }
+    
+    if params["model"]:
+        # Other processes share the endpoint and may have switched it since the tracker last
+        # looked, so pin the checkpoint on the request itself (and leave it loaded afterwards)
+        payload["override_settings"] = {"sd_model_checkpoint": params["model"]}
+        payload["override_settings_restore_afterwards"] = False
+    
+    # Generate the image, switching checkpoints only if the endpoint has a different one loaded
     try:
         headers = {"Content-Type": "application/json"}
-        response = requests.post(
-            f"{sd_url}/txt2img",
-            json=payload,
-            headers=headers,
-            timeout=120  # Allow for longer timeout as generation can take time
-        )
+        # Queue on the checkpoint tracker first, so jobs are still grouped by model; the GPU slot
+        # is only taken once this job is next on its endpoint
+        with sd_checkpoints.use_checkpoint(sd_url, params["model"]), gpu_slots:
+            response = http_client.post(
+                f"{sd_url}/txt2img",
+                json=payload,
+                headers=headers,
+                read_timeout=120 * n_iter,  # Allow for longer timeout as generation can take time
+                stream=True
+            )
         
         if response.status_code == 200:
-            result = response.json()
-            if "images" in result and len(result["images"]) > 0:
-                # Result contains base64 encoded image
-                import base64
-                from io import BytesIO
-                from PIL import Image
-                
-                # Decode base64 image
-                image_data = base64.b64decode(result["images"][0])
-                
-                # Return the raw image bytes
-                return image_data
+            images = _read_streamed_images(response, "images")
+            if len(images) >= count:
+                # A grid image, if any, comes first
+                return images[-batch_size * n_iter:][:count]
             else:
-                logger.error("No images in Stable Diffusion API response")
+                logger.error(f"Expected {count} images from Stable Diffusion API, got {len(images)}")
                 return None
         else:
             logger.error(f"Error from Stable Diffusion API: {response.status_code}, {response.text}")
+            sd_checkpoints.forget(sd_url)
             return None
             
     except Exception as e:
         logger.error(f"Error generating image with Stable Diffusion: {str(e)}")
+        # The endpoint may have failed halfway through a checkpoint switch; read it again next time
+        sd_checkpoints.forget(sd_url)
         return None
 
-def generate_image_with_google_colab(prompt, negative_prompt=None):
+def _read_streamed_images(response, key):
+    """
+    Decode the base64 image(s) under a top-level key of a streamed JSON response
+    
+    The body is parsed as it arrives and each image is decoded in chunks to a
+    temp file, so the JSON text, the base64 strings and the decoded bytes are
+    never all in memory at once.
+    
+    Returns:
+        list: Decoded image bytes, in response order
+    """
+    files = []
+    
+    def open_writer():
+        image_file = tempfile.TemporaryFile()
+        files.append(image_file)
+        return Base64Writer(image_file)
+    
+    try:
+        stream_json_strings(response.iter_content(chunk_size=STREAM_CHUNK_SIZE), key, open_writer)
+        images = []
+        for image_file in files:
+            image_file.seek(0)
+            images.append(image_file.read())
+        return images
+    finally:
+        for image_file in files:
+            image_file.close()
+        response.close()
+
+def generate_image_with_google_colab(prompt, negative_prompt=None, seed=None):
     """
     Generate high-quality image using Google Colab
     
     Args:
         prompt (str): The text prompt to generate an image from
         negative_prompt (str, optional): Negative prompt for better quality
+        seed (int, optional): Sampling seed; cached when given, random and uncached when omitted
         
     Returns:
         bytes or None: The image data in bytes or None if there was an error
     """
     # Get settings from database
-    settings = SophiaSettings.query.first()
+    settings = get_settings()
     if not settings:
         logger.error("No settings found in database")
         return None
@@ -674,32 +908,45 @@ def generate_image_with_google_colab(prompt, negative_prompt=None):
         logger.error("Google Colab settings are missing")
         return None
     
+    # Canonical generation parameters; these are also the image cache key
+    params = {
+        "backend": "google_colab",
+        "endpoint": colab_url,
+        "prompt": prompt,
+        "negative_prompt": negative_prompt if negative_prompt else settings.sd_negative_prompt,
+        "seed": seed,
+    }
+    
+    return _cached_generation(params, lambda resolved_seed: _colab_generate(colab_url, api_key, params, resolved_seed))
+
+def _colab_generate(colab_url, api_key, params, seed):
+    """Call the Google Colab notebook's generation endpoint and return the image bytes"""
     # Prepare the request payload
     payload = {
         "api_key": api_key,
-        "prompt": prompt,
-        "negative_prompt": negative_prompt if negative_prompt else settings.sd_negative_prompt
+        "prompt": params["prompt"],
+        "negative_prompt": params["negative_prompt"],
+        "seed": seed
     }
     
     try:
         # The Google Colab notebook should expose an API endpoint to generate images
         # This endpoint would be secured with the API key
         headers = {"Content-Type": "application/json"}
-        response = requests.post(
-            colab_url,
-            json=payload,
-            headers=headers,
-            timeout=180  # Allow for longer timeout as Colab can take time
-        )
+        with gpu_slots:
+            response = http_client.post(
+                colab_url,
+                json=payload,
+                headers=headers,
+                read_timeout=180,  # Allow for longer timeout as Colab can take time
+                stream=True
+            )
         
         if response.status_code == 200:
             # The Colab response should include the image as base64
-            result = response.json()
-            if "image" in result:
-                import base64
-                # Decode base64 image
-                image_data = base64.b64decode(result["image"])
-                return image_data
+            images = _read_streamed_images(response, "image")
+            if images:
+                return images[0]
             else:
                 logger.error("No image in Google Colab response")
                 return None
@@ -712,7 +959,7 @@ def generate_image_with_google_colab(prompt, negative_prompt=None):
         return None
     
 # Function to choose the best image generation method based on quality vs speed needs
-def generate_image(prompt, negative_prompt=None, use_high_quality=False):
+def generate_image(prompt, negative_prompt=None, use_high_quality=False, seed=None):
     """
     Generate an image based on the provided prompt, choosing the appropriate method based on quality needs
     
@@ -720,15 +967,16 @@ def generate_image(prompt, negative_prompt=None, use_high_quality=False):
         prompt (str): Text prompt for image generation
         negative_prompt (str, optional): Negative prompt for better quality
         use_high_quality (bool): Whether to use high-quality (Google Colab) or faster (Stable Diffusion) generation
+        seed (int, optional): Sampling seed; cached when given, random and uncached when omitted
         
     Returns:
         bytes or None: The generated image data or None if generation fails
     """
     if use_high_quality:
         # Use Google Colab for higher quality images (but slower)
-        return generate_image_with_google_colab(prompt, negative_prompt)
+        return generate_image_with_google_colab(prompt, negative_prompt, seed=seed)
     else:
         # Use local Stable Diffusion for faster results
-        return generate_image_with_stable_diffusion(prompt, negative_prompt)
+        return generate_image_with_stable_diffusion(prompt, negative_prompt, seed=seed)
 
 # End of AI service implementation
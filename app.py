@@ -5,6 +5,8 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from sqlite_profile import engine_options_for
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -22,10 +24,8 @@ app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
 # Configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///sophia.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+# SQLite URIs get the WAL/busy-timeout profile, other databases the server pool settings
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options_for(app.config["SQLALCHEMY_DATABASE_URI"])
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 # Initialize extensions with the app
@@ -39,6 +39,10 @@ with app.app_context():
     try:
         db.create_all()
         logger.info("Database tables created successfully")
+        
+        # Add columns introduced since the database was first created
+        from migrations import upgrade_schema
+        upgrade_schema(db.engine, db.metadata)
             
     except Exception as e:
         logger.error(f"Error setting up database: {e}")
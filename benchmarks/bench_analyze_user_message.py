@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the keyword matching in ai_service.analyze_user_message
+
+Compares the previous per-keyword substring scans against the single-pass
+matcher in keyword_matcher, and checks both give the same results.
+
+Usage: python benchmarks/bench_analyze_user_message.py [iterations]
+"""
+import os
+import re
+import sys
+import random
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_matcher import (
+    POSITIVE_WORDS, NEGATIVE_WORDS, FLIRTY_WORDS, GREETING_PATTERNS, FAREWELL_PATTERNS,
+    PERSONAL_QUESTIONS, QUESTION_WORDS, AUXILIARY_QUESTION_RE, match_keywords
+)
+
+CORPUS = [
+    "hi",
+    "Hey Sophia!",
+    "good morning beautiful",
+    "How are you today?",
+    "I had a terrible day at work, my boss was so annoying and I'm tired",
+    "You look gorgeous in your latest post, I love it",
+    "what do you like to do on weekends",
+    "Can you send me a picture",
+    "I think I have a crush on you, would you go on a date with me?",
+    "gotta go, talk to you later",
+    "Thanks so much, that was really nice of you :)",
+    "Is it raining where you live",
+    "I miss you so much, I wish we could cuddle together tonight",
+    "ok",
+    "lol that's hilarious",
+    "Tell me about yourself, where do you live and how old are you?",
+    "I'm so frustrated and disappointed, nothing works and everything sucks",
+    "Good night Sophia, sweet dreams",
+    "What's your favorite food? Mine is pizza but I also enjoy sushi",
+    "My girlfriend broke up with me and I'm really sad and depressed about our relationship",
+]
+
+def legacy_scan(message):
+    """The keyword matching previously done inline in analyze_user_message"""
+    message_lower = message.lower()
+    message_words = message_lower.split()
+
+    positive_count = sum(1 for word in POSITIVE_WORDS if word in message_lower)
+    negative_count = sum(1 for word in NEGATIVE_WORDS if word in message_lower)
+    flirty_count = sum(1 for word in FLIRTY_WORDS if word in message_lower)
+
+    is_question = False
+    if message.strip().endswith('?'):
+        is_question = True
+    else:
+        for q_word in ['what', 'where', 'when', 'who', 'whom', 'whose', 'why', 'how']:
+            if q_word in message_words:
+                is_question = True
+                break
+        if not is_question:
+            for pattern in ['^is ', '^are ', '^do ', '^does ', '^did ', '^can ', '^could ', '^would ']:
+                if re.search(pattern, message_lower):
+                    is_question = True
+                    break
+
+    is_greeting = any(pattern in message_lower for pattern in GREETING_PATTERNS)
+    is_farewell = any(pattern in message_lower for pattern in FAREWELL_PATTERNS)
+    is_personal_question = any(pattern in message_lower for pattern in PERSONAL_QUESTIONS)
+
+    return (positive_count, negative_count, flirty_count, is_question, is_greeting, is_farewell, is_personal_question)
+
+def compiled_scan(message):
+    """The same results computed with the single-pass matcher"""
+    message_lower = message.lower()
+    message_words = message_lower.split()
+    hits = match_keywords(message_lower)
+
+    is_question = (
+        message.strip().endswith('?')
+        or not QUESTION_WORDS.isdisjoint(message_words)
+        or AUXILIARY_QUESTION_RE.match(message_lower) is not None
+    )
+
+    return (len(hits['positive']), len(hits['negative']), len(hits['flirty']), is_question,
+            bool(hits['greeting']), bool(hits['farewell']), bool(hits['personal_question']))
+
+def build_corpus(size=1000, seed=42):
+    """Mix the sample messages into longer and shorter variants"""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(size):
+        parts = rng.sample(CORPUS, rng.choice([1, 1, 1, 2, 3]))
+        messages.append(" ".join(parts))
+    return messages
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    corpus = build_corpus()
+
+    for message in corpus:
+        assert legacy_scan(message) == compiled_scan(message), message
+
+    def run(scan):
+        for message in corpus:
+            scan(message)
+
+    legacy = min(timeit.repeat(lambda: run(legacy_scan), number=iterations, repeat=5))
+    compiled = min(timeit.repeat(lambda: run(compiled_scan), number=iterations, repeat=5))
+
+    total = len(corpus) * iterations
+    print(f"messages scanned per run: {total}")
+    print(f"legacy substring scans: {total / legacy:,.0f} msg/s")
+    print(f"single-pass matcher:    {total / compiled:,.0f} msg/s")
+    print(f"speedup: {legacy / compiled:.2f}x")
+
+if __name__ == "__main__":
+    main()
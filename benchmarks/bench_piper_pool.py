@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark and crash check for the warm Piper process pool
+
+Runs benchmarks/fake_piper.py (which imitates a slow model load) and compares
+starting a new process per utterance, as generate_speech_with_piper used to,
+with reusing the pool's long-lived process. Then checks that a crashed or
+hung process is replaced and the next request succeeds.
+
+Usage: python benchmarks/bench_piper_pool.py [utterances] [load_seconds]
+"""
+import os
+import sys
+import time
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from piper_pool import PiperPool
+
+FAKE_PIPER = f"{sys.executable} {os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_piper.py')}"
+
+SENTENCES = [
+    "Hey you!",
+    "I was just thinking about you.",
+    "How was your day?",
+    "Tell me everything, I want to hear all about it.",
+]
+
+def make_pool(**kwargs):
+    return PiperPool(binary=FAKE_PIPER, voices_dir="/voices", health_check_interval=0.2, **kwargs)
+
+def bench_cold(utterances):
+    # A fresh process (and model load) for every utterance
+    start = time.perf_counter()
+    for i in range(utterances):
+        pool = make_pool()
+        assert pool.synthesize("amy", SENTENCES[i % len(SENTENCES)]) is not None
+        pool.shutdown()
+    return time.perf_counter() - start
+
+def bench_warm(utterances):
+    pool = make_pool()
+    pool.warm(["amy"])
+    assert pool.synthesize("amy", "warm up") is not None  # Wait for the model load
+
+    start = time.perf_counter()
+    for i in range(utterances):
+        assert pool.synthesize("amy", SENTENCES[i % len(SENTENCES)]) is not None
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    return elapsed
+
+def check_recovery():
+    failures = 0
+    pool = make_pool(request_timeout=2, restart_backoff=0)
+
+    pcm, rate = pool.synthesize("amy", "Line one.\nLine two.")
+    if rate != 22050 or len(pcm) % 2:
+        print(f"FAIL: unexpected output ({len(pcm)} bytes at {rate} Hz)")
+        failures += 1
+    first_pid = pool.worker("amy").process.pid
+
+    # Crash: the request fails, the monitor restarts the process
+    if pool.synthesize("amy", "__crash__") is not None:
+        print("FAIL: crash request returned audio")
+        failures += 1
+    time.sleep(0.5)
+    worker = pool.worker("amy")
+    if not worker.alive() or worker.process.pid == first_pid:
+        print("FAIL: crashed process was not restarted by the health check")
+        failures += 1
+    if pool.synthesize("amy", "Back again.") is None:
+        print("FAIL: request after crash failed")
+        failures += 1
+
+    # Hang: the request times out and the process is replaced on the next request
+    if pool.synthesize("amy", "__hang__") is not None:
+        print("FAIL: hung request returned audio")
+        failures += 1
+    if pool.synthesize("amy", "Still here.") is None:
+        print("FAIL: request after hang failed")
+        failures += 1
+
+    pool.shutdown()
+    return failures
+
+def main():
+    utterances = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    os.environ["FAKE_PIPER_LOAD_SECONDS"] = sys.argv[2] if len(sys.argv) > 2 else "0.5"
+    logging.basicConfig(level=logging.CRITICAL)
+
+    cold = bench_cold(utterances)
+    warm = bench_warm(utterances)
+    print(f"{utterances} utterances, {os.environ['FAKE_PIPER_LOAD_SECONDS']}s model load")
+    print(f"  process per utterance: {cold:.2f}s ({cold / utterances * 1000:.0f} ms each)")
+    print(f"  warm pool:             {warm:.2f}s ({warm / utterances * 1000:.0f} ms each)")
+
+    os.environ["FAKE_PIPER_LOAD_SECONDS"] = "0.1"
+    failures = check_recovery()
+    print("recovery checks:", "OK" if not failures else f"{failures} failed")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
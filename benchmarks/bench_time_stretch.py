@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the Piper speed adjustment in generate_speech_with_piper
+
+Compares the previous scipy.signal.resample path (one FFT over the whole clip,
+which also shifts the pitch) with the WSOLA time-stretch in time_stretch, both
+in one call and fed in streaming blocks, on synthetic voiced speech.
+
+Usage: python benchmarks/bench_time_stretch.py [speed]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+from scipy import signal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from time_stretch import TimeStretcher, time_stretch
+
+SAMPLE_RATE = 22050
+BLOCK = 4096  # Streaming block size in samples
+
+def synthetic_speech(seconds, f0=210.0):
+    """Harmonic 'voice' at f0 with vibrato and syllable-rate amplitude modulation"""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    phase = 2 * np.pi * np.cumsum(f0 * (1 + 0.01 * np.sin(2 * np.pi * 5 * t))) / SAMPLE_RATE
+    voice = sum(np.sin(h * phase) / h for h in range(1, 8))
+    envelope = 0.55 + 0.45 * np.sin(2 * np.pi * 4 * t)
+    return (voice * envelope * 6000).astype(np.int16)
+
+def pitch(samples):
+    """Frequency of the strongest spectral peak (the fundamental for this signal)"""
+    spectrum = np.abs(np.fft.rfft(samples.astype(np.float64) * np.hanning(len(samples))))
+    return np.argmax(spectrum[1:]) * SAMPLE_RATE / len(samples) + SAMPLE_RATE / len(samples)
+
+def resample_path(samples, speed):
+    # What generate_speech_with_piper did before
+    return signal.resample(samples, int(len(samples) / speed)).astype(np.int16)
+
+def streaming_path(samples, speed):
+    stretcher = TimeStretcher(speed, SAMPLE_RATE)
+    pieces = [stretcher.process(samples[i:i + BLOCK]) for i in range(0, len(samples), BLOCK)]
+    pieces.append(stretcher.flush())
+    return np.concatenate(pieces)
+
+def best_of(fn, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    speed = float(sys.argv[1]) if len(sys.argv) > 1 else 0.9
+    failures = 0
+
+    for seconds, repeats in ((5, 10), (60, 3)):
+        # Odd length, as real clips usually are (FFT sizes with large prime factors are slow)
+        samples = synthetic_speech(seconds)[:-7]
+        source_pitch = pitch(samples)
+
+        print(f"{seconds}s clip ({len(samples)} samples), speed {speed}, source pitch {source_pitch:.1f} Hz")
+        results = {}
+        for name, fn in (("scipy resample", lambda: resample_path(samples, speed)),
+                         ("wsola one-shot", lambda: time_stretch(samples, speed, SAMPLE_RATE)),
+                         ("wsola streaming", lambda: streaming_path(samples, speed))):
+            elapsed, output = best_of(fn, repeats)
+            results[name] = output
+            print(f"  {name:16s} {elapsed * 1000:8.1f} ms  {len(output) / SAMPLE_RATE:6.2f}s out  pitch {pitch(output):6.1f} Hz")
+
+        expected = int(round(len(samples) / speed))
+        for name in ("wsola one-shot", "wsola streaming"):
+            if abs(len(results[name]) - expected) > 1:
+                print(f"FAIL: {name} produced {len(results[name])} samples, expected {expected}")
+                failures += 1
+            if abs(pitch(results[name]) - source_pitch) > source_pitch * 0.01:
+                print(f"FAIL: {name} changed the pitch")
+                failures += 1
+        if not np.array_equal(results["wsola one-shot"], results["wsola streaming"]):
+            print("FAIL: streaming output differs from one-shot output")
+            failures += 1
+
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
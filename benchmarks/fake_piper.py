@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the piper binary, for exercising piper_pool without a voice model
+
+Accepts the flags piper_pool uses (--model, --output_dir, --json-input),
+sleeps FAKE_PIPER_LOAD_SECONDS to imitate loading the ONNX model, then for
+each JSON line on stdin writes a 22050 Hz WAV (a tone as long as the text
+would take to say) and prints its path, like Piper does.
+
+Special texts: "__crash__" exits with an error, "__hang__" never answers.
+
+Usage: PIPER_BINARY="python benchmarks/fake_piper.py" ...
+"""
+import os
+import sys
+import json
+import math
+import time
+import wave
+import array
+import argparse
+
+SAMPLE_RATE = 22050
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--output_dir", required=True)
+    parser.add_argument("--json-input", action="store_true")
+    args = parser.parse_args()
+
+    time.sleep(float(os.environ.get("FAKE_PIPER_LOAD_SECONDS", 1.0)))
+    print(f"[fake piper] loaded {args.model}", file=sys.stderr, flush=True)
+
+    count = 0
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        text = json.loads(line)["text"] if args.json_input else line
+
+        if text == "__crash__":
+            print("[fake piper] crashing on request", file=sys.stderr, flush=True)
+            sys.exit(1)
+        if text == "__hang__":
+            time.sleep(3600)
+
+        # About 15 characters per second of speech
+        samples = int(SAMPLE_RATE * max(0.2, len(text) / 15))
+        tone = array.array("h", (int(8000 * math.sin(2 * math.pi * 220 * i / SAMPLE_RATE)) for i in range(samples)))
+
+        count += 1
+        path = os.path.join(args.output_dir, f"{time.time_ns()}_{count}.wav")
+        with wave.open(path, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(SAMPLE_RATE)
+            wav_file.writeframes(tone.tobytes())
+        print(path, flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for the SQLite production profile
+
+Runs many threads saving chat turns (through chat_store.save_turn) while
+other threads read conversation history, against a scratch SQLite file.
+Any "database is locked" error is a failure.
+
+Usage: python benchmarks/stress_sqlite_writers.py [writers] [turns_per_writer] [readers]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+# Point the app at a scratch database before it is imported
+_tmpdir = tempfile.mkdtemp(prefix="sophia-stress-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_tmpdir, "stress.db")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import logging
+logging.disable(logging.INFO)
+
+from sqlalchemy import text
+
+from app import app, db
+from models import Conversation, Message
+from chat_store import save_turn
+
+def writer(conversation_id, turns, mode, errors):
+    with app.app_context():
+        for i in range(turns):
+            try:
+                conversation = db.session.get(Conversation, conversation_id)
+                save_turn(conversation, f"message {i}", f"reply {i}", mode=mode)
+            except Exception as e:
+                db.session.rollback()
+                errors.append(str(e))
+
+def reader(conversation_ids, stop, counts, errors):
+    with app.app_context():
+        reads = 0
+        while not stop.is_set():
+            for conversation_id in conversation_ids:
+                try:
+                    Message.query.filter_by(conversation_id=conversation_id) \
+                        .order_by(Message.timestamp.desc()).limit(5).all()
+                    db.session.rollback()
+                    reads += 1
+                except Exception as e:
+                    db.session.rollback()
+                    errors.append(str(e))
+        counts.append(reads)
+
+def main():
+    writers = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    readers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    with app.app_context():
+        journal_mode = db.session.execute(text("PRAGMA journal_mode")).scalar()
+        busy_timeout = db.session.execute(text("PRAGMA busy_timeout")).scalar()
+        print(f"journal_mode={journal_mode} busy_timeout={busy_timeout}ms pool={db.engine.pool.status()}")
+
+        conversations = [Conversation(source='website', external_id=f"stress-{n}") for n in range(writers)]
+        db.session.add_all(conversations)
+        db.session.commit()
+        conversation_ids = [c.id for c in conversations]
+
+    failed = False
+    for mode in ('sync', 'group'):
+        errors = []
+        read_counts = []
+        stop = threading.Event()
+
+        reader_threads = [threading.Thread(target=reader, args=(conversation_ids, stop, read_counts, errors))
+                          for _ in range(readers)]
+        writer_threads = [threading.Thread(target=writer, args=(conversation_id, turns, mode, errors))
+                          for conversation_id in conversation_ids]
+
+        start = time.monotonic()
+        for thread in reader_threads + writer_threads:
+            thread.start()
+        for thread in writer_threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+        stop.set()
+        for thread in reader_threads:
+            thread.join()
+
+        locked = [e for e in errors if "locked" in e]
+        print(f"[{mode}] {writers * turns} turns in {elapsed:.2f}s ({writers * turns / elapsed:,.0f} turns/s), "
+              f"{sum(read_counts)} history reads, {len(errors)} errors ({len(locked)} 'database is locked')")
+        for e in errors[:5]:
+            print(f"  {e}")
+        failed = failed or bool(errors)
+
+    with app.app_context():
+        expected = writers * turns * 2 * 2
+        stored = db.session.query(Message).count()
+        counted = db.session.query(db.func.sum(Conversation.message_count)).scalar()
+        print(f"messages stored: {stored}/{expected}, message_count total: {counted}")
+        failed = failed or stored != expected or counted != expected
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        # Close pooled connections so the scratch database can be removed
+        with app.app_context():
+            db.engine.dispose()
+        shutil.rmtree(_tmpdir, ignore_errors=True)
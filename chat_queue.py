@@ -0,0 +1,91 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class BoundedChatExecutor:
+    """
+    Thread pool for chat generation with admission control
+
+    Work is rejected instead of queued without limit: submit() returns None when
+    the total number of queued and running jobs reaches max_pending, or when a
+    single user already has max_per_user jobs in flight.
+    """
+
+    def __init__(self, max_workers=None, max_pending=None, max_per_user=None):
+        self.max_workers = max_workers or Config.CHAT_WORKERS
+        self.max_pending = max_pending or Config.CHAT_MAX_PENDING
+        self.max_per_user = max_per_user or Config.CHAT_MAX_IN_FLIGHT_PER_USER
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="chat-worker")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._in_flight = {}
+
+    @property
+    def pending(self):
+        """Number of jobs queued or running"""
+        return self._pending
+
+    def in_flight(self, user_key):
+        """Number of jobs queued or running for one user"""
+        return self._in_flight.get(user_key, 0)
+
+    def submit(self, user_key, fn, *args, **kwargs):
+        """
+        Submit a chat job for a user
+
+        Args:
+            user_key (str): Identifies the user for the per-user in-flight limit
+            fn (callable): The job to run on a worker thread
+
+        Returns:
+            Future or None: The job's future, or None if the pool is too busy to accept it
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                logger.warning(f"Chat queue full ({self._pending} pending), rejecting job for {user_key}")
+                return None
+
+            if self._in_flight.get(user_key, 0) >= self.max_per_user:
+                logger.info(f"User {user_key} already has {self.max_per_user} chat job(s) in flight")
+                return None
+
+            self._pending += 1
+            self._in_flight[user_key] = self._in_flight.get(user_key, 0) + 1
+
+        try:
+            return self._executor.submit(self._run, user_key, fn, args, kwargs)
+        except Exception:
+            self._release(user_key)
+            raise
+
+    def _run(self, user_key, fn, args, kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            logger.error(f"Error in chat job for {user_key}: {str(e)}")
+            raise
+        finally:
+            self._release(user_key)
+
+    def _release(self, user_key):
+        with self._lock:
+            self._pending -= 1
+            remaining = self._in_flight.get(user_key, 0) - 1
+            if remaining > 0:
+                self._in_flight[user_key] = remaining
+            else:
+                self._in_flight.pop(user_key, None)
+
+    def shutdown(self, wait=True):
+        """Stop accepting work and optionally wait for running jobs"""
+        self._executor.shutdown(wait=wait)
+
+
+# Create global chat executor
+chat_executor = BoundedChatExecutor()
@@ -0,0 +1,231 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+from config import Config
+from app import app, db
+from models import Conversation, Message
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Persistence modes for chat turns
+#   sync  - the turn is committed in its own transaction before the caller continues
+#   group - the turn is group-committed with other turns; the caller waits for that commit
+#   async - the turn is group-committed in the background; the caller doesn't wait
+#           (a crash can lose up to CHAT_WRITE_BEHIND_INTERVAL_MS of turns)
+PERSISTENCE_MODES = ('sync', 'group', 'async')
+
+class PendingTurn:
+    """A chat turn queued for a group commit"""
+
+    def __init__(self, conversation_id, messages, last_interaction, language=None):
+        self.conversation_id = conversation_id
+        self.messages = messages  # list of (content, is_from_user, timestamp)
+        self.last_interaction = last_interaction
+        self.language = language
+        self.future = Future()
+
+
+class MessageWriter:
+    """
+    Write-behind queue that group-commits chat turns from many conversations
+
+    A background thread collects queued turns for up to interval_ms (or until
+    max_batch turns are waiting) and writes them all in one transaction.
+    """
+
+    def __init__(self, interval_ms=None, max_batch=None):
+        self.interval = (interval_ms if interval_ms is not None else Config.CHAT_WRITE_BEHIND_INTERVAL_MS) / 1000.0
+        self.max_batch = max_batch or Config.CHAT_WRITE_BEHIND_MAX_BATCH
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stopping = False
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+
+        with self._lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name="chat-message-writer")
+                thread.daemon = True
+                thread.start()
+                self._thread = thread
+                atexit.register(self.stop)
+                logger.info("Chat message writer started in background thread")
+
+    def submit(self, turn):
+        """Queue a turn for the next group commit and return its future"""
+        if self._stopping:
+            raise RuntimeError("Chat message writer is stopped")
+
+        self._ensure_started()
+        self._queue.put(turn)
+        return turn.future
+
+    def _collect_batch(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.interval
+
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                turn = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if turn is None:
+                # Stop requested; commit what we have and let _run see the sentinel again
+                self._queue.put(None)
+                break
+            batch.append(turn)
+
+        return batch
+
+    def _run(self):
+        while True:
+            turn = self._queue.get()
+            if turn is None:
+                break
+
+            batch = self._collect_batch(turn)
+            with app.app_context():
+                self._commit_batch(batch)
+
+        logger.info("Chat message writer stopped")
+
+    def _write_turn(self, turn):
+        for content, is_from_user, timestamp in turn.messages:
+            db.session.add(Message(
+                conversation_id=turn.conversation_id,
+                content=content,
+                is_from_user=is_from_user,
+                timestamp=timestamp
+            ))
+
+        values = {'last_interaction': turn.last_interaction}
+        if turn.language:
+            values['detected_language'] = turn.language
+
+        db.session.execute(
+            Conversation.__table__.update()
+            .where(Conversation.__table__.c.id == turn.conversation_id)
+            .values(**values)
+        )
+
+    def _commit_batch(self, batch):
+        try:
+            for turn in batch:
+                self._write_turn(turn)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Group commit of {len(batch)} chat turns failed, retrying individually: {str(e)}")
+            self._commit_individually(batch)
+            return
+
+        for turn in batch:
+            turn.future.set_result(None)
+
+    def _commit_individually(self, batch):
+        # Isolate the failing turn(s) so one bad row doesn't lose the whole batch
+        for turn in batch:
+            try:
+                self._write_turn(turn)
+                db.session.commit()
+                turn.future.set_result(None)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Failed to save chat turn for conversation {turn.conversation_id}: {str(e)}")
+                turn.future.set_exception(e)
+
+    def stop(self, timeout=5):
+        """Flush queued turns and stop the writer thread"""
+        self._stopping = True
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+
+# Create global message writer
+message_writer = MessageWriter()
+
+def save_turn(conversation, user_message, ai_response, language=None, received_at=None, mode=None):
+    """
+    Persist one chat turn (user message, AI reply, conversation updates) in one transaction
+
+    Args:
+        conversation (Conversation): The conversation the turn belongs to
+        user_message (str): The user's message
+        ai_response (str): Sophia's reply
+        language (str, optional): Detected language to store on the conversation
+        received_at (datetime, optional): When the user message arrived (defaults to now)
+        mode (str, optional): One of PERSISTENCE_MODES; defaults to Config.CHAT_PERSISTENCE_MODE
+
+    Returns:
+        dict: 'message_id' (None unless mode is 'sync') and 'timestamp' of the AI reply
+    """
+    mode = mode or Config.CHAT_PERSISTENCE_MODE
+    if mode not in PERSISTENCE_MODES:
+        logger.warning(f"Unknown chat persistence mode {mode}, using sync")
+        mode = 'sync'
+
+    user_timestamp = received_at or datetime.utcnow()
+    ai_timestamp = datetime.utcnow()
+    # Keep the reply strictly after the user message so history ordering is stable
+    if ai_timestamp <= user_timestamp:
+        ai_timestamp = user_timestamp + timedelta(microseconds=1)
+
+    if mode == 'sync':
+        user_msg = Message(
+            conversation_id=conversation.id,
+            content=user_message,
+            is_from_user=True,
+            timestamp=user_timestamp
+        )
+        ai_msg = Message(
+            conversation_id=conversation.id,
+            content=ai_response,
+            is_from_user=False,
+            timestamp=ai_timestamp
+        )
+        db.session.add(user_msg)
+        db.session.add(ai_msg)
+
+        conversation.last_interaction = ai_timestamp
+        if language:
+            conversation.detected_language = language
+
+        # Flush first so the id is known without reloading the row after commit
+        db.session.flush()
+        message_id = ai_msg.id
+        db.session.commit()
+        return {'message_id': message_id, 'timestamp': ai_timestamp}
+
+    # Leave conversation changes to the writer, and end this session's transaction so
+    # its pooled connection isn't held while waiting for the group commit. The id is read
+    # first: touching the expired conversation afterwards would check a connection out again.
+    conversation_id = conversation.id
+    if conversation in db.session:
+        db.session.expire(conversation)
+    db.session.commit()
+
+    turn = PendingTurn(
+        conversation_id,
+        [(user_message, True, user_timestamp), (ai_response, False, ai_timestamp)],
+        ai_timestamp,
+        language
+    )
+    future = message_writer.submit(turn)
+
+    if mode == 'group':
+        future.result()
+
+    return {'message_id': None, 'timestamp': ai_timestamp}
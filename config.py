@@ -8,6 +8,14 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///sophia.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # SQLite production profile (applied automatically when the database URI is SQLite)
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))  # Wait for locks instead of "database is locked"
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')  # NORMAL is durable enough with WAL; FULL for strictest
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 65536))  # Page cache per connection
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 268435456))  # Bytes of the file to memory-map
+    SQLITE_POOL_SIZE = int(os.environ.get('SQLITE_POOL_SIZE', 10))
+    SQLITE_MAX_OVERFLOW = int(os.environ.get('SQLITE_MAX_OVERFLOW', 10))
+    
     # API credentials
     STABILITY_API_KEY = os.environ.get('STABILITY_API_KEY', '')
     HUGGINGFACE_API_KEY = os.environ.get('HUGGINGFACE_API_KEY', '')
@@ -15,14 +23,83 @@ class Config:
     KOBOLD_HORDE_API_KEY = os.environ.get('KOBOLD_HORDE_API_KEY', '')
     PIPER_TTS_API_KEY = os.environ.get('PIPER_TTS_API_KEY', '')
     
+    # Synthesized speech cache in static/audio/
+    TTS_CACHE_MAX_MB = int(os.environ.get('TTS_CACHE_MAX_MB', 256))  # Least recently used files are evicted past this
+    TTS_CACHE_MAX_AGE_DAYS = int(os.environ.get('TTS_CACHE_MAX_AGE_DAYS', 30))  # Files unused for longer are removed
+    TTS_WORKERS = int(os.environ.get('TTS_WORKERS', 4))  # Sentences of a voice reply synthesized at once
+    
+    # Local Piper processes (one long-lived process per voice keeps its model loaded)
+    PIPER_BINARY = os.environ.get('PIPER_BINARY', 'piper')
+    PIPER_VOICES_DIR = os.environ.get('PIPER_VOICES_DIR', '/path/to/piper/voices')  # Holds <voice_id>.onnx and .onnx.json
+    PIPER_REQUEST_TIMEOUT = float(os.environ.get('PIPER_REQUEST_TIMEOUT', 60))  # Seconds per utterance, including a cold model load
+    PIPER_HEALTH_CHECK_INTERVAL = float(os.environ.get('PIPER_HEALTH_CHECK_INTERVAL', 30))  # Seconds between checks for crashed processes
+    PIPER_RESTART_BACKOFF = float(os.environ.get('PIPER_RESTART_BACKOFF', 5))  # Min seconds between restarts of one voice
+    
     # Local Stable Diffusion setup (for your local machine)
     # URL to AUTOMATIC1111 webui API - uncomment and set when running on your own machine
     # SD_URL = "http://localhost:7860"  # Default AUTOMATIC1111 port
     # SD_MODEL = "realisticVisionV51_v51VAE.safetensors"  # Or other recommended model
     
+    # Stable Diffusion checkpoint handling
+    SD_OPTIONS_TIMEOUT = float(os.environ.get('SD_OPTIONS_TIMEOUT', 10))  # Seconds to read /options
+    SD_CHECKPOINT_SWITCH_TIMEOUT = float(os.environ.get('SD_CHECKPOINT_SWITCH_TIMEOUT', 120))  # Seconds to load a new checkpoint
+    SD_MAX_SAME_MODEL_STREAK = int(os.environ.get('SD_MAX_SAME_MODEL_STREAK', 8))  # Jobs for the loaded model run before others get a turn
+    SD_MAX_BATCH_SIZE = int(os.environ.get('SD_MAX_BATCH_SIZE', 4))  # Images per txt2img iteration (bounded by GPU memory)
+    GPU_MAX_CONCURRENCY = int(os.environ.get('GPU_MAX_CONCURRENCY', 1))  # Image generations running at once across the deployment
+    GPU_SLOT_LEASE_SECONDS = int(os.environ.get('GPU_SLOT_LEASE_SECONDS', 900))  # A slot held by a dead process frees itself after this long
+    GPU_SLOT_POLL_INTERVAL = float(os.environ.get('GPU_SLOT_POLL_INTERVAL', 1))  # Seconds between attempts to take a busy slot
+    
+    # Outbound HTTP client settings (shared keep-alive connection pool)
+    HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 10))  # Number of hosts to keep pools for
+    HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 20))  # Keep-alive connections per host
+    HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 5))  # Seconds to establish a connection
+    HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 30))  # Default seconds to wait for a response
+    HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 1))  # Retries for failed connection attempts
+    
+    # Seconds between checks of the settings version stamp by the in-process settings cache
+    SETTINGS_CACHE_CHECK_INTERVAL = float(os.environ.get('SETTINGS_CACHE_CHECK_INTERVAL', 5))
+    
+    # Chat generation worker pool
+    CHAT_WORKERS = int(os.environ.get('CHAT_WORKERS', 8))  # Concurrent LLM generations per process
+    CHAT_MAX_PENDING = int(os.environ.get('CHAT_MAX_PENDING', 64))  # Queued + running jobs before replying "busy"
+    CHAT_MAX_IN_FLIGHT_PER_USER = int(os.environ.get('CHAT_MAX_IN_FLIGHT_PER_USER', 1))  # Jobs one user may have at once
+    
+    # Chat message persistence: 'sync' (commit each turn), 'group' (wait for a shared group commit)
+    # or 'async' (write-behind; replies are sent before the turn is durable)
+    CHAT_PERSISTENCE_MODE = os.environ.get('CHAT_PERSISTENCE_MODE', 'sync')
+    CHAT_WRITE_BEHIND_INTERVAL_MS = int(os.environ.get('CHAT_WRITE_BEHIND_INTERVAL_MS', 10))  # Max wait to fill a group commit
+    CHAT_WRITE_BEHIND_MAX_BATCH = int(os.environ.get('CHAT_WRITE_BEHIND_MAX_BATCH', 200))  # Max turns per group commit
+    
+    # Background image generation jobs
+    IMAGE_JOB_WORKERS = int(os.environ.get('IMAGE_JOB_WORKERS', 2))  # Concurrent generations per process
+    IMAGE_JOB_MAX_ATTEMPTS = int(os.environ.get('IMAGE_JOB_MAX_ATTEMPTS', 3))  # Tries before a job is marked failed
+    IMAGE_JOB_HEARTBEAT_INTERVAL = int(os.environ.get('IMAGE_JOB_HEARTBEAT_INTERVAL', 30))  # Seconds between heartbeats and stale-job sweeps
+    IMAGE_JOB_STALE_SECONDS = int(os.environ.get('IMAGE_JOB_STALE_SECONDS', 120))  # Running jobs without a heartbeat for this long are requeued
+    
+    # Content scheduler (sleeps until the next scheduled post instead of polling)
+    SCHEDULER_RESYNC_INTERVAL = int(os.environ.get('SCHEDULER_RESYNC_INTERVAL', 600))  # Seconds between reloads of due times from the DB
+    SCHEDULER_CHANGE_POLL_INTERVAL = int(os.environ.get('SCHEDULER_CHANGE_POLL_INTERVAL', 60))  # Seconds between checks for posts scheduled by other processes
+    
+    # Ahead-of-time content pipeline (plans posts days ahead and renders their images before their slot)
+    CONTENT_LOOKAHEAD_DAYS = int(os.environ.get('CONTENT_LOOKAHEAD_DAYS', 3))  # Days of posts to keep planned, including today
+    CONTENT_PIPELINE_INTERVAL = int(os.environ.get('CONTENT_PIPELINE_INTERVAL', 900))  # Seconds between pipeline runs
+    CONTENT_OFFPEAK_HOURS = os.environ.get('CONTENT_OFFPEAK_HOURS', '1-6')  # Hours (start-end, end exclusive) to render posts in
+    CONTENT_RENDER_BATCH = int(os.environ.get('CONTENT_RENDER_BATCH', 4))  # Posts rendered per run, to spread GPU use out
+    CONTENT_RENDER_LEAD_HOURS = int(os.environ.get('CONTENT_RENDER_LEAD_HOURS', 3))  # Posts due this soon are rendered even at peak times
+    
+    # Concurrent uploads per platform when publishing scheduled posts
+    INSTAGRAM_PUBLISH_CONCURRENCY = int(os.environ.get('INSTAGRAM_PUBLISH_CONCURRENCY', 2))
+    TELEGRAM_PUBLISH_CONCURRENCY = int(os.environ.get('TELEGRAM_PUBLISH_CONCURRENCY', 4))
+    
+    # Leader election: one process per deployment runs the scheduler and bots
+    LEADER_LEASE_SECONDS = int(os.environ.get('LEADER_LEASE_SECONDS', 15))  # A dead leader is replaced within about this long
+    LEADER_RENEW_INTERVAL = float(os.environ.get('LEADER_RENEW_INTERVAL', 5))  # Seconds between lease renewals / takeover attempts
+    
     # Instagram credentials
     INSTAGRAM_USERNAME = os.environ.get('INSTAGRAM_USERNAME', '')
     INSTAGRAM_PASSWORD = os.environ.get('INSTAGRAM_PASSWORD', '')
+    INSTAGRAM_COMMENT_BACKFILL_HOURS = int(os.environ.get('INSTAGRAM_COMMENT_BACKFILL_HOURS', 24))  # Reply window for comments on media seen for the first time
+    INSTAGRAM_COMMENT_RECHECK_SECONDS = int(os.environ.get('INSTAGRAM_COMMENT_RECHECK_SECONDS', 1800))  # Re-read the newest comments this often even if the count is unchanged
     
     # Telegram credentials
     TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '')
@@ -40,6 +117,11 @@ class Config:
     MIN_CONTENT_LENGTH = 50
     IMAGE_SIZE = "1024x1024"
     
+    # Content-addressed cache of generated images (keyed by prompt, model, size, steps, cfg and seed)
+    IMAGE_CACHE_ENABLED = os.environ.get('IMAGE_CACHE_ENABLED', 'true').lower() == 'true'
+    IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', os.path.join('instance', 'image_cache'))
+    IMAGE_CACHE_MAX_MB = int(os.environ.get('IMAGE_CACHE_MAX_MB', 1024))  # Least recently used images are evicted past this
+    
     # URL for the app (used in social media links)
     APP_URL = os.environ.get('APP_URL', 'http://localhost:5000')
     
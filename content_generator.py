@@ -1,13 +1,12 @@
-import os
 import logging
 import requests
 import json
 import random
-from datetime import datetime
-import base64
 
 from config import Config
 from app import app
+from media_store import save_media
+from image_derivatives import create_derivatives
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -222,24 +221,37 @@ def get_stock_photo():
     else:
         return random.choice(lifestyle_photos)
 
+def save_image_bytes(image_data):
+    """
+    Save raw image bytes to disk and return the URL
+    In a real implementation, this would save to cloud storage
+    """
+    try:
+        url = save_media(data=image_data, prefix="image", extension="jpg")
+        
+        # Render thumbnail, WebP and Instagram sizes once, next to the original
+        create_derivatives(url)
+        return url
+    
+    except Exception as e:
+        logger.error(f"Error saving image: {str(e)}")
+        return "/static/assets/sophia_avatar.svg"  # Fallback to avatar
+
 def save_image_from_b64(b64_string):
     """
     Save a base64 image to disk and return the URL
     In a real implementation, this would save to cloud storage
+    
+    Args:
+        b64_string (str or iterable): The base64 data, whole or as a stream of pieces
     """
     try:
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        image_path = f"static/generated/image_{timestamp}.jpg"
-        
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(image_path), exist_ok=True)
-        
-        # Decode and save image
-        with open(image_path, "wb") as f:
-            f.write(base64.b64decode(b64_string))
+        # Decoded in chunks straight to a temp file, then renamed into static/generated/
+        url = save_media(b64=b64_string, prefix="image", extension="jpg")
         
-        # Return the URL path
-        return f"/{image_path}"
+        # Render thumbnail, WebP and Instagram sizes once, next to the original
+        create_derivatives(url)
+        return url
     
     except Exception as e:
         logger.error(f"Error saving image: {str(e)}")
@@ -0,0 +1,290 @@
+import logging
+import random
+import threading
+from datetime import datetime, timedelta
+
+from app import app, db
+from config import Config
+from models import ContentPost
+from settings_cache import get_settings
+from content_generator import generate_content, get_stock_photo, save_image_bytes
+from ai_service import generate_images_batch
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def parse_hours(value):
+    """Parse an hour range such as "1-6" (end exclusive, may wrap past midnight) into a set of hours"""
+    start, _, end = value.partition('-')
+    start = int(start)
+    end = int(end) if end else start + 1
+    if end <= start:
+        end += 24
+    return {hour % 24 for hour in range(start, end)}
+
+def posting_plan(settings):
+    """
+    Read the auto-scheduling settings, falling back to one image a day from 9 AM to 9 PM
+
+    Returns:
+        dict or None: images_per_day, reels_per_day, post_time_start, post_time_end and
+        post_days, or None if auto scheduling is off
+    """
+    if not settings:
+        logger.warning("Settings not found, using defaults")
+        return {
+            'images_per_day': 1,
+            'reels_per_day': 0,
+            'post_time_start': 9,
+            'post_time_end': 21,
+            'post_days': [0, 1, 2, 3, 4, 5, 6],
+        }
+
+    post_frequency = getattr(settings, 'post_frequency', 1)
+    auto_schedule = getattr(settings, 'auto_schedule', True)
+    if not auto_schedule or post_frequency <= 0:
+        logger.info("Auto scheduling is disabled or post frequency is 0")
+        return None
+
+    # Handle post days as either string or list
+    post_days_value = getattr(settings, 'post_days', '0,1,2,3,4,5,6')
+    if isinstance(post_days_value, list):
+        post_days = post_days_value
+    else:
+        post_days = [int(day) for day in post_days_value.split(',') if day.strip()]
+
+    return {
+        'images_per_day': getattr(settings, 'images_per_day', 1),
+        'reels_per_day': getattr(settings, 'reels_per_day', 0),
+        'post_time_start': getattr(settings, 'post_time_start', 9),
+        'post_time_end': getattr(settings, 'post_time_end', 21),
+        'post_days': post_days,
+    }
+
+class ContentPipeline:
+    """
+    Plans posts days ahead and renders their images well before their slots
+
+    Each run tops up the next CONTENT_LOOKAHEAD_DAYS days with captions and
+    image prompts. Image posts are created as 'rendering'. They become
+    'scheduled', and so visible to the publisher, once their image exists.
+    Rendering happens in off-peak hours, CONTENT_RENDER_BATCH posts per run,
+    so GPU use is spread over the night. Posts due within
+    CONTENT_RENDER_LEAD_HOURS are rendered at any hour, so a slot never waits
+    on generation. GPU use across the deployment is capped by sd_client.gpu_slots.
+    """
+
+    def __init__(self):
+        self.lookahead_days = Config.CONTENT_LOOKAHEAD_DAYS
+        self.interval = Config.CONTENT_PIPELINE_INTERVAL
+        self.offpeak_hours = parse_hours(Config.CONTENT_OFFPEAK_HOURS)
+        self.render_batch = Config.CONTENT_RENDER_BATCH
+        self.render_lead = timedelta(hours=Config.CONTENT_RENDER_LEAD_HOURS)
+        self.stop_event = threading.Event()
+        self._thread = None
+
+    def _slots_for_day(self, day, count, start_hour, end_hour, now):
+        """Random posting times on a day, in hours that haven't started yet"""
+        hours = [h for h in range(start_hour, end_hour) if datetime(day.year, day.month, day.day, h) > now]
+        if not hours or count <= 0:
+            return []
+
+        if len(hours) >= count:
+            # Enough hours to space them out
+            chosen = random.sample(hours, count)
+        else:
+            # Post more than once in some hours
+            chosen = hours + random.choices(hours, k=count - len(hours))
+
+        return sorted(datetime(day.year, day.month, day.day, h, random.randint(0, 59)) for h in chosen)
+
+    def plan(self):
+        """
+        Create the posts missing from the lookahead window
+
+        Returns:
+            int: Number of posts created
+        """
+        with app.app_context():
+            plan = posting_plan(get_settings())
+            if not plan or plan['images_per_day'] + plan['reels_per_day'] <= 0:
+                return 0
+
+            now = datetime.now()
+            today = datetime(now.year, now.month, now.day)
+            window_end = today + timedelta(days=self.lookahead_days)
+
+            # Count what each day already has, including posts that went out earlier today
+            existing = {}
+            rows = db.session.query(ContentPost.scheduled_for, ContentPost.content_type).filter(
+                ContentPost.scheduled_for >= today,
+                ContentPost.scheduled_for < window_end,
+                ContentPost.status.in_(['rendering', 'scheduled', 'published'])
+            ).all()
+            for scheduled_for, content_type in rows:
+                key = (scheduled_for.date(), content_type)
+                existing[key] = existing.get(key, 0) + 1
+
+            created = []
+            for offset in range(self.lookahead_days):
+                day = today + timedelta(days=offset)
+                if day.weekday() not in plan['post_days']:
+                    continue
+
+                images_needed = max(0, plan['images_per_day'] - existing.get((day.date(), 'image'), 0))
+                reels_needed = max(0, plan['reels_per_day'] - existing.get((day.date(), 'reel'), 0))
+                slots = self._slots_for_day(day, images_needed + reels_needed,
+                                            plan['post_time_start'], plan['post_time_end'], now)
+                if not slots:
+                    continue
+
+                # A day's image posts share one look and get consecutive seeds, so their images
+                # render as a single SD batch yet differ; captions are chosen per post
+                daily_image_prompt = generate_content(content_style="lifestyle")['image_prompt'] if images_needed else None
+                first_seed = random.randint(0, 2147483647 - images_needed)
+
+                for seed_offset, slot in enumerate(slots[:images_needed]):
+                    content = generate_content(content_style="lifestyle")
+                    created.append(ContentPost(
+                        title=content.get('title', 'Sophia AI Post'),
+                        caption=content.get('caption', 'Check out my latest post!'),
+                        content_type='image',
+                        status='rendering',
+                        scheduled_for=slot,
+                        platforms='instagram,telegram',  # Post to both platforms
+                        hashtags=content.get('hashtags', '#sophiaAI'),
+                        image_prompt=daily_image_prompt,
+                        image_seed=first_seed + seed_offset
+                    ))
+
+                for slot in slots[images_needed:]:
+                    content = generate_content(content_style="glamour")
+                    created.append(ContentPost(
+                        title=content.get('title', 'Sophia AI Reel'),
+                        caption=content.get('caption', 'Check out my latest reel!'),
+                        content_type='reel',
+                        status='scheduled',  # Reels use a stock photo, so there is nothing to render
+                        scheduled_for=slot,
+                        platforms='instagram,telegram',
+                        hashtags=content.get('hashtags', '#sophiaAI #reel'),
+                        media_path=content.get('image_url', get_stock_photo())
+                    ))
+
+            if not created:
+                db.session.commit()
+                return 0
+
+            db.session.add_all(created)
+            db.session.commit()
+            logger.info(f"Planned {len(created)} posts for the next {self.lookahead_days} days")
+
+            self._notify_scheduler([(post.id, post.scheduled_for) for post in created if post.status == 'scheduled'])
+            return len(created)
+
+    def render(self, urgent_only=False):
+        """
+        Render the images of the earliest 'rendering' posts and mark them scheduled
+
+        Args:
+            urgent_only (bool): Only render posts due within the render lead time
+
+        Returns:
+            int: Number of posts made ready
+        """
+        with app.app_context():
+            query = db.session.query(ContentPost).filter(ContentPost.status == 'rendering')
+            if urgent_only:
+                query = query.filter(ContentPost.scheduled_for <= datetime.now() + self.render_lead)
+            posts = query.order_by(ContentPost.scheduled_for).limit(self.render_batch).all()
+
+            # Posts planned before seeds were recorded get one now, so a re-render gives the same image
+            for post in posts:
+                if post.image_seed is None:
+                    post.image_seed = random.randint(0, 2147483647)
+            pending = [(post.id, post.image_prompt or "", post.image_seed) for post in posts]
+
+            # End the transaction so no connection is held during generation
+            db.session.commit()
+            if not pending:
+                return 0
+
+            # Each image's seed comes from its post, so posts rendered in different batches never share an image
+            images = generate_images_batch([prompt for _, prompt, _ in pending],
+                                           seeds=[seed for _, _, seed in pending])
+
+            ready = []
+            rendered = 0
+            for (post_id, _, _), image_data in zip(pending, images):
+                post = db.session.get(ContentPost, post_id)
+                if post is None or post.status != 'rendering':
+                    # Deleted or edited while rendering
+                    continue
+
+                if image_data:
+                    post.image_url = save_image_bytes(image_data)
+                    rendered += 1
+                else:
+                    # Stable Diffusion unavailable; fall back to a stock photo
+                    post.image_url = get_stock_photo()
+                post.status = 'scheduled'
+                ready.append((post.id, post.scheduled_for))
+
+            db.session.commit()
+            logger.info(f"Rendered {rendered} of {len(pending)} post images with Stable Diffusion")
+
+            self._notify_scheduler(ready)
+            return len(ready)
+
+    def _notify_scheduler(self, due_times):
+        from scheduler import content_scheduler
+
+        for post_id, scheduled_for in due_times:
+            content_scheduler.schedule(post_id, scheduled_for)
+
+    def run_once(self):
+        """Plan the lookahead window, then render what this hour allows"""
+        self.plan()
+
+        # Posts that would otherwise be late are rendered at any hour
+        while not self.stop_event.is_set() and self.render(urgent_only=True):
+            pass
+
+        # Off-peak: one batch per run spreads the night's rendering evenly
+        if datetime.now().hour in self.offpeak_hours:
+            self.render()
+
+    def run(self):
+        """Run the pipeline loop"""
+        logger.info("Content pipeline is running")
+
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error in content pipeline: {str(e)}")
+
+            self.stop_event.wait(self.interval)
+
+        logger.info("Content pipeline stopped")
+
+    def start(self):
+        """Start the pipeline in a separate thread"""
+        if self._thread is not None and self._thread.is_alive():
+            if not self.stop_event.is_set():
+                logger.warning("Content pipeline already running")
+                return
+            self._thread.join()
+
+        self.stop_event.clear()
+        self._thread = threading.Thread(target=self.run, name="content-pipeline", daemon=True)
+        self._thread.start()
+        logger.info("Content pipeline started in background thread")
+
+    def stop(self):
+        """Stop the pipeline"""
+        self.stop_event.set()
+        logger.info("Content pipeline stopping...")
+
+
+# Create global content pipeline instance
+content_pipeline = ContentPipeline()
@@ -0,0 +1,104 @@
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Shared session for all outbound API calls (OpenRouter, Whisper, Stable Diffusion, Colab)
+_session = None
+_session_lock = threading.Lock()
+
+def create_session(pool_connections=None, pool_maxsize=None, max_retries=None):
+    """
+    Create a requests session backed by a keep-alive connection pool
+
+    Args:
+        pool_connections (int): Number of per-host pools to cache
+        pool_maxsize (int): Maximum number of keep-alive connections per host
+        max_retries (int): Number of retries for failed connection attempts
+
+    Returns:
+        requests.Session: A session with pooled HTTP and HTTPS adapters
+    """
+    if pool_connections is None:
+        pool_connections = Config.HTTP_POOL_CONNECTIONS
+    if pool_maxsize is None:
+        pool_maxsize = Config.HTTP_POOL_MAXSIZE
+    if max_retries is None:
+        max_retries = Config.HTTP_MAX_RETRIES
+
+    session = requests.Session()
+
+    # pool_block=False lets bursts above pool_maxsize open extra connections
+    # instead of waiting; only pool_maxsize of them are kept alive afterwards
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=max_retries,
+        pool_block=False
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+
+    return session
+
+def get_session():
+    """
+    Get the process-wide pooled HTTP session, creating it on first use
+
+    requests.Session is safe to share between threads for sending requests,
+    and urllib3 hands each thread its own connection from the pool.
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+                logger.info(
+                    f"Created pooled HTTP session "
+                    f"(pool_connections={Config.HTTP_POOL_CONNECTIONS}, pool_maxsize={Config.HTTP_POOL_MAXSIZE})"
+                )
+
+    return _session
+
+def get_timeout(read_timeout=None, connect_timeout=None):
+    """
+    Build a (connect, read) timeout tuple for requests
+
+    Args:
+        read_timeout (float, optional): Seconds to wait for the server to respond
+        connect_timeout (float, optional): Seconds to wait for the TCP/TLS connection
+
+    Returns:
+        tuple: (connect_timeout, read_timeout)
+    """
+    if connect_timeout is None:
+        connect_timeout = Config.HTTP_CONNECT_TIMEOUT
+    if read_timeout is None:
+        read_timeout = Config.HTTP_READ_TIMEOUT
+
+    return (connect_timeout, read_timeout)
+
+def post(url, read_timeout=None, connect_timeout=None, **kwargs):
+    """POST through the shared pooled session with separate connect/read timeouts"""
+    return get_session().post(url, timeout=get_timeout(read_timeout, connect_timeout), **kwargs)
+
+def get(url, read_timeout=None, connect_timeout=None, **kwargs):
+    """GET through the shared pooled session with separate connect/read timeouts"""
+    return get_session().get(url, timeout=get_timeout(read_timeout, connect_timeout), **kwargs)
+
+def close_session():
+    """Close the shared session and release its pooled connections"""
+    global _session
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
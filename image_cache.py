@@ -0,0 +1,184 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from concurrent.futures import Future
+
+from config import Config
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def make_cache_key(params):
+    """
+    Content address for a generation request
+
+    Args:
+        params (dict): The canonical generation parameters (backend, prompt, model, size, seed, ...)
+
+    Returns:
+        str: Hex SHA-256 of the parameters serialized with sorted keys
+    """
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+class ImageCache:
+    """
+    On-disk, content-addressed cache of generated images with LRU eviction
+
+    Files are named by the hash of their generation parameters. A hit refreshes
+    the file's modification time, and once the cache grows past max_bytes the
+    least recently used files are removed. Concurrent requests for the same key
+    share one generation instead of each asking the GPU for the same image.
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = directory or Config.IMAGE_CACHE_DIR
+        self.max_bytes = max_bytes if max_bytes is not None else Config.IMAGE_CACHE_MAX_MB * 1024 * 1024
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._total_bytes = None
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.img")
+
+    def get(self, key):
+        """Return the cached image bytes for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        try:
+            # Mark as recently used for eviction
+            os.utime(path, None)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        """Store image bytes under key and evict old entries if over the size limit"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temp file first so readers never see a partial image
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += len(data)
+            over_limit = self._total_bytes > self.max_bytes
+
+        if over_limit:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.img'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Remove least recently used images until the cache fits in max_bytes"""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+
+            self._total_bytes = total
+
+        if removed:
+            logger.info(f"Evicted {removed} images from the image cache ({total} bytes remain)")
+
+    def get_or_generate(self, params, generate):
+        """
+        Return the cached image for params, generating it at most once per key
+
+        Args:
+            params (dict): Canonical generation parameters (must include the seed)
+            generate (callable): Called with no arguments to produce image bytes on a miss
+
+        Returns:
+            bytes or None: The image data, or None if generation failed (failures aren't cached)
+        """
+        key = make_cache_key(params)
+
+        data = self.get(key)
+        if data is not None:
+            logger.debug(f"Image cache hit for {key}")
+            return data
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not is_leader:
+            logger.debug(f"Waiting for in-flight generation of {key}")
+            return future.result()
+
+        try:
+            # The previous generation may have finished between the first lookup and
+            # registering as leader; don't generate an image that is already on disk
+            data = self.get(key)
+            if data is not None:
+                future.set_result(data)
+                return data
+
+            data = generate()
+            if data is not None:
+                try:
+                    self.put(key, data)
+                except Exception as e:
+                    logger.error(f"Error writing image to cache: {str(e)}")
+            future.set_result(data)
+            return data
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+
+# Create global image cache instance
+image_cache = ImageCache()
@@ -0,0 +1,128 @@
+import os
+import sys
+import logging
+import tempfile
+
+from PIL import Image, ImageOps
+
+from app import app
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Renditions made for every generated image, stored next to the original as <name>.<rendition>.<ext>
+#   fit  - scale down to fit inside the box, keeping the aspect ratio
+#   crop - scale and centre-crop to exactly the box (platform aspect ratios)
+RENDITIONS = {
+    'thumb': {'mode': 'fit', 'size': (320, 320), 'format': 'WEBP', 'ext': 'webp', 'quality': 75},
+    'web': {'mode': 'fit', 'size': (1024, 1024), 'format': 'WEBP', 'ext': 'webp', 'quality': 82},
+    'ig_square': {'mode': 'crop', 'size': (1080, 1080), 'format': 'JPEG', 'ext': 'jpg', 'quality': 90},
+    'ig_portrait': {'mode': 'crop', 'size': (1080, 1350), 'format': 'JPEG', 'ext': 'jpg', 'quality': 90},
+    'ig_landscape': {'mode': 'crop', 'size': (1080, 566), 'format': 'JPEG', 'ext': 'jpg', 'quality': 90},
+}
+
+# AVIF is smaller still, but only when this Pillow build can write it
+Image.init()
+if 'AVIF' in Image.SAVE:
+    RENDITIONS['web_avif'] = {'mode': 'fit', 'size': (1024, 1024), 'format': 'AVIF', 'ext': 'avif', 'quality': 60}
+
+def _url_to_path(url):
+    """Map a /static/... URL to its file on disk, or None for external URLs"""
+    if not url or not url.startswith('/static/'):
+        return None
+    return os.path.join(app.root_path, *url.lstrip('/').split('/'))
+
+def derivative_path(path, rendition):
+    """Path of a rendition of the image at path"""
+    spec = RENDITIONS[rendition]
+    stem, _ = os.path.splitext(path)
+    return f"{stem}.{rendition}.{spec['ext']}"
+
+def _render(image, spec):
+    if spec['mode'] == 'crop':
+        return ImageOps.fit(image, spec['size'], Image.LANCZOS)
+
+    rendered = image.copy()
+    rendered.thumbnail(spec['size'], Image.LANCZOS)
+    return rendered
+
+def _save_atomic(image, path, spec):
+    # Write to a temp file in the same directory and rename, so a half-written file is never served
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            image.save(f, format=spec['format'], quality=spec['quality'])
+        os.replace(temp_path, path)
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def create_derivatives(url_or_path, renditions=None):
+    """
+    Render the thumbnail, WebP and Instagram-sized versions of an image
+
+    Args:
+        url_or_path (str): A /static/... URL or a file path
+        renditions (list, optional): Names from RENDITIONS; defaults to all of them
+
+    Returns:
+        dict: Rendition name -> file path, for the renditions that were written
+    """
+    path = _url_to_path(url_or_path) if url_or_path.startswith('/static/') else url_or_path
+    if not path or not os.path.exists(path):
+        return {}
+
+    created = {}
+    try:
+        with Image.open(path) as original:
+            # Respect camera orientation and drop alpha/palette for JPEG output
+            image = ImageOps.exif_transpose(original).convert('RGB')
+    except Exception as e:
+        logger.warning(f"Can't create derivatives for {path}: {str(e)}")
+        return created
+
+    for rendition in renditions or RENDITIONS:
+        spec = RENDITIONS[rendition]
+        target = derivative_path(path, rendition)
+        try:
+            _save_atomic(_render(image, spec), target, spec)
+            created[rendition] = target
+        except Exception as e:
+            logger.error(f"Error creating {rendition} rendition of {path}: {str(e)}")
+
+    return created
+
+@app.template_global('image_url')
+def image_url(url, rendition='web'):
+    """
+    URL of an image rendition, falling back to the original if it hasn't been rendered
+
+    Usable from templates, e.g. {{ image_url(post.image_url, 'thumb') }}
+    """
+    path = _url_to_path(url)
+    if not path or rendition not in RENDITIONS:
+        return url
+
+    if os.path.exists(derivative_path(path, rendition)):
+        stem, _ = os.path.splitext(url)
+        return f"{stem}.{rendition}.{RENDITIONS[rendition]['ext']}"
+
+    return url
+
+if __name__ == "__main__":
+    # Usage: python image_derivatives.py [directory ...]
+    # Renders derivatives for existing images (e.g. static/assets, static/generated).
+    directories = sys.argv[1:] or [os.path.join(app.root_path, 'static', 'assets'),
+                                   os.path.join(app.root_path, 'static', 'generated')]
+    rendition_suffixes = tuple(f".{name}.{spec['ext']}" for name, spec in RENDITIONS.items())
+
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if not name.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')) or name.endswith(rendition_suffixes):
+                    continue
+                created = create_derivatives(os.path.join(root, name))
+                print(f"{os.path.join(root, name)}: {len(created)} renditions")
@@ -0,0 +1,275 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from config import Config
+from app import app, db
+from models import ImageJob, ContentPost, User
+from content_generator import generate_image
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class ImageJobQueue:
+    """
+    Persisted background queue for image generation
+
+    Jobs are stored in the image_job table before they are run, so a restarted
+    worker picks up whatever was queued or interrupted. Each job is claimed with
+    a conditional UPDATE, so the same job is never run twice when several
+    processes resume the queue at once.
+
+    While a job runs, its process refreshes the job's heartbeat_at every
+    IMAGE_JOB_HEARTBEAT_INTERVAL seconds. Every process also sweeps the table on
+    that interval: it requeues running jobs whose heartbeat is older than
+    IMAGE_JOB_STALE_SECONDS, and takes on jobs that have been queued that long
+    (they may be sitting in the executor of a worker that died). So a job is
+    picked up again even if no process restarts.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or Config.IMAGE_JOB_WORKERS
+        self._executor = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._running = set()  # Ids of the jobs this process is running
+        self._pending = set()  # Ids of the jobs waiting in this process's executor
+        self._stop_event = threading.Event()
+        self._sweeper = None
+
+    def add_listener(self, listener):
+        """Register a callable that receives a job's to_dict() whenever its status changes"""
+        self._listeners.append(listener)
+
+    def _notify(self, job):
+        data = job.to_dict()
+        for listener in self._listeners:
+            try:
+                listener(data)
+            except Exception as e:
+                logger.error(f"Error notifying image job listener: {str(e)}")
+
+    def start(self):
+        """Start the worker pool and resume jobs left over from a previous run"""
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="image-job")
+            self._stop_event.clear()
+            self._sweeper = threading.Thread(target=self._sweep_loop, name="image-job-sweeper", daemon=True)
+            self._sweeper.start()
+
+        resumed = self.resume_jobs()
+        logger.info(f"Image job queue started with {self.max_workers} workers, resumed {resumed} jobs")
+
+    def submit(self, prompt, post_id=None, user_id=None):
+        """
+        Persist an image generation job and queue it
+
+        Args:
+            prompt (str): The image prompt
+            post_id (int, optional): Content post whose image_url is set when the job completes
+            user_id (int, optional): User who requested the image
+
+        Returns:
+            ImageJob: The queued job (already committed, so its id can be returned to the client)
+        """
+        job = ImageJob(prompt=prompt, post_id=post_id, user_id=user_id, status="queued")
+        db.session.add(job)
+        db.session.commit()
+
+        self.start()
+        self._submit(job.id)
+        return job
+
+    def _submit(self, job_id):
+        """Queue a job on this process's executor, unless it is already waiting there"""
+        with self._lock:
+            if job_id in self._pending:
+                return
+            self._pending.add(job_id)
+        self._executor.submit(self._run, job_id)
+
+    def _requeue_stale(self):
+        """Mark running jobs whose heartbeat stopped as queued; returns their ids"""
+        image_job_table = ImageJob.__table__
+        stale_before = datetime.utcnow() - timedelta(seconds=Config.IMAGE_JOB_STALE_SECONDS)
+        last_seen = db.func.coalesce(image_job_table.c.heartbeat_at, image_job_table.c.started_at)
+
+        stale_ids = [job_id for (job_id,) in db.session.query(ImageJob.id)
+                     .filter(ImageJob.status == "running", last_seen < stale_before)]
+
+        requeued = []
+        for job_id in stale_ids:
+            # Re-check in the UPDATE: the job may have finished or sent a heartbeat meanwhile
+            result = db.session.execute(
+                image_job_table.update()
+                .where(image_job_table.c.id == job_id)
+                .where(image_job_table.c.status == "running")
+                .where(last_seen < stale_before)
+                .values(status="queued")
+            )
+            if result.rowcount == 1:
+                requeued.append(job_id)
+        db.session.commit()
+
+        if requeued:
+            logger.warning(f"Requeued image jobs whose worker stopped responding: {requeued}")
+        return requeued
+
+    def resume_jobs(self):
+        """Queue jobs that were waiting, or running in a process that died"""
+        with app.app_context():
+            self._requeue_stale()
+
+            job_ids = [job_id for (job_id,) in db.session.query(ImageJob.id)
+                       .filter(ImageJob.status == "queued")
+                       .order_by(ImageJob.created_at)]
+            db.session.rollback()
+
+        for job_id in job_ids:
+            self._submit(job_id)
+
+        return len(job_ids)
+
+    def _stale_queued(self):
+        """Ids of jobs that have been waiting longer than IMAGE_JOB_STALE_SECONDS"""
+        stale_before = datetime.utcnow() - timedelta(seconds=Config.IMAGE_JOB_STALE_SECONDS)
+        waiting_since = db.func.coalesce(ImageJob.heartbeat_at, ImageJob.started_at, ImageJob.created_at)
+        job_ids = [job_id for (job_id,) in db.session.query(ImageJob.id)
+                   .filter(ImageJob.status == "queued", waiting_since < stale_before)
+                   .order_by(ImageJob.created_at)]
+        db.session.rollback()
+        return job_ids
+
+    def _heartbeat(self):
+        """Refresh heartbeat_at on the jobs this process is running"""
+        job_ids = list(self._running)
+        if not job_ids:
+            return
+
+        image_job_table = ImageJob.__table__
+        db.session.execute(
+            image_job_table.update()
+            .where(image_job_table.c.id.in_(job_ids))
+            .where(image_job_table.c.status == "running")
+            .values(heartbeat_at=datetime.utcnow())
+        )
+        db.session.commit()
+
+    def _sweep_loop(self):
+        while not self._stop_event.wait(Config.IMAGE_JOB_HEARTBEAT_INTERVAL):
+            with app.app_context():
+                try:
+                    self._heartbeat()
+                    # _claim() makes sure a job that is also queued elsewhere only runs once
+                    for job_id in self._requeue_stale() + self._stale_queued():
+                        self._submit(job_id)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Error sweeping image jobs: {str(e)}")
+
+    def _claim(self, job_id):
+        """Mark a queued job as running; returns False if another worker already has it"""
+        image_job_table = ImageJob.__table__
+        result = db.session.execute(
+            image_job_table.update()
+            .where(image_job_table.c.id == job_id)
+            .where(image_job_table.c.status == "queued")
+            .values(
+                status="running",
+                started_at=datetime.utcnow(),
+                heartbeat_at=datetime.utcnow(),
+                attempts=db.func.coalesce(image_job_table.c.attempts, 0) + 1
+            )
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def _run(self, job_id):
+        with self._lock:
+            self._pending.discard(job_id)
+
+        with app.app_context():
+            try:
+                if not self._claim(job_id):
+                    return
+                self._running.add(job_id)
+
+                job = db.session.get(ImageJob, job_id)
+                self._notify(job)
+                prompt = job.prompt
+                db.session.commit()
+
+                # Don't hold a pooled connection through a generation that can take minutes
+                image_url = generate_image(prompt)
+                if not image_url:
+                    raise RuntimeError("Image generation returned no image")
+
+                self._complete(job_id, image_url)
+
+            except Exception as e:
+                # Stop the heartbeat before a retry can claim the job again
+                self._running.discard(job_id)
+                db.session.rollback()
+                logger.error(f"Image job {job_id} failed: {str(e)}")
+                self._retry_or_fail(job_id, str(e))
+
+            finally:
+                self._running.discard(job_id)
+
+    def _complete(self, job_id, image_url):
+        job = db.session.get(ImageJob, job_id)
+        job.status = "completed"
+        job.image_url = image_url
+        job.error_message = None
+        job.completed_at = datetime.utcnow()
+
+        if job.post_id:
+            post = db.session.get(ContentPost, job.post_id)
+            if post:
+                post.image_url = image_url
+
+        db.session.commit()
+        logger.info(f"Image job {job_id} completed: {image_url}")
+        self._notify(job)
+
+    def _retry_or_fail(self, job_id, error):
+        try:
+            job = db.session.get(ImageJob, job_id)
+            if not job:
+                return
+
+            job.error_message = error
+            if (job.attempts or 0) < Config.IMAGE_JOB_MAX_ATTEMPTS:
+                job.status = "queued"
+                db.session.commit()
+                self._submit(job_id)
+                return
+
+            job.status = "failed"
+            job.completed_at = datetime.utcnow()
+
+            # Give back the daily image credit taken when the job was submitted
+            if job.user_id:
+                user = db.session.get(User, job.user_id)
+                if user and not user.is_admin:
+                    user.daily_image_limit = (user.daily_image_limit or 0) + 1
+
+            db.session.commit()
+            self._notify(job)
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error recording failure of image job {job_id}: {str(e)}")
+
+    def shutdown(self, wait=True):
+        """Stop accepting work and optionally wait for running jobs"""
+        self._stop_event.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+
+# Create global image job queue
+image_job_queue = ImageJobQueue()
@@ -13,10 +13,11 @@ except ImportError:
     logging.warning("Instagram API libraries not installed. Instagram functionality will be limited.")
 
 from config import Config
-from app import db
-from models import Conversation, Message
+from app import app, db
+from models import Conversation, InstagramCommentCursor
 from ai_service import generate_text_response
-from language_processor import detect_language
+from language_processor import detect_conversation_language
+from chat_store import save_turn
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -26,6 +27,9 @@ logger = logging.getLogger(__name__)
 INSTAGRAM_USERNAME = Config.INSTAGRAM_USERNAME
 INSTAGRAM_PASSWORD = Config.INSTAGRAM_PASSWORD
 
+# Extra comments fetched beyond the count increase, in case some were deleted meanwhile
+COMMENT_FETCH_MARGIN = 5
+
 class SophiaInstagramBot:
     def __init__(self):
         self.username = INSTAGRAM_USERNAME
@@ -34,8 +38,8 @@ class SophiaInstagramBot:
         self.is_running = False
         self.comment_check_interval = 300  # seconds between comment checks
         self.direct_check_interval = 300   # seconds between direct message checks
-        self.last_comment_id = None
         self.stop_event = threading.Event()
+        self._thread = None
 
     def login(self):
         """Log in to Instagram."""
@@ -71,10 +75,7 @@ class SophiaInstagramBot:
         """Get existing conversation or create a new one."""
         from app import app
         with app.app_context():
-            conversation = Conversation.query.filter_by(
-                external_id=external_id,
-                source=source
-            ).first()
+            conversation = Conversation.for_external_id(external_id, source).first()
             
             if not conversation:
                 conversation = Conversation(
@@ -97,90 +98,113 @@ class SophiaInstagramBot:
             user_id = self.client.user_id
             medias = self.client.user_medias(user_id, 5)  # Get 5 most recent posts
             
-            for media in medias:
-                # Get comments
-                comments = self.client.media_comments(media.id)
-                
-                for comment in comments:
-                    # Check if we've already processed this comment
-                    # In a real app, we'd store this in the database
-                    if self.last_comment_id and comment.pk <= self.last_comment_id:
-                        continue
-                        
-                    # Update last comment ID
-                    if not self.last_comment_id or comment.pk > self.last_comment_id:
-                        self.last_comment_id = comment.pk
-                    
-                    # Get comment text and user
-                    comment_text = comment.text
-                    commenter_username = comment.user.username
-                    
-                    logger.info(f"Processing Instagram comment from {commenter_username}: {comment_text}")
-                    
-                    # Get or create conversation
-                    conversation = self._get_or_create_conversation(
-                        external_id=comment.user.pk,
-                        source="instagram"
-                    )
-                    
-                    # Detect language
-                    detected_lang = detect_language(comment_text)
-                    if detected_lang != conversation.detected_language:
-                        conversation.detected_language = detected_lang
-                        db.session.commit()
-                    
-                    # Save comment to database
-                    user_msg = Message(
-                        conversation_id=conversation.id,
-                        content=comment_text,
-                        is_from_user=True
-                    )
-                    db.session.add(user_msg)
-                    
-                    # Update conversation last interaction
-                    conversation.last_interaction = datetime.utcnow()
-                    db.session.commit()
-                    
-                    # Count messages for this conversation
-                    from app import app
-                    message_count = 0
-                    with app.app_context():
-                        message_count = Message.query.filter_by(conversation_id=conversation.id).count()
-                    
-                    # Check if we've reached the message limit (50)
-                    if message_count > 50:
-                        response = (
-                            "I've really enjoyed our chat! 💖 To continue our conversation with more features, "
-                            "let's talk more exclusively on the website at https://sophia.ai. "
-                            "I can offer you a more personalized experience there! Click the link to continue our chat."
-                        )
-                    else:
-                        # Generate regular response
-                        response = generate_text_response(
-                            comment_text,
-                            conversation_id=conversation.id,
-                            flirt_level=5,
-                            language=detected_lang
-                        )
-                    
-                    # Save AI response to database
-                    ai_msg = Message(
-                        conversation_id=conversation.id,
-                        content=response,
-                        is_from_user=False
-                    )
-                    db.session.add(ai_msg)
-                    db.session.commit()
-                    
-                    # Reply to comment (disabled for demo)
-                    logger.info(f"Would reply to {commenter_username} with: {response}")
-                    # In a real app:
-                    # self.client.media_comment(media.id, f"@{commenter_username} {response}")
+            with app.app_context():
+                for media in medias:
+                    self._check_media_comments(media)
         
         except Exception as e:
             logger.error(f"Error checking Instagram comments: {str(e)}")
             logger.error(traceback.format_exc())
 
+    def _check_media_comments(self, media):
+        """Reply to the comments on one media that arrived since its stored cursor."""
+        media_id = str(media.id)
+        comment_count = media.comment_count or 0
+        cursor = db.session.get(InstagramCommentCursor, media_id)
+        
+        if cursor is None:
+            # First time we see this media: reply only to comments from the backfill window
+            cursor = InstagramCommentCursor(media_id=media_id, last_comment_pk=0, comment_count=0)
+            db.session.add(cursor)
+            not_before = datetime.utcnow() - timedelta(hours=Config.INSTAGRAM_COMMENT_BACKFILL_HOURS)
+        elif comment_count == cursor.comment_count and not self._recheck_due(cursor):
+            # No new comments; skip the comments request entirely
+            return
+        else:
+            # An unchanged count can hide a deleted comment plus a new one, so the newest
+            # page is still read every INSTAGRAM_COMMENT_RECHECK_SECONDS
+            not_before = None
+        
+        # Comments come newest first, so fetching as many as were added (plus a margin for
+        # deleted ones) reaches back to the cursor without paging through older comments
+        new_count = max(comment_count - cursor.comment_count, 0)
+        comments = self.client.media_comments(media.id, amount=new_count + COMMENT_FETCH_MARGIN)
+        cursor.checked_at = datetime.utcnow()
+        
+        last_pk = cursor.last_comment_pk or 0
+        own_pk = str(self.client.user_id)
+        new_comments = sorted((c for c in comments if int(c.pk) > last_pk), key=lambda c: int(c.pk))
+        
+        for comment in new_comments:
+            # Move the cursor before replying: a crash may skip a reply but never repeats one
+            cursor.last_comment_pk = int(comment.pk)
+            db.session.commit()
+            
+            if str(comment.user.pk) == own_pk:
+                continue  # Our own replies
+            if not_before is not None and comment.created_at_utc.replace(tzinfo=None) < not_before:
+                continue
+            
+            try:
+                self._reply_to_comment(media, comment)
+            except Exception as e:
+                logger.error(f"Error replying to Instagram comment {comment.pk}: {str(e)}")
+        
+        cursor.comment_count = comment_count
+        db.session.commit()
+
+    def _recheck_due(self, cursor):
+        """Whether a media's newest comments should be read again even though its count is unchanged."""
+        if cursor.checked_at is None:
+            return True
+        return datetime.utcnow() - cursor.checked_at >= timedelta(seconds=Config.INSTAGRAM_COMMENT_RECHECK_SECONDS)
+
+    def _reply_to_comment(self, media, comment):
+        """Generate and send the reply to one comment."""
+        # Get comment text and user
+        comment_text = comment.text
+        commenter_username = comment.user.username
+        
+        logger.info(f"Processing Instagram comment from {commenter_username}: {comment_text}")
+        
+        # Get or create conversation
+        conversation = self._get_or_create_conversation(
+            external_id=comment.user.pk,
+            source="instagram"
+        )
+        
+        # Detect language, keeping the conversation's language unless it clearly changed
+        detected_lang = detect_conversation_language(conversation, comment_text)
+        
+        received_at = datetime.utcnow()
+        
+        # Messages so far in this conversation, counting this one (maintained on insert, no COUNT needed)
+        message_count = (conversation.message_count or 0) + 1
+        
+        # Check if we've reached the message limit (50)
+        if message_count > 50:
+            response = (
+                "I've really enjoyed our chat! 💖 To continue our conversation with more features, "
+                "let's talk more exclusively on the website at https://sophia.ai. "
+                "I can offer you a more personalized experience there! Click the link to continue our chat."
+            )
+        else:
+            # Generate regular response
+            response = generate_text_response(
+                comment_text,
+                conversation_id=conversation.id,
+                flirt_level=5,
+                language=detected_lang
+            )
+        
+        # Save the message, AI response and conversation updates in one transaction
+        save_turn(conversation, comment_text, response, language=detected_lang, received_at=received_at)
+        
+        # Reply to comment (disabled for demo)
+        logger.info(f"Would reply to {commenter_username} with: {response}")
+        # In a real app:
+        # self.client.media_comment(media.id, f"@{commenter_username} {response}")
+
     def check_direct_messages(self):
         """Check and respond to direct messages."""
         if not self.check_login():
@@ -216,29 +240,13 @@ class SophiaInstagramBot:
                         source="instagram_dm"
                     )
                     
-                    # Detect language
-                    detected_lang = detect_language(message_text)
-                    if detected_lang != conversation.detected_language:
-                        conversation.detected_language = detected_lang
-                        db.session.commit()
+                    # Detect language, keeping the conversation's language unless it clearly changed
+                    detected_lang = detect_conversation_language(conversation, message_text)
                     
-                    # Save message to database
-                    user_msg = Message(
-                        conversation_id=conversation.id,
-                        content=message_text,
-                        is_from_user=True
-                    )
-                    db.session.add(user_msg)
+                    received_at = datetime.utcnow()
                     
-                    # Update conversation last interaction
-                    conversation.last_interaction = datetime.utcnow()
-                    db.session.commit()
-                    
-                    # Count messages for this conversation
-                    from app import app
-                    message_count = 0
-                    with app.app_context():
-                        message_count = Message.query.filter_by(conversation_id=conversation.id).count()
+                    # Messages so far in this conversation, counting this one (maintained on insert, no COUNT needed)
+                    message_count = (conversation.message_count or 0) + 1
                     
                     # Check if we've reached the message limit (50)
                     if message_count > 50:
@@ -256,14 +264,8 @@ class SophiaInstagramBot:
                             language=detected_lang
                         )
                     
-                    # Save AI response to database
-                    ai_msg = Message(
-                        conversation_id=conversation.id,
-                        content=response,
-                        is_from_user=False
-                    )
-                    db.session.add(ai_msg)
-                    db.session.commit()
+                    # Save the message, AI response and conversation updates in one transaction
+                    save_turn(conversation, message_text, response, language=detected_lang, received_at=received_at)
                     
                     # Send response (disabled for demo)
                     logger.info(f"Would reply to DM with: {response}")
@@ -300,21 +302,24 @@ class SophiaInstagramBot:
             except Exception as e:
                 logger.error(f"Error in Instagram bot main loop: {str(e)}")
                 logger.error(traceback.format_exc())
-                time.sleep(60)  # Wait before retry on error
+                self.stop_event.wait(60)  # Wait before retry on error
         
         self.is_running = False
         logger.info("Instagram bot stopped")
 
     def start(self):
-        """Start the Instagram bot in a separate thread."""
-        if self.is_running:
-            logger.warning("Instagram bot is already running")
-            return
+        """Start the Instagram bot in a separate thread (also after a stop(), e.g. on regaining leadership)."""
+        if self._thread is not None and self._thread.is_alive():
+            if not self.stop_event.is_set():
+                logger.warning("Instagram bot is already running")
+                return
+            # Still finishing a stop(); let that loop exit before starting a new one
+            self._thread.join()
             
         self.stop_event.clear()
-        thread = threading.Thread(target=self.run)
-        thread.daemon = True
-        thread.start()
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
         logger.info("Instagram bot started in background thread")
 
     def stop(self):
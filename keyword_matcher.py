@@ -0,0 +1,123 @@
+import re
+
+# Keyword vocabularies used by ai_service.analyze_user_message
+POSITIVE_WORDS = ['happy', 'good', 'great', 'excellent', 'amazing', 'love', 'like', 'thank',
+                  'thanks', 'wonderful', 'awesome', 'beautiful', 'enjoy', 'pleased', 'smile',
+                  'glad', 'joy', 'excited', 'fun', 'nice', 'perfect', 'fantastic', 'brilliant']
+
+NEGATIVE_WORDS = ['sad', 'bad', 'terrible', 'horrible', 'hate', 'dislike', 'angry', 'upset',
+                  'disappointed', 'awful', 'worse', 'worst', 'sucks', 'sorry', 'unfortunately',
+                  'mad', 'annoyed', 'frustrated', 'unhappy', 'depressed', 'worried', 'tired']
+
+FLIRTY_WORDS = [
+    'cute', 'sexy', 'hot', 'attractive', 'beautiful', 'handsome', 'gorgeous',
+    'kiss', 'date', 'love', 'like you', 'miss you', 'hug', 'cuddle', 'together',
+    'relationship', 'romantic', 'boyfriend', 'girlfriend', 'partner', 'lover',
+    'marry', 'marriage', 'dating', 'flirt', 'wink', 'crush', 'charming'
+]
+
+GREETING_PATTERNS = [
+    'hi', 'hello', 'hey', 'howdy', 'greetings', 'good morning', 'good afternoon',
+    'good evening', 'what\'s up', 'sup', 'yo', 'hiya'
+]
+
+FAREWELL_PATTERNS = [
+    'bye', 'goodbye', 'see you', 'talk to you later', 'have to go', 'gotta go',
+    'farewell', 'until next time', 'catch you later', 'night', 'good night'
+]
+
+PERSONAL_QUESTIONS = [
+    'how are you', 'how do you feel', 'what are you doing', 'what\'s up with you',
+    'tell me about yourself', 'who are you', 'what do you like', 'what\'s your favorite',
+    'where are you', 'where do you live', 'what do you look like', 'how old are you'
+]
+
+# Question words are matched against whole words, not substrings
+QUESTION_WORDS = frozenset(['what', 'where', 'when', 'who', 'whom', 'whose', 'why', 'how'])
+
+# Auxiliary verbs that start a yes/no question
+AUXILIARY_QUESTION_RE = re.compile(r'^(?:is|are|do|does|did|can|could|would) ')
+
+KEYWORD_CATEGORIES = {
+    'positive': POSITIVE_WORDS,
+    'negative': NEGATIVE_WORDS,
+    'flirty': FLIRTY_WORDS,
+    'greeting': GREETING_PATTERNS,
+    'farewell': FAREWELL_PATTERNS,
+    'personal_question': PERSONAL_QUESTIONS,
+}
+
+def _build_trie(keywords):
+    root = {}
+    for keyword in keywords:
+        node = root
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = True
+    return root
+
+def _trie_to_regex(node):
+    """
+    Turn a keyword trie into a regex that matches the longest keyword first
+
+    Shared prefixes are matched once, so the engine walks a single branch per
+    character instead of trying every keyword at every position.
+    """
+    branches = [re.escape(char) + _trie_to_regex(child) for char, child in sorted(node.items()) if char != '']
+    if not branches:
+        return ''
+
+    body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+
+    # Keywords ending here are also prefixes of longer ones; the greedy ? tries the longer one first
+    if '' in node:
+        return '(?:' + body + ')?'
+    return body
+
+def _build_matcher(categories):
+    keyword_categories = {}
+    for category, keywords in categories.items():
+        for keyword in keywords:
+            keyword_categories.setdefault(keyword, set()).add(category)
+
+    # Every keyword that matches at a position is a prefix of the longest match there,
+    # so precompute the (category, keyword) hits implied by each keyword
+    prefix_hits = {}
+    for keyword in keyword_categories:
+        hits = []
+        for other, other_categories in keyword_categories.items():
+            if keyword.startswith(other):
+                hits.extend((category, other) for category in other_categories)
+        prefix_hits[keyword] = tuple(hits)
+
+    # Zero-width lookahead so overlapping keywords at every position are found in one pass
+    pattern = re.compile('(?=(' + _trie_to_regex(_build_trie(keyword_categories)) + '))')
+    return pattern, prefix_hits
+
+_KEYWORD_RE, _PREFIX_HITS = _build_matcher(KEYWORD_CATEGORIES)
+
+def match_keywords(text):
+    """
+    Find every vocabulary keyword occurring in text in a single scan
+
+    Matching is by substring, like a plain `keyword in text` check, and each
+    keyword is reported once however often it occurs.
+
+    Args:
+        text (str): Lowercased message text
+
+    Returns:
+        dict: Category name -> set of keywords found, for every category in KEYWORD_CATEGORIES
+    """
+    hits = {category: set() for category in KEYWORD_CATEGORIES}
+    seen = set()
+
+    for match in _KEYWORD_RE.finditer(text):
+        keyword = match.group(1)
+        if keyword in seen:
+            continue
+        seen.add(keyword)
+        for category, found in _PREFIX_HITS[keyword]:
+            hits[category].add(found)
+
+    return hits
@@ -1,8 +1,11 @@
 import logging
-from langdetect import detect, LangDetectException
+from functools import lru_cache
+from langdetect import detect_langs, DetectorFactory, LangDetectException
 import time
 import random
 
+from config import Config
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
@@ -26,6 +29,32 @@ LANGUAGE_NAMES = {
     'uk': 'Ukrainian'
 }
 
+# Make langdetect deterministic (it samples n-grams randomly by default)
+DetectorFactory.seed = 0
+
+# Messages shorter than this (after normalization) are too short to detect reliably
+SHORT_TEXT_LENGTH = 12
+
+# Minimum detector confidence needed to switch a conversation away from its current language
+STICKY_SWITCH_CONFIDENCE = 0.9
+
+# Size of the detection cache (distinct normalized messages)
+DETECTION_CACHE_SIZE = 4096
+
+# Common English function words; ASCII text with enough of these skips the detector.
+# Words that are also common in other Latin-script languages (me, a, in, so, no, i, an,
+# am, is, was, on, or, do, ...) are left out so they can't make such text look English.
+ENGLISH_MARKERS = frozenset([
+    'you', 'my', 'your', 'we', 'it', 'are', 'be', 'the', 'and', 'but', 'of', 'at', 'for',
+    'with', 'what', 'how', 'does', 'did', 'can', 'this', 'that', 'not', 'have', 'just', 'im',
+    "i'm", "don't", "it's", 'too'
+])
+ENGLISH_MARKER_RATIO = 0.3
+
+# Confidence reported by the English fast path; below STICKY_SWITCH_CONFIDENCE, so it
+# never switches a conversation to English on its own
+ENGLISH_FAST_PATH_CONFIDENCE = 0.8
+
 # Basic translations for common phrases - in a real app, this would use a proper translation API
 COMMON_PHRASES = {
     'en': {
@@ -66,16 +95,76 @@ COMMON_PHRASES = {
     }
 }
 
+def normalize_text(text):
+    """Normalize text for language detection: lowercase with collapsed whitespace"""
+    return ' '.join(text.lower().split())
+
+@lru_cache(maxsize=DETECTION_CACHE_SIZE)
+def _detect_normalized(normalized, english_fast_path=True):
+    """Detect the language of normalized text, returning (language code, confidence)"""
+    # Very short chat lines ("ok", "lol", "hi!") are unreliable for any detector
+    if len(normalized) < SHORT_TEXT_LENGTH:
+        return Config.DEFAULT_LANGUAGE, 0.0
+    
+    # Fast path: ASCII-only text made up largely of English function words
+    if english_fast_path and normalized.isascii():
+        words = normalized.split()
+        markers = sum(1 for word in words if word.strip('.,!?;:') in ENGLISH_MARKERS)
+        if markers / len(words) >= ENGLISH_MARKER_RATIO:
+            return 'en', ENGLISH_FAST_PATH_CONFIDENCE
+    
+    try:
+        best = detect_langs(normalized)[0]
+        return best.lang, best.prob
+    except LangDetectException as e:
+        logger.error(f"Language detection error: {str(e)}")
+        return Config.DEFAULT_LANGUAGE, 0.0
+
+def detect_language_with_confidence(text, english_fast_path=True):
+    """
+    Detect the language of a given text with the detector's confidence
+    
+    Results are cached on the normalized text. Short messages return the
+    default language with zero confidence.
+    
+    Args:
+        text (str): The text to detect
+        english_fast_path (bool): Allow mostly-English-function-word text to skip the detector
+    
+    Returns:
+        tuple: (language code, confidence from 0.0 to 1.0)
+    """
+    return _detect_normalized(normalize_text(text), english_fast_path)
+
 def detect_language(text):
     """
     Detect the language of a given text
     Returns the language code (e.g., 'en', 'es', 'fr')
     """
-    try:
-        return detect(text)
-    except LangDetectException as e:
-        logger.error(f"Language detection error: {str(e)}")
-        return 'en'  # Default to English on error
+    return detect_language_with_confidence(text)[0]
+
+def detect_conversation_language(conversation, text):
+    """
+    Detect the language of a message within a conversation
+    
+    The conversation's detected_language is sticky. It only changes when a
+    message is detected as another language with high confidence, so short or
+    ambiguous messages don't flip it back and forth. The caller is responsible
+    for committing the conversation.
+    
+    Returns:
+        str: The language code to use for the reply
+    """
+    current = conversation.detected_language
+    
+    # In a non-English conversation only the full detector may decide a message is English
+    language, confidence = detect_language_with_confidence(text, english_fast_path=current in (None, 'en'))
+    
+    if current and (language == current or confidence < STICKY_SWITCH_CONFIDENCE):
+        return current
+    
+    conversation.detected_language = language
+    return language
 
 def get_language_name(lang_code):
     """
@@ -0,0 +1,201 @@
+import os
+import time
+import uuid
+import atexit
+import socket
+import logging
+import threading
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import update, insert, or_, case, func
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from config import Config
+from models import LeaderLease
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def db_now(offset_seconds=0):
+    """SQL expression for the database's current UTC time plus an offset, so hosts with skewed clocks agree"""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        # Same text format SQLAlchemy stores DateTime values in
+        return func.strftime('%Y-%m-%d %H:%M:%f000', 'now', f'{offset_seconds:+d} seconds')
+    if dialect == 'postgresql':
+        return func.timezone('UTC', func.now()) + timedelta(seconds=offset_seconds)
+    return func.now() + timedelta(seconds=offset_seconds)
+
+class LeaderElection:
+    """
+    Elects one process per deployment through a lease row in the database
+
+    Every process (e.g. each gunicorn worker) runs a thread that tries to claim
+    the lease row every renew_interval seconds. The claim is one conditional
+    UPDATE that only succeeds if the row is expired or already ours, so at most
+    one process holds it. The holder keeps renewing it; if the holder dies, the
+    lease runs out and another process takes over within about lease_seconds.
+    A process that can't renew steps down before its lease could have expired.
+    Lease times come from the database clock, so hosts with skewed clocks agree
+    on when a lease runs out.
+
+    on_elected and on_demoted run in order on their own thread, so a slow start
+    or stop of the services never delays a renewal.
+    """
+
+    def __init__(self, name, on_elected, on_demoted, lease_seconds=None, renew_interval=None):
+        self.name = name
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.lease_seconds = lease_seconds or Config.LEADER_LEASE_SECONDS
+        self.renew_interval = renew_interval or Config.LEADER_RENEW_INTERVAL
+        self.identity = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._lease_deadline = 0  # time.monotonic() at which our last renewal runs out
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._transitions = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"leader-{name}-services")
+
+    def _claim(self):
+        """
+        Take or renew the lease
+
+        Returns:
+            bool: True if this process holds the lease now
+        """
+        with app.app_context():
+            now = db_now()
+            expires_at = db_now(self.lease_seconds)
+
+            result = db.session.execute(
+                update(LeaderLease)
+                .where(LeaderLease.name == self.name,
+                       or_(LeaderLease.holder == self.identity, LeaderLease.expires_at < now))
+                .values(
+                    holder=self.identity,
+                    expires_at=expires_at,
+                    renewed_at=now,
+                    acquired_at=case((LeaderLease.holder == self.identity, LeaderLease.acquired_at), else_=now)
+                )
+            )
+            if result.rowcount:
+                db.session.commit()
+                return True
+
+            # No row yet: the first process to insert it wins
+            try:
+                db.session.execute(insert(LeaderLease).values(name=self.name, holder=self.identity,
+                                                              expires_at=expires_at, acquired_at=now, renewed_at=now))
+                db.session.commit()
+                return True
+            except IntegrityError:
+                db.session.rollback()
+                return False
+
+    def _release(self):
+        """Expire our lease so another process can take over without waiting"""
+        with app.app_context():
+            db.session.execute(
+                update(LeaderLease)
+                .where(LeaderLease.name == self.name, LeaderLease.holder == self.identity)
+                .values(expires_at=db_now(-1))
+            )
+            db.session.commit()
+
+    def _run_transition(self, callback, action):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Error {action} {self.name}: {str(e)}")
+
+    def _become_leader(self):
+        self.is_leader = True
+        logger.info(f"{self.identity} is now the {self.name} leader")
+        return self._transitions.submit(self._run_transition, self.on_elected, "starting")
+
+    def _step_down(self, reason):
+        self.is_leader = False
+        logger.warning(f"{self.identity} is no longer the {self.name} leader: {reason}")
+        return self._transitions.submit(self._run_transition, self.on_demoted, "stopping")
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            attempt_started = time.monotonic()
+            try:
+                claimed = self._claim()
+            except Exception as e:
+                logger.error(f"Error renewing {self.name} lease: {str(e)}")
+                claimed = None
+
+            if claimed:
+                self._lease_deadline = attempt_started + self.lease_seconds
+                if not self.is_leader:
+                    self._become_leader()
+            elif claimed is False:
+                if self.is_leader:
+                    self._step_down("the lease was taken over")
+            elif self.is_leader and time.monotonic() >= self._lease_deadline - self.renew_interval:
+                # Couldn't reach the database; stop before another process may legitimately take over
+                self._step_down("the lease could not be renewed")
+
+            self._stop_event.wait(self.renew_interval)
+
+    def start(self):
+        """Start campaigning in a background thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"leader-{self.name}", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stop campaigning, stepping down and releasing the lease if held"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.renew_interval + 5)
+
+        if self.is_leader:
+            stopped = self._step_down("shutting down")
+            try:
+                stopped.result(timeout=30)
+            except Exception as e:
+                logger.error(f"Error waiting for {self.name} to stop: {str(e)}")
+            try:
+                self._release()
+            except Exception as e:
+                logger.error(f"Error releasing {self.name} lease: {str(e)}")
+
+
+def _start_background_services():
+    from scheduler import start_scheduler
+    from content_pipeline import content_pipeline
+    from instagram_bot import start_instagram_bot
+    from telegram_bot import start_telegram_bot
+
+    start_scheduler()
+    content_pipeline.start()
+    start_instagram_bot()
+    start_telegram_bot()
+
+def _stop_background_services():
+    from scheduler import content_scheduler
+    from content_pipeline import content_pipeline
+    from instagram_bot import instagram_bot
+    from telegram_bot import telegram_bot
+
+    content_scheduler.stop()
+    content_pipeline.stop()
+    instagram_bot.stop()
+    telegram_bot.stop()
+
+# Create global election for the content scheduler, content pipeline and the Instagram/Telegram bots
+background_leader = LeaderElection("background-services", _start_background_services, _stop_background_services)
+
+def start_background_services():
+    """Run the scheduler and bots in exactly one process of the deployment"""
+    background_leader.start()
+    return background_leader
@@ -7,12 +7,23 @@ from flask_login import current_user
 from paypal import load_paypal_default, create_paypal_order, capture_paypal_order
 # Import database models
 from models import SophiaSettings
-# Import scheduler
-from scheduler import start_scheduler
+from settings_cache import invalidate_settings
+# Scheduler and bots run in one elected process (see leader.py)
+from leader import start_background_services
+# Import background image jobs
+from image_jobs import image_job_queue
+# Registers the image_url() template helper for image renditions
+import image_derivatives  # noqa: F401
 
 # Configure session lifetime for "Remember Me" feature
 app.permanent_session_lifetime = timedelta(days=30)  # Session lasts for 30 days if permanent
 
+# Resume image jobs queued before a restart (safe in every worker: each job is claimed atomically)
+image_job_queue.start()
+
+# Every worker campaigns; only the lease holder runs the scheduler and the Instagram/Telegram bots
+start_background_services()
+
 # Home route
 @app.route('/')
 def index():
@@ -107,6 +118,7 @@ def api_settings():
         
         # Save changes
         db.session.commit()
+        invalidate_settings()
         
         return jsonify({'success': True, 'message': 'Settings saved successfully'})
     
@@ -154,9 +166,5 @@ def paypal_capture_order(order_id):
     return capture_paypal_order(request, jsonify)
 
 if __name__ == "__main__":
-    # Start the content scheduler
-    start_scheduler()
-    print("Content scheduler started")
-    
     # Start the Flask server on port 5000, accessible externally
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,272 @@
+import os
+import uuid
+import base64
+import codecs
+import logging
+import tempfile
+from datetime import datetime
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Where generated media is served from
+GENERATED_DIR = os.path.join("static", "generated")
+
+# Read size for streamed HTTP responses
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def unique_media_name(prefix, extension):
+    """File name for generated media that can't collide with one saved in the same second"""
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    return f"{prefix}_{timestamp}_{uuid.uuid4().hex[:12]}.{extension}"
+
+class Base64Writer:
+    """
+    Decodes base64 text written in arbitrary pieces straight into a binary file
+
+    Only whole 4-character groups are decoded at a time; the remainder is kept
+    for the next piece, so memory use is bounded by the piece size.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self._tail = ""
+
+    def write(self, text):
+        if self._tail:
+            text = self._tail + text
+        if "\n" in text or "\r" in text or " " in text:
+            # Line-wrapped base64
+            text = "".join(text.split())
+
+        usable = len(text) - len(text) % 4
+        if usable:
+            self.fileobj.write(base64.b64decode(text[:usable]))
+        self._tail = text[usable:]
+
+    def close(self):
+        """Decode whatever is left, padding it if the sender dropped the '=' padding"""
+        if self._tail:
+            self.fileobj.write(base64.b64decode(self._tail + "=" * (-len(self._tail) % 4)))
+            self._tail = ""
+
+
+class MediaSink:
+    """
+    Writes generated media to a temp file next to its final location
+
+    commit() renames the finished file into place atomically under a unique
+    name, so a half-written file is never served; discard() (or leaving a
+    with-block on an exception) removes it.
+    """
+
+    def __init__(self, prefix, extension, directory=GENERATED_DIR):
+        self.prefix = prefix
+        self.extension = extension
+        self.directory = directory
+        self.size = 0
+
+        os.makedirs(directory, exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=directory, prefix=f".{prefix}_", suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+        self._b64 = None
+
+    def write(self, data):
+        """Append raw bytes"""
+        self._file.write(data)
+        self.size += len(data)
+
+    def write_b64(self, text):
+        """Append base64 text, decoding it as it arrives"""
+        if self._b64 is None:
+            self._b64 = Base64Writer(self)
+        self._b64.write(text)
+
+    def commit(self):
+        """
+        Move the finished file into place
+
+        Returns:
+            str: URL path of the saved file
+        """
+        if self._b64 is not None:
+            self._b64.close()
+        self._file.close()
+
+        while True:
+            path = os.path.join(self.directory, unique_media_name(self.prefix, self.extension))
+            try:
+                # link() refuses to overwrite, so a name clash can't replace another file
+                os.link(self.temp_path, path)
+                os.unlink(self.temp_path)
+                break
+            except FileExistsError:
+                continue
+            except OSError:
+                # Filesystem without hard links; the random suffix makes a clash practically impossible
+                os.replace(self.temp_path, path)
+                break
+
+        return "/" + path.replace(os.sep, "/")
+
+    def discard(self):
+        """Drop the partial file"""
+        try:
+            self._file.close()
+        finally:
+            try:
+                os.remove(self.temp_path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.discard()
+        return False
+
+
+def save_media(data=None, b64=None, prefix="image", extension="jpg"):
+    """
+    Save media given as bytes or base64 (a string or an iterable of string pieces)
+
+    Returns:
+        str: URL path of the saved file
+    """
+    with MediaSink(prefix, extension) as sink:
+        if data is not None:
+            sink.write(data)
+        elif isinstance(b64, str):
+            for start in range(0, len(b64), STREAM_CHUNK_SIZE):
+                sink.write_b64(b64[start:start + STREAM_CHUNK_SIZE])
+        else:
+            for piece in b64:
+                sink.write_b64(piece)
+        return sink.commit()
+
+def stream_json_strings(chunks, key, open_writer):
+    """
+    Stream the string value(s) of one top-level JSON key to writers without parsing the whole document
+
+    Handles a string value or an array of strings, e.g. {"images": ["...", "..."]}
+    from AUTOMATIC1111 or {"image": "..."} from the Colab notebook. Each string's
+    content is passed to open_writer()'s result in pieces as it arrives, so the
+    response body is never held in memory as a whole.
+
+    Args:
+        chunks (iterable): Response body as bytes chunks (e.g. response.iter_content())
+        key (str): Top-level key to extract
+        open_writer (callable): Returns a writer with write(text) and close() for each string
+
+    Returns:
+        int: Number of strings extracted
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+
+    # Scanner state outside the value we want
+    depth = 0
+    in_string = False
+    escaped = False
+    string_buffer = []
+    last_key = None
+
+    # Value state: None (scanning), 'value', 'array', 'string', 'done'
+    state = None
+    in_array = False
+    writer = None
+    count = 0
+
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        position = 0
+        length = len(text)
+
+        while position < length and state != "done":
+            if state == "string":
+                if escaped:
+                    # Base64 only ever needs "\/"; other escapes (e.g. wrapped lines) are dropped
+                    if text[position] == "/":
+                        writer.write("/")
+                    escaped = False
+                    position += 1
+                    continue
+
+                # Copy up to the next quote or backslash in one slice
+                quote = text.find('"', position)
+                backslash = text.find("\\", position, quote if quote != -1 else length)
+                end = backslash if backslash != -1 else (quote if quote != -1 else length)
+                if end > position:
+                    writer.write(text[position:end])
+                if end == length:
+                    position = end
+                    continue
+
+                if text[end] == "\\":
+                    escaped = True
+                    position = end + 1
+                    continue
+
+                # Closing quote
+                writer.close()
+                writer = None
+                count += 1
+                position = end + 1
+                state = "array" if in_array else "done"
+                continue
+
+            char = text[position]
+            position += 1
+
+            if state in ("value", "array"):
+                if char.isspace() or char == ",":
+                    continue
+                if char == '"':
+                    writer = open_writer()
+                    state = "string"
+                elif char == "[" and state == "value":
+                    in_array = True
+                    state = "array"
+                else:
+                    # ']' ends the array; anything else (null, numbers) isn't a string value
+                    state = "done"
+                continue
+
+            # Scanning the rest of the document for the key
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+                    last_key = "".join(string_buffer) if depth == 1 and string_buffer is not None else None
+                elif depth == 1 and string_buffer is not None:
+                    string_buffer.append(char)
+                    if len(string_buffer) > 256:
+                        # Too long to be the key; stop collecting it
+                        string_buffer = None
+                continue
+
+            if char == '"':
+                in_string = True
+                string_buffer = []
+            elif char == ":" and depth == 1 and last_key == key:
+                state = "value"
+            elif char in "{[":
+                depth += 1
+                last_key = None
+            elif char in "}]":
+                depth -= 1
+                last_key = None
+            elif char == ",":
+                last_key = None
+
+        if state == "done":
+            break
+
+    if writer is not None:
+        raise ValueError(f"Response ended in the middle of a '{key}' value")
+
+    return count
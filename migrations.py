@@ -0,0 +1,220 @@
+import logging
+import re
+import sys
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def _column_default_sql(column, dialect):
+    """Render a scalar column default as a SQL literal, or None if it has none"""
+    default = column.default
+    if default is None or not getattr(default, 'is_scalar', False):
+        return None
+
+    processor = column.type.literal_processor(dialect)
+    if processor is None:
+        return None
+
+    return processor(default.arg)
+
+# SQL run once to fill a column when it is first added to an existing table
+COLUMN_BACKFILLS = {
+    'conversation.message_count': (
+        "UPDATE conversation SET message_count = "
+        "(SELECT COUNT(*) FROM message WHERE message.conversation_id = conversation.id)"
+    ),
+}
+
+def add_missing_columns(engine, metadata):
+    """
+    Add columns that exist on the models but not yet in the database
+
+    db.create_all() only creates missing tables, so new columns on existing
+    tables (e.g. an existing instance/sophia.db) have to be added here.
+
+    Returns:
+        list: Names of the columns that were added, as "table.column"
+    """
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    added = []
+
+    with engine.begin() as connection:
+        for table in metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE {preparer.quote(table.name)} ADD COLUMN {preparer.quote(column.name)} {column_type}"
+
+                default_sql = _column_default_sql(column, engine.dialect)
+                if default_sql is not None:
+                    ddl += f" DEFAULT {default_sql}"
+
+                connection.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+                logger.info(f"Added missing column {table.name}.{column.name}")
+
+                backfill = COLUMN_BACKFILLS.get(f"{table.name}.{column.name}")
+                if backfill:
+                    result = connection.execute(text(backfill))
+                    logger.info(f"Backfilled {table.name}.{column.name} for {result.rowcount} rows")
+
+    return added
+
+def add_missing_indexes(engine, metadata):
+    """
+    Create indexes that are declared on the models but missing from the database
+
+    On PostgreSQL the indexes are built CONCURRENTLY so large tables stay
+    writable during the migration.
+
+    Returns:
+        list: Names of the indexes that were created
+    """
+    inspector = inspect(engine)
+    is_postgres = engine.dialect.name == 'postgresql'
+    created = []
+
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+
+            ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect))
+
+            if is_postgres:
+                # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+                ddl = ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                    connection.execute(text(ddl))
+            else:
+                with engine.begin() as connection:
+                    connection.execute(text(ddl))
+
+            created.append(index.name)
+            logger.info(f"Created missing index {index.name} on {table.name}")
+
+    if created and is_postgres:
+        # Refresh planner statistics so the new indexes are used straight away.
+        # Not done on SQLite: its statistics are never refreshed automatically, and
+        # stats taken while a table is small would keep steering it to full scans.
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("ANALYZE"))
+
+    return created
+
+def upgrade_schema(engine, metadata):
+    """Bring an existing database up to date with the current models"""
+    added = add_missing_columns(engine, metadata)
+    added += add_missing_indexes(engine, metadata)
+    return added
+
+def hot_queries():
+    """
+    The hottest queries in the app; none of them should need a full table scan
+
+    These are built with the same model helpers the app uses, so a change to
+    the real queries is checked too. Needs an app context.
+
+    Returns:
+        dict: Query name -> ORM query with sample parameters
+    """
+    from models import Conversation, Message, ContentPost
+
+    return {
+        'message_history': Message.history(1).limit(5),
+        'conversation_by_external_id': Conversation.for_external_id('12345', 'telegram').limit(1),
+        'conversation_by_user_id': Conversation.for_user(1, 'website').limit(1),
+        'due_scheduled_posts': ContentPost.due(datetime(2024, 1, 1)),
+    }
+
+def compile_query(query, dialect):
+    """Render an ORM query as SQL for a dialect, with its parameters inlined"""
+    return str(query.statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+# A Sort node in a PostgreSQL EXPLAIN line, at any depth
+SORT_NODE = re.compile(r"^(->\s+)?Sort\b(?!\s+(Key|Method|Space))")
+
+def _plan_problems(engine, connection, sql):
+    """Run EXPLAIN on a query and return the plan lines that indicate a full scan or sort"""
+    if engine.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + sql).fetchall()
+        plan = [row[-1] for row in rows]
+        problems = [
+            line for line in plan
+            if (line.startswith("SCAN") and "USING" not in line) or "TEMP B-TREE" in line
+        ]
+    else:
+        # Tiny tables make a sequential scan the cheapest plan, so ask the planner
+        # whether it *can* use an index at all
+        connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        rows = connection.exec_driver_sql("EXPLAIN " + sql).fetchall()
+        plan = [row[0] for row in rows]
+        # Nested nodes are printed as "->  Sort" (two spaces), top-level ones as "Sort"
+        problems = [line.strip() for line in plan if "Seq Scan" in line or SORT_NODE.match(line.strip())]
+
+    return plan, problems
+
+def check_query_plans(engine):
+    """
+    EXPLAIN each of the hot queries and report any that fall back to a full scan
+
+    Needs an app context, to build the queries.
+
+    Returns:
+        dict: Query name -> list of problem plan lines, for queries that regressed
+    """
+    regressions = {}
+
+    with engine.begin() as connection:
+        for name, query in hot_queries().items():
+            plan, problems = _plan_problems(engine, connection, compile_query(query, engine.dialect))
+            logger.info(f"Query plan for {name}: {' | '.join(plan)}")
+            if problems:
+                regressions[name] = problems
+
+    return regressions
+
+if __name__ == "__main__":
+    # Usage: python migrations.py
+    # Builds the schema in a temporary SQLite database and fails if any hot query needs a
+    # full scan there. The configured database is never touched: importing app creates and
+    # upgrades the schema of DATABASE_URL, so that is pointed at the temporary file first.
+    import os
+    import shutil
+    import tempfile
+
+    scratch_dir = tempfile.mkdtemp(prefix="query_plans_")
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(scratch_dir, "query_plans.db")
+    try:
+        from app import app, db
+
+        with app.app_context():
+            regressions = check_query_plans(db.engine)
+            db.engine.dispose()
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    for name, problems in regressions.items():
+        print(f"FULL SCAN in {name}: {'; '.join(problems)}")
+
+    if regressions:
+        sys.exit(1)
+
+    print("All hot queries use indexes")
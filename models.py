@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy import event
 from app import db
 # from flask_login import UserMixin
 import json
@@ -70,6 +71,12 @@ class User(db.Model):
 
 
 class Conversation(db.Model):
+    __table_args__ = (
+        # Lookups by platform user (bots) and by logged-in user (web chat)
+        db.Index('ix_conversation_external_id_source', 'external_id', 'source'),
+        db.Index('ix_conversation_user_id_source', 'user_id', 'source'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     source = db.Column(db.String(20), default="website")  # website, instagram, telegram
@@ -80,35 +87,65 @@ class Conversation(db.Model):
     # Store detected language
     detected_language = db.Column(db.String(10), default="en")
     
+    # Number of messages in this conversation, kept in step with Message inserts
+    # so the social free-trial check doesn't have to COUNT the message table
+    message_count = db.Column(db.Integer, default=0)
+    
     # Relationships
     messages = db.relationship('Message', backref='conversation', lazy='dynamic')
     
+    @classmethod
+    def for_user(cls, user_id, source):
+        """Query for a logged-in user's conversation on a source"""
+        return cls.query.filter_by(user_id=user_id, source=source)
+    
+    @classmethod
+    def for_external_id(cls, external_id, source):
+        """Query for a platform user's conversation (e.g. a Telegram or Instagram user id)"""
+        return cls.query.filter_by(external_id=external_id, source=source)
+    
     def __repr__(self):
         return f'<Conversation {self.id} from {self.source}>'
 
 
 class Message(db.Model):
+    __table_args__ = (
+        # Conversation history: filter by conversation, newest first
+        db.Index('ix_message_conversation_id_timestamp', 'conversation_id', 'timestamp'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     conversation_id = db.Column(db.Integer, db.ForeignKey('conversation.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
     is_from_user = db.Column(db.Boolean, default=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
+    @classmethod
+    def history(cls, conversation_id):
+        """Query for a conversation's messages, newest first"""
+        return cls.query.filter_by(conversation_id=conversation_id).order_by(cls.timestamp.desc())
+    
     def __repr__(self):
         return f'<Message {self.id} {"from user" if self.is_from_user else "from Sophia"}>'
 
 
 class ContentPost(db.Model):
+    __table_args__ = (
+        # Scheduler: due posts by status and scheduled time
+        db.Index('ix_content_post_status_scheduled_for', 'status', 'scheduled_for'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200))
     caption = db.Column(db.Text)
     hashtags = db.Column(db.Text)
     image_url = db.Column(db.String(500))
     image_prompt = db.Column(db.Text)
+    image_seed = db.Column(db.BigInteger, nullable=True)  # Stable Diffusion seed of the post's image
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     scheduled_for = db.Column(db.DateTime, nullable=True)
     published_at = db.Column(db.DateTime, nullable=True)
-    status = db.Column(db.String(20), default="draft")  # draft, scheduled, published, failed
+    status = db.Column(db.String(20), default="draft")  # draft, rendering (image pending), scheduled, published, failed
     
     # Content type (image, reel, video)
     content_type = db.Column(db.String(20), default="image")
@@ -122,6 +159,11 @@ class ContentPost(db.Model):
     # Error information if publishing failed
     error_message = db.Column(db.Text, nullable=True)
     
+    @classmethod
+    def due(cls, now):
+        """Query for scheduled posts whose time has come"""
+        return cls.query.filter(cls.status == "scheduled", cls.scheduled_for <= now)
+    
     def get_platforms(self):
         return self.platforms.split(',')
     
@@ -132,6 +174,89 @@ class ContentPost(db.Model):
         return f'<ContentPost {self.id} status={self.status}>'
 
 
+class ImageJob(db.Model):
+    __table_args__ = (
+        # Worker startup: find queued/interrupted jobs, oldest first
+        db.Index('ix_image_job_status_created_at', 'status', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    prompt = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default="queued")  # queued, running, completed, failed
+    
+    # What the image is for: a content post, or a user's /api/generate_image request
+    post_id = db.Column(db.Integer, db.ForeignKey('content_post.id', ondelete='SET NULL'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    
+    # Result
+    image_url = db.Column(db.String(500), nullable=True)
+    error_message = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, default=0)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # Refreshed by the running worker; stale means it died
+    completed_at = db.Column(db.DateTime, nullable=True)
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "post_id": self.post_id,
+            "image_url": self.image_url,
+            "error": self.error_message,
+            "created_at": self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            "completed_at": self.completed_at.strftime('%Y-%m-%d %H:%M:%S') if self.completed_at else None
+        }
+    
+    def __repr__(self):
+        return f'<ImageJob {self.id} status={self.status}>'
+
+
+class InstagramCommentCursor(db.Model):
+    """How far the Instagram bot has read the comments of one media"""
+    media_id = db.Column(db.String(64), primary_key=True)
+    last_comment_pk = db.Column(db.BigInteger, default=0)  # Newest comment already handled
+    comment_count = db.Column(db.Integer, default=0)  # Media's comment count when last read
+    checked_at = db.Column(db.DateTime, nullable=True)  # When the comments were last fetched
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<InstagramCommentCursor {self.media_id} last={self.last_comment_pk}>'
+
+
+class LeaderLease(db.Model):
+    """Time-limited lock row: the process named in holder runs the background services until expires_at"""
+    name = db.Column(db.String(64), primary_key=True)
+    holder = db.Column(db.String(128), nullable=False)  # host:pid:random of the leader
+    expires_at = db.Column(db.DateTime, nullable=False)
+    acquired_at = db.Column(db.DateTime, default=datetime.utcnow)
+    renewed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<LeaderLease {self.name} holder={self.holder}>'
+
+
+class GpuSlot(db.Model):
+    """One of GPU_MAX_CONCURRENCY deployment-wide image generation slots, held by holder until expires_at"""
+    slot = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    holder = db.Column(db.String(128), nullable=True)  # host:pid:random of the generating thread, None if free
+    expires_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<GpuSlot {self.slot} holder={self.holder}>'
+
+
+class ScheduleVersion(db.Model):
+    """Counter bumped whenever a process changes scheduled posts, so the scheduler in the leader reloads"""
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ScheduleVersion {self.name} v{self.version}>'
+
+
 class SophiaSettings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     personality = db.Column(db.Text, default='flirty, sensual, supportive, playful')
@@ -196,6 +321,9 @@ class SophiaSettings(db.Model):
     instagram_settings = db.Column(db.Text, default='{"hashtag_count": 5, "emoji_level": "medium"}')
     telegram_settings = db.Column(db.Text, default='{"use_stickers": true, "auto_reply": true}')
     
+    # Bumped on every update so each worker's settings cache can tell it is stale
+    version = db.Column(db.Integer, default=1)
+    
     # Get and set methods for JSON fields
     def get_instagram_settings(self):
         return json.loads(self.instagram_settings)
@@ -217,3 +345,32 @@ class SophiaSettings(db.Model):
     
     def __repr__(self):
         return f'<SophiaSettings {self.id}>'
+
+
+@event.listens_for(SophiaSettings, 'before_update')
+def bump_settings_version(mapper, connection, target):
+    """Increment the settings version whenever the row changes"""
+    # Incremented by the database, so concurrent saves from different processes each get a new version
+    target.version = db.func.coalesce(SophiaSettings.version, 0) + 1
+
+
+@event.listens_for(Message, 'after_insert')
+def increment_conversation_message_count(mapper, connection, target):
+    """Bump the conversation's message counter in the same transaction as the insert"""
+    conversation_table = Conversation.__table__
+    connection.execute(
+        conversation_table.update()
+        .where(conversation_table.c.id == target.conversation_id)
+        .values(message_count=db.func.coalesce(conversation_table.c.message_count, 0) + 1)
+    )
+
+
+@event.listens_for(Message, 'after_delete')
+def decrement_conversation_message_count(mapper, connection, target):
+    """Keep the conversation's message counter correct when a message is deleted"""
+    conversation_table = Conversation.__table__
+    connection.execute(
+        conversation_table.update()
+        .where(conversation_table.c.id == target.conversation_id)
+        .values(message_count=conversation_table.c.message_count - 1)
+    )
@@ -2,7 +2,8 @@ import logging
 import os
 from flask import request, jsonify
 from app import app, db
-from models import User, SophiaSettings
+from models import User
+from settings_cache import get_settings
 import json
 
 # Configure logging
@@ -17,7 +18,7 @@ def load_paypal_default(req, res):
     """
     try:
         # Get PayPal settings from database
-        settings = SophiaSettings.query.first()
+        settings = get_settings()
         if not settings:
             logger.error("No settings found in database")
             return res.json({"error": "Payment system not configured"}), 500
@@ -56,7 +57,7 @@ def create_paypal_order(req, res):
             return res.json({"error": "Amount is required"}), 400
         
         # Get PayPal settings
-        settings = SophiaSettings.query.first()
+        settings = get_settings()
         if not settings:
             return res.json({"error": "Payment system not configured"}), 500
         
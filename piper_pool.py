@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import wave
+import queue
+import atexit
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+from collections import deque
+
+from config import Config
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class PiperError(Exception):
+    """A Piper process failed, timed out or couldn't be started"""
+
+
+def _scratch_dir():
+    # Utterances only live until they are read back, so keep them in memory when possible
+    return "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+class PiperWorker:
+    """
+    One long-lived Piper process with a single voice model loaded
+
+    Piper runs with --json-input and --output_dir: every request is one JSON
+    line on stdin ({"text": ...}, so newlines in the text can't split it), and
+    Piper answers with one line on stdout, the path of the WAV it wrote. The
+    WAV is read back as PCM and removed.
+    """
+
+    def __init__(self, voice_id, command):
+        self.voice_id = voice_id
+        self.command = command
+        self.process = None
+        self.output_dir = None
+        self.started_at = 0
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._lines = None
+        self._stderr = deque(maxlen=20)
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stderr_tail(self):
+        """Last lines Piper logged, for error messages"""
+        return " | ".join(self._stderr)
+
+    def _start(self):
+        self.output_dir = tempfile.mkdtemp(prefix=f"piper_{self.voice_id}_", dir=_scratch_dir())
+        self._lines = queue.Queue()
+        self._stderr.clear()
+
+        self.process = subprocess.Popen(
+            self.command + ["--output_dir", self.output_dir, "--json-input"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        self.started_at = time.monotonic()
+
+        # Drain both pipes on their own threads; an unread stderr would eventually block Piper
+        threading.Thread(target=self._read_stdout, args=(self.process, self._lines),
+                         name=f"piper-{self.voice_id}-out", daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(self.process,),
+                         name=f"piper-{self.voice_id}-err", daemon=True).start()
+        logger.info(f"Started Piper for voice {self.voice_id} (pid {self.process.pid})")
+
+    @staticmethod
+    def _read_stdout(process, lines):
+        for line in iter(process.stdout.readline, b""):
+            lines.put(line.decode("utf-8", "replace").strip())
+        lines.put(None)  # EOF: the process exited
+
+    def _read_stderr(self, process):
+        for line in iter(process.stderr.readline, b""):
+            self._stderr.append(line.decode("utf-8", "replace").strip())
+
+    def _stop(self):
+        process, output_dir = self.process, self.output_dir
+        self.process = None
+        self.output_dir = None
+
+        if process is not None:
+            if process.poll() is None:
+                process.terminate()
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+            for pipe in (process.stdin, process.stdout, process.stderr):
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
+
+        if output_dir:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    def _ensure_running(self, restart_backoff):
+        if self.alive():
+            return
+
+        if self.process is not None:
+            logger.warning(f"Piper for voice {self.voice_id} exited with code {self.process.returncode}: {self.stderr_tail()}")
+            # Don't spin on a voice that crashes as soon as it starts (e.g. a missing model)
+            if time.monotonic() - self.started_at < restart_backoff:
+                raise PiperError(f"Piper for voice {self.voice_id} is crashing; not restarting yet")
+            self.restarts += 1
+
+        self._stop()
+        self._start()
+
+    def ensure_running(self, restart_backoff=0):
+        """Restart the process if it has died; skipped if a request is using the worker right now"""
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._ensure_running(restart_backoff)
+        finally:
+            self._lock.release()
+
+    def synthesize(self, text, timeout, restart_backoff=0):
+        """
+        Synthesize one utterance
+
+        Returns:
+            tuple: (pcm_bytes, sample_rate) of 16-bit mono audio
+
+        Raises:
+            PiperError: If the process died, timed out or returned something unreadable
+        """
+        with self._lock:
+            self._ensure_running(restart_backoff)
+
+            try:
+                self.process.stdin.write((json.dumps({"text": text}) + "\n").encode("utf-8"))
+                self.process.stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                raise PiperError(f"Piper for voice {self.voice_id} stopped accepting input: {str(e)}")
+
+            try:
+                path = self._lines.get(timeout=timeout)
+            except queue.Empty:
+                # A hung process would answer this request later and shift every reply after it; replace it
+                self._stop()
+                raise PiperError(f"Piper for voice {self.voice_id} timed out after {timeout}s")
+
+            if path is None:
+                raise PiperError(f"Piper for voice {self.voice_id} exited: {self.stderr_tail()}")
+
+            try:
+                with wave.open(path, "rb") as wav_file:
+                    return wav_file.readframes(wav_file.getnframes()), wav_file.getframerate()
+            except (OSError, EOFError, wave.Error) as e:
+                raise PiperError(f"Unreadable Piper output {path}: {str(e)}")
+            finally:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stop(self):
+        with self._lock:
+            self._stop()
+
+
+class PiperPool:
+    """
+    Long-lived Piper processes, one per voice, started on first use
+
+    Loading a voice model takes far longer than synthesizing a short reply,
+    so processes stay up between requests. Requests for one voice are served
+    in turn by its process. A monitor thread restarts processes that crashed,
+    so the model is loaded again before the next request needs it.
+    """
+
+    def __init__(self, binary=None, voices_dir=None, request_timeout=None,
+                 health_check_interval=None, restart_backoff=None):
+        self.binary = binary or Config.PIPER_BINARY
+        self.voices_dir = voices_dir or Config.PIPER_VOICES_DIR
+        self.request_timeout = request_timeout or Config.PIPER_REQUEST_TIMEOUT
+        self.health_check_interval = health_check_interval or Config.PIPER_HEALTH_CHECK_INTERVAL
+        self.restart_backoff = restart_backoff if restart_backoff is not None else Config.PIPER_RESTART_BACKOFF
+        self._lock = threading.Lock()
+        self._workers = {}
+        self._monitor = None
+        self._stopping = threading.Event()
+
+    def _command(self, voice_id):
+        return self.binary.split() + ["--model", os.path.join(self.voices_dir, f"{voice_id}.onnx")]
+
+    def worker(self, voice_id):
+        """The worker for a voice, created (but not started) if needed"""
+        with self._lock:
+            worker = self._workers.get(voice_id)
+            if worker is None:
+                worker = PiperWorker(voice_id, self._command(voice_id))
+                self._workers[voice_id] = worker
+
+            if self._monitor is None:
+                self._monitor = threading.Thread(target=self._monitor_loop, name="piper-monitor", daemon=True)
+                self._monitor.start()
+            return worker
+
+    def warm(self, voice_ids):
+        """Start the processes for these voices ahead of the first request"""
+        for voice_id in voice_ids:
+            try:
+                self.worker(voice_id).ensure_running()
+            except Exception as e:
+                logger.error(f"Could not start Piper for voice {voice_id}: {str(e)}")
+
+    def synthesize(self, voice_id, text):
+        """
+        Synthesize text with a voice
+
+        Returns:
+            tuple or None: (pcm_bytes, sample_rate) of 16-bit mono audio, or None if Piper failed
+        """
+        if not text or not text.strip():
+            return None
+
+        try:
+            return self.worker(voice_id).synthesize(text, self.request_timeout, self.restart_backoff)
+        except Exception as e:
+            logger.error(f"Error generating speech with Piper: {str(e)}")
+            return None
+
+    def check_health(self):
+        """Restart any process that has exited"""
+        with self._lock:
+            workers = list(self._workers.values())
+
+        for worker in workers:
+            if worker.process is not None and not worker.alive():
+                try:
+                    worker.ensure_running(self.restart_backoff)
+                except Exception as e:
+                    logger.error(f"Could not restart Piper for voice {worker.voice_id}: {str(e)}")
+
+    def _monitor_loop(self):
+        while not self._stopping.wait(self.health_check_interval):
+            self.check_health()
+
+    def shutdown(self):
+        """Stop every Piper process"""
+        self._stopping.set()
+        with self._lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+
+        for worker in workers:
+            worker.stop()
+
+
+# Create global Piper pool
+piper_pool = PiperPool()
+atexit.register(piper_pool.shutdown)
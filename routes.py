@@ -1,22 +1,28 @@
 import logging
 import os
 import json
-import shutil
 from flask import render_template, redirect, url_for, request, flash, jsonify, session, abort
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
-from flask_socketio import emit
+from flask_socketio import emit, join_room
 from langdetect import detect
 from datetime import datetime, timedelta
 
 from app import app, db, socketio
-from models import User, Conversation, Message, ContentPost, SophiaSettings
+from models import User, Conversation, Message, ContentPost, SophiaSettings, ImageJob
 from ai_service import generate_text_response, analyze_user_message
-from content_generator import generate_content, generate_image
+from content_generator import generate_content
 from social_media import publish_to_instagram, publish_to_telegram
-from language_processor import translate_text, detect_language
-from tts_service import generate_speech, get_available_voices
+from language_processor import translate_text, detect_conversation_language
+from tts_service import generate_speech, get_available_voices, audio_url
 from paypal import load_paypal_default, create_paypal_order, capture_paypal_order
+from settings_cache import get_settings, invalidate_settings
+from chat_queue import chat_executor
+from chat_store import save_turn
+from voice_stream import VoiceReplyStream
+from image_jobs import image_job_queue
+from scheduler import content_scheduler
+from image_derivatives import image_url
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -30,10 +36,19 @@ def get_or_create_settings():
         db.session.commit()
     return settings
 
+def get_cached_settings():
+    """Get the read-only settings snapshot, creating the settings row if needed"""
+    settings = get_settings()
+    if settings is None:
+        get_or_create_settings()
+        invalidate_settings()
+        settings = get_settings()
+    return settings
+
 def get_or_create_conversation(user_id=None, source="website", external_id=None):
     # For logged in users
     if user_id:
-        conversation = Conversation.query.filter_by(user_id=user_id, source=source).first()
+        conversation = Conversation.for_user(user_id, source).first()
         if not conversation:
             conversation = Conversation(user_id=user_id, source=source)
             db.session.add(conversation)
@@ -42,7 +57,7 @@ def get_or_create_conversation(user_id=None, source="website", external_id=None)
     
     # For anonymous users
     if external_id:
-        conversation = Conversation.query.filter_by(external_id=external_id, source=source).first()
+        conversation = Conversation.for_external_id(external_id, source).first()
         if not conversation:
             conversation = Conversation(external_id=external_id, source=source)
             db.session.add(conversation)
@@ -99,7 +114,7 @@ def logout():
 @app.route('/subscription')
 def subscription():
     """Subscription page for premium features"""
-    settings = get_or_create_settings()
+    settings = get_cached_settings()
     
     # Check if user is already a paid user
     if current_user.is_authenticated and current_user.is_paid:
@@ -122,7 +137,7 @@ def admin():
     # Fetch data for admin dashboard
     conversations = Conversation.query.order_by(Conversation.last_interaction.desc()).limit(10).all()
     posts = ContentPost.query.order_by(ContentPost.created_at.desc()).limit(10).all()
-    settings = get_or_create_settings()
+    settings = get_cached_settings()
     
     # Stats
     total_users = User.query.count()
@@ -255,6 +270,9 @@ def api_settings():
             settings.set_paypal_settings(paypal_settings)
         
         db.session.commit()
+        
+        # Drop this worker's cached snapshot; other workers see the new version stamp
+        invalidate_settings()
         return jsonify({"success": True})
     
     return jsonify({
@@ -294,27 +312,37 @@ def api_generate_image():
         return jsonify({"error": "Image prompt is required"}), 400
         
     try:
-        # Generate image with Stable Diffusion
-        image_url = generate_image(prompt)
-        
-        if not image_url:
-            return jsonify({"error": "Failed to generate image"}), 500
-            
-        # Decrement the user's daily quota if not admin
+        # Take the daily credit up front so queued jobs can't exceed the quota;
+        # it is given back if the job fails
         if not current_user.is_admin:
             current_user.daily_image_limit -= 1
             db.session.commit()
+        
+        # Queue the image for Stable Diffusion; the client polls the job or listens on Socket.IO
+        job = image_job_queue.submit(prompt, user_id=current_user.id)
             
         return jsonify({
             "success": True, 
-            "image_url": image_url,
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": url_for('api_image_job', job_id=job.id),
             "remaining_quota": current_user.daily_image_limit if not current_user.is_admin else "unlimited"
-        })
+        }), 202
         
     except Exception as e:
         logger.error(f"Error generating image: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/image_jobs/<int:job_id>')
+@login_required
+def api_image_job(job_id):
+    """Status of an image generation job, with the image URL once it has completed"""
+    job = db.session.get(ImageJob, job_id)
+    if not job or (not current_user.is_admin and job.user_id != current_user.id):
+        return jsonify({"error": "Job not found"}), 404
+    
+    return jsonify(job.to_dict())
+
 @app.route('/api/voice_call', methods=['POST'])
 @login_required
 def api_voice_call():
@@ -350,7 +378,7 @@ def api_voice_call():
             
         return jsonify({
             "success": True, 
-            "audio_url": audio_path,
+            "audio_url": audio_url(audio_path),
             "duration_minutes": duration_minutes,
             "remaining_minutes": current_user.daily_call_minutes if not current_user.is_admin else "unlimited"
         })
@@ -379,6 +407,8 @@ def api_content():
                 "title": post.title,
                 "caption": post.caption[:100] + "..." if len(post.caption) > 100 else post.caption,
                 "status": post.status,
+                "image_url": post.image_url,
+                "thumbnail_url": image_url(post.image_url, 'thumb'),
                 "created_at": post.created_at.strftime('%Y-%m-%d %H:%M'),
                 "scheduled_for": post.scheduled_for.strftime('%Y-%m-%d %H:%M') if post.scheduled_for else None,
                 "published_at": post.published_at.strftime('%Y-%m-%d %H:%M') if post.published_at else None
@@ -400,7 +430,7 @@ def api_content():
             style = data.get('style', '')
             platforms = data.get('platforms', ['instagram', 'telegram'])
             
-            settings = get_or_create_settings()
+            settings = get_cached_settings()
             
             try:
                 # Generate content using AI
@@ -436,14 +466,16 @@ def api_content():
                 db.session.add(post)
                 db.session.commit()
                 
-                # Generate image asynchronously (in a real implementation, this would be a background task)
-                image_url = generate_image(post.image_prompt)
-                post.image_url = image_url
-                db.session.commit()
+                if post.status == "scheduled":
+                    content_scheduler.schedule(post.id, post.scheduled_for)
+                
+                # Generate the image in the background; the job sets post.image_url when done
+                job = image_job_queue.submit(post.image_prompt, post_id=post.id)
                 
                 return jsonify({
                     "success": True,
                     "post_id": post.id,
+                    "image_job_id": job.id,
                     "message": "Content created successfully"
                 })
                 
@@ -468,15 +500,10 @@ def api_content():
         post.caption = data.get('caption', post.caption)
         post.hashtags = data.get('hashtags', post.hashtags)
         
-        if 'image_prompt' in data:
+        # The image is generated in the background once the post is saved
+        regenerate_image = 'image_prompt' in data
+        if regenerate_image:
             post.image_prompt = data['image_prompt']
-            # Generate image based on prompt (in real implementation this would be async)
-            try:
-                image_url = generate_image(post.image_prompt)
-                post.image_url = image_url
-            except Exception as e:
-                logger.error(f"Error generating image: {str(e)}")
-                return jsonify({"error": f"Error generating image: {str(e)}"}), 500
                 
         if 'platforms' in data:
             post.set_platforms(data['platforms'])
@@ -505,10 +532,19 @@ def api_content():
         db.session.add(post)
         db.session.commit()
         
-        return jsonify({
+        # Wake the scheduler if this post is due before anything it is waiting for
+        content_scheduler.schedule(post.id, post.scheduled_for if post.status == "scheduled" else None)
+        
+        response = {
             "success": True,
             "post_id": post.id
-        })
+        }
+        
+        if regenerate_image:
+            job = image_job_queue.submit(post.image_prompt, post_id=post.id)
+            response["image_job_id"] = job.id
+        
+        return jsonify(response)
     
     elif request.method == 'DELETE':
         post_id = request.args.get('id')
@@ -519,8 +555,10 @@ def api_content():
         if not post:
             return jsonify({"error": "Post not found"}), 404
             
+        deleted_id = post.id
         db.session.delete(post)
         db.session.commit()
+        content_scheduler.schedule(deleted_id, None)
         
         return jsonify({"success": True})
 
@@ -541,9 +579,7 @@ def api_chat_history():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     
-    messages = Message.query.filter_by(conversation_id=conversation.id)\
-        .order_by(Message.timestamp.desc())\
-        .paginate(page=page, per_page=per_page)
+    messages = Message.history(conversation.id).paginate(page=page, per_page=per_page)
     
     # Format messages for the client
     message_list = []
@@ -572,6 +608,81 @@ def socket_connect():
 def socket_disconnect():
     logger.debug("Client disconnected from Socket.IO")
 
+@socketio.on('watch_image_job')
+def handle_watch_image_job(data):
+    """Subscribe the client to 'image_job' status events for one job"""
+    job_id = data.get('job_id')
+    job = db.session.get(ImageJob, job_id) if job_id else None
+    if not job or not current_user.is_authenticated or \
+            (not current_user.is_admin and job.user_id != current_user.id):
+        emit('image_job', {'id': job_id, 'error': 'Job not found'})
+        return
+    
+    join_room(f"image_job:{job.id}")
+    # Send the current state in case the job finished before the client subscribed
+    emit('image_job', job.to_dict())
+
+def emit_image_job_update(job):
+    socketio.emit('image_job', job, to=f"image_job:{job['id']}")
+
+image_job_queue.add_listener(emit_image_job_update)
+
+def process_chat_message(sid, conversation_id, user_message, stream=False):
+    """
+    Generate and save the reply to a chat message on a chat worker thread
+    
+    Runs outside the Socket.IO handler, so results are emitted to the
+    originating client's room (its session id) instead of via emit().
+    """
+    received_at = datetime.utcnow()
+    
+    with app.app_context():
+        try:
+            conversation = db.session.get(Conversation, conversation_id)
+            if not conversation:
+                socketio.emit('response', {'error': 'Conversation not found'}, to=sid)
+                return
+            
+            # Detect language, keeping the conversation's language unless it clearly changed
+            detected_lang = detect_conversation_language(conversation, user_message)
+            
+            # Analyze the message intent and sentiment
+            analysis = analyze_user_message(user_message, language=detected_lang)
+            
+            # Stream partial replies to the client as they arrive if requested
+            on_chunk = None
+            if stream:
+                def on_chunk(chunk):
+                    socketio.emit('response_chunk', {'chunk': chunk}, to=sid)
+            
+            # Generate AI response
+            settings = get_cached_settings()
+            ai_response = generate_text_response(
+                user_message, 
+                conversation_id=conversation.id,
+                flirt_level=settings.flirt_level,
+                language=detected_lang,
+                model_name=getattr(settings, 'kobold_model', None),
+                nsfw=settings.allow_nsfw,
+                on_chunk=on_chunk,
+                analysis=analysis
+            )
+            
+            # Save the user message, AI response and conversation updates in one transaction
+            saved = save_turn(conversation, user_message, ai_response, language=detected_lang, received_at=received_at)
+            
+            # Send the final response back to the client once it is saved
+            socketio.emit('response', {
+                'message': ai_response,
+                'message_id': saved['message_id'],
+                'timestamp': saved['timestamp'].strftime('%Y-%m-%d %H:%M:%S')
+            }, to=sid)
+            
+        except Exception as e:
+            logger.error(f"Error processing message: {str(e)}")
+            db.session.rollback()
+            socketio.emit('response', {'error': 'Sorry, I encountered an error processing your message.'}, to=sid)
+
 @socketio.on('message')
 def handle_message(data):
     logger.debug(f"Received message: {data}")
@@ -583,67 +694,146 @@ def handle_message(data):
         return
     
     try:
-        # Get the appropriate conversation
+        # Get the appropriate conversation (needs the request session, so resolve it here)
         if current_user.is_authenticated:
             conversation = get_or_create_conversation(user_id=current_user.id)
+            user_key = f"user:{current_user.id}"
         else:
             conversation = get_or_create_conversation()
-        
-        # Detect language
-        try:
-            detected_lang = detect_language(user_message)
-            if detected_lang != conversation.detected_language:
-                conversation.detected_language = detected_lang
-                db.session.commit()
-        except:
-            # If language detection fails, use English as fallback
-            detected_lang = 'en'
-        
-        # Save user message
-        user_msg = Message(
-            conversation_id=conversation.id,
-            content=user_message,
-            is_from_user=True
+            user_key = f"conversation:{conversation.id}"
+        
+        # Hand the slow work (language detection, DB writes, LLM call) to the chat worker pool
+        future = chat_executor.submit(
+            user_key,
+            process_chat_message,
+            request.sid,
+            conversation.id,
+            user_message,
+            bool(data.get('stream'))
         )
-        db.session.add(user_msg)
         
-        # Update conversation last interaction time
-        conversation.last_interaction = datetime.utcnow()
-        db.session.commit()
+        if future is None:
+            emit('busy', {'error': "I'm a little busy right now, please try again in a moment! 💭"})
         
-        # Analyze the message intent and sentiment
-        analysis = analyze_user_message(user_message)
-        
-        # Generate AI response
-        settings = get_or_create_settings()
-        ai_response = generate_text_response(
-            user_message, 
-            conversation_id=conversation.id,
-            flirt_level=settings.flirt_level,
-            language=detected_lang,
-            model_name=settings.kobold_model,
-            nsfw=settings.allow_nsfw
-        )
+    except Exception as e:
+        logger.error(f"Error processing message: {str(e)}")
+        emit('response', {'error': 'Sorry, I encountered an error processing your message.'})
+
+def process_voice_message(sid, conversation_id, user_message, turn_id, user_id=None, voice_id='female_sensual'):
+    """
+    Generate the reply to something said on a voice call and stream it back as audio
+    
+    The reply is split into sentences while it streams from the LLM, each
+    sentence is synthesized on the TTS pool as soon as it is complete, and every
+    finished segment is emitted as 'voice_segment' with its index so the client
+    can play them in order. 'voice_done' gives the full text and segment count.
+    """
+    received_at = datetime.utcnow()
+    
+    def on_segment(index, text, segment_url):
+        socketio.emit('voice_segment', {
+            'turn_id': turn_id,
+            'index': index,
+            'text': text,
+            'audio_url': segment_url
+        }, to=sid)
+    
+    with app.app_context():
+        try:
+            conversation = db.session.get(Conversation, conversation_id)
+            if not conversation:
+                socketio.emit('voice_done', {'turn_id': turn_id, 'error': 'Conversation not found'}, to=sid)
+                return
+            
+            detected_lang = detect_conversation_language(conversation, user_message)
+            analysis = analyze_user_message(user_message, language=detected_lang)
+            
+            speech = VoiceReplyStream(on_segment, voice_id=voice_id)
+            streamed = []
+            
+            def on_chunk(chunk):
+                streamed.append(chunk)
+                speech.add_text(chunk)
+            
+            settings = get_cached_settings()
+            ai_response = generate_text_response(
+                user_message,
+                conversation_id=conversation.id,
+                flirt_level=settings.flirt_level,
+                language=detected_lang,
+                model_name=getattr(settings, 'kobold_model', None),
+                nsfw=settings.allow_nsfw,
+                on_chunk=on_chunk,
+                analysis=analysis
+            )
+            
+            # Replies that weren't streamed (e.g. translated ones), or were generated again after the
+            # stream broke off, are split once they are complete
+            if "".join(streamed).strip() != ai_response:
+                speech.discard_partial()
+                speech.add_text(ai_response)
+            segment_count = speech.finish()
+            
+            saved = save_turn(conversation, user_message, ai_response, language=detected_lang, received_at=received_at)
+            
+            # Charge the call minutes for the reply, as /api/voice_call does. The reply length is only
+            # known now, so the charge is capped at what's left rather than driving the balance negative
+            if user_id is not None:
+                user = db.session.get(User, user_id)
+                if user and not user.is_admin:
+                    duration_minutes = max(1, len(ai_response) // 200)
+                    user.daily_call_minutes -= min(duration_minutes, max(0, user.daily_call_minutes))
+                    db.session.commit()
+            
+            socketio.emit('voice_done', {
+                'turn_id': turn_id,
+                'text': ai_response,
+                'count': segment_count,
+                'message_id': saved['message_id']
+            }, to=sid)
+            
+        except Exception as e:
+            logger.error(f"Error processing voice message: {str(e)}")
+            db.session.rollback()
+            socketio.emit('voice_done', {'turn_id': turn_id, 'error': 'Sorry, I encountered an error processing your message.'}, to=sid)
+
+@socketio.on('voice_message')
+def handle_voice_message(data):
+    user_message = data.get('message', '')
+    turn_id = data.get('turn_id')
+    if not user_message.strip():
+        emit('voice_done', {'turn_id': turn_id, 'error': 'Empty message'})
+        return
+    
+    # Same access rules as /api/voice_call
+    if not current_user.is_authenticated or (not current_user.is_admin and not current_user.is_paid):
+        emit('voice_done', {'turn_id': turn_id, 'error': 'This feature is only available for paid users'})
+        return
+    
+    if not current_user.is_admin and not current_user.can_make_call(1):
+        emit('voice_done', {'turn_id': turn_id, 'error': 'You have reached your daily limit of 10 minutes for voice calls'})
+        return
+    
+    try:
+        conversation = get_or_create_conversation(user_id=current_user.id)
         
-        # Save AI response
-        ai_msg = Message(
-            conversation_id=conversation.id,
-            content=ai_response,
-            is_from_user=False
+        future = chat_executor.submit(
+            f"user:{current_user.id}",
+            process_voice_message,
+            request.sid,
+            conversation.id,
+            user_message,
+            turn_id,
+            current_user.id,
+            data.get('voice_id', 'female_sensual')
         )
-        db.session.add(ai_msg)
-        db.session.commit()
         
-        # Send the response back to the client
-        emit('response', {
-            'message': ai_response,
-            'message_id': ai_msg.id,
-            'timestamp': ai_msg.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        })
+        if future is None:
+            emit('voice_done', {'turn_id': turn_id, 'error': "I'm a little busy right now, please try again in a moment! 💭"})
         
     except Exception as e:
-        logger.error(f"Error processing message: {str(e)}")
-        emit('response', {'error': 'Sorry, I encountered an error processing your message.'})
+        logger.error(f"Error processing voice message: {str(e)}")
+        emit('voice_done', {'turn_id': turn_id, 'error': 'Sorry, I encountered an error processing your message.'})
 
 # TTS API endpoint
 @app.route('/api/tts', methods=['POST'])
@@ -669,7 +859,7 @@ def api_tts():
             return jsonify({"success": False, "error": "Missing required field: text"}), 400
             
         # Get settings to check if TTS is enabled
-        settings = get_or_create_settings()
+        settings = get_cached_settings()
         
         # If provider is piper, use Piper TTS
         if provider == 'piper':
@@ -694,21 +884,10 @@ def api_tts():
                 logger.warning(f"TTS API error: {error_msg}")
                 return jsonify({"success": False, "error": error_msg}), 400
                 
-            # Create static/audio directory if it doesn't exist
-            audio_dir = os.path.join('static', 'audio')
-            os.makedirs(audio_dir, exist_ok=True)
-            
-            # Copy the file to the static folder for serving
-            filename = os.path.basename(audio_file_path)
-            static_path = os.path.join(audio_dir, filename)
-            shutil.copy(audio_file_path, static_path)
-            
-            # Return the URL to the audio file
-            audio_url = url_for('static', filename=f'audio/{filename}')
-            
+            # The audio is generated (or found in the cache) in static/audio/, so serve it directly
             return jsonify({
                 "success": True, 
-                "audio_url": audio_url,
+                "audio_url": audio_url(audio_file_path),
                 "voice": voice,
                 "provider": "piper"
             })
@@ -0,0 +1,267 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import update, or_
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from config import Config
+from models import GpuSlot
+from leader import db_now
+import http_client
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def checkpoint_matches(loaded, requested):
+    """
+    Check if the checkpoint AUTOMATIC1111 reports as loaded is the one requested
+
+    The webui reports full titles such as "realisticVisionV51_v51VAE.safetensors [15012c538f]"
+    while settings often hold a short name such as "RealisticVision", so a
+    case-insensitive prefix match counts as the same checkpoint.
+    """
+    if not loaded or not requested:
+        return False
+
+    loaded = loaded.lower()
+    requested = requested.lower()
+    return loaded == requested or loaded.startswith(requested)
+
+class _Endpoint:
+    """Per-endpoint state: the loaded checkpoint and the queue of jobs waiting to use it"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.loaded = None  # Checkpoint believed to be loaded, None until queried
+        self.busy = False
+        self.current = None  # Model of the job that ran last
+        self.streak = 0  # Consecutive jobs run for self.current
+        self.waiting = Counter()
+
+
+class SDCheckpointTracker:
+    """
+    Tracks the loaded checkpoint of each Stable Diffusion endpoint
+
+    The loaded checkpoint is read from /options once and then remembered, so
+    /options is only POSTed (forcing a checkpoint reload) when a job needs a
+    different model. Other processes using the same endpoint can switch it
+    without this process knowing, so txt2img requests also pin their model
+    with override_settings, and a failed request forgets the remembered
+    checkpoint. Jobs on one endpoint run one at a time. When the endpoint
+    frees up, waiting jobs for the model that is already loaded go first, up to
+    SD_MAX_SAME_MODEL_STREAK in a row so other models aren't starved.
+    """
+
+    def __init__(self, max_streak=None):
+        self.max_streak = max_streak or Config.SD_MAX_SAME_MODEL_STREAK
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def _endpoint(self, sd_url):
+        with self._lock:
+            endpoint = self._endpoints.get(sd_url)
+            if endpoint is None:
+                endpoint = _Endpoint()
+                self._endpoints[sd_url] = endpoint
+            return endpoint
+
+    def _may_run(self, endpoint, model):
+        if endpoint.busy:
+            return False
+
+        others_waiting = sum(count for waiting_model, count in endpoint.waiting.items() if waiting_model != model)
+        if model == endpoint.current:
+            # Keep the loaded model busy unless it has had its turn and others are waiting
+            return endpoint.streak < self.max_streak or others_waiting == 0
+
+        # A different model waits while jobs for the current one are queued and still within their streak
+        return endpoint.waiting[endpoint.current] == 0 or endpoint.streak >= self.max_streak
+
+    @contextmanager
+    def use_checkpoint(self, sd_url, model):
+        """
+        Hold the endpoint with model loaded for the duration of the block
+
+        Args:
+            sd_url (str): Base URL of the webui API, ending in /sdapi/v1
+            model (str): Checkpoint the job needs, or None to use whatever is loaded
+        """
+        endpoint = self._endpoint(sd_url)
+
+        with endpoint.condition:
+            endpoint.waiting[model] += 1
+            try:
+                while not self._may_run(endpoint, model):
+                    endpoint.condition.wait()
+            finally:
+                endpoint.waiting[model] -= 1
+                if endpoint.waiting[model] <= 0:
+                    del endpoint.waiting[model]
+
+            endpoint.busy = True
+            if model == endpoint.current:
+                endpoint.streak += 1
+            else:
+                endpoint.current = model
+                endpoint.streak = 1
+
+        try:
+            if model:
+                self._ensure_loaded(sd_url, endpoint, model)
+            yield
+        finally:
+            with endpoint.condition:
+                endpoint.busy = False
+                endpoint.condition.notify_all()
+
+    def _ensure_loaded(self, sd_url, endpoint, model):
+        # Only called while holding the endpoint, so no other job can switch it meanwhile
+        if endpoint.loaded is None:
+            endpoint.loaded = self.query_checkpoint(sd_url)
+
+        if checkpoint_matches(endpoint.loaded, model):
+            return
+
+        logger.info(f"Switching SD checkpoint on {sd_url} from {endpoint.loaded} to {model}")
+        try:
+            response = http_client.post(
+                f"{sd_url}/options",
+                json={"sd_model_checkpoint": model},
+                headers={"Content-Type": "application/json"},
+                read_timeout=Config.SD_CHECKPOINT_SWITCH_TIMEOUT
+            )
+            if response.status_code == 200:
+                endpoint.loaded = model
+            else:
+                logger.error(f"Error setting SD model: {response.status_code}, {response.text}")
+                endpoint.loaded = None
+        except Exception as e:
+            logger.error(f"Error setting SD model: {str(e)}")
+            # Unknown state; ask the endpoint again next time
+            endpoint.loaded = None
+
+    def query_checkpoint(self, sd_url):
+        """Ask the endpoint which checkpoint is loaded; returns None if it can't be read"""
+        try:
+            response = http_client.get(f"{sd_url}/options", read_timeout=Config.SD_OPTIONS_TIMEOUT)
+            if response.status_code == 200:
+                return response.json().get("sd_model_checkpoint")
+            logger.warning(f"Could not read SD options from {sd_url}: {response.status_code}")
+        except Exception as e:
+            logger.warning(f"Could not read SD options from {sd_url}: {str(e)}")
+        return None
+
+    def forget(self, sd_url=None):
+        """Drop the remembered checkpoint (e.g. after the webui was restarted or changed by hand)"""
+        with self._lock:
+            if sd_url is None:
+                endpoints = list(self._endpoints.values())
+            else:
+                endpoints = [endpoint for url, endpoint in self._endpoints.items() if url == sd_url]
+
+        for endpoint in endpoints:
+            with endpoint.condition:
+                endpoint.loaded = None
+
+
+class GpuSlots:
+    """
+    Deployment-wide cap on image generations in flight, used as a context manager
+
+    Image jobs run in every gunicorn worker and the content pipeline in the
+    leader, so a per-process semaphore would allow workers x the limit. The
+    GPU_MAX_CONCURRENCY slots are rows in the gpu_slot table instead, taken
+    with a conditional UPDATE like the leader lease: a slot is free when it has
+    no holder or its lease ran out, so a slot held by a process that died frees
+    itself after GPU_SLOT_LEASE_SECONDS. Waiting threads retry every
+    GPU_SLOT_POLL_INTERVAL seconds.
+    """
+
+    def __init__(self, size=None, lease_seconds=None, poll_interval=None):
+        self.size = size or Config.GPU_MAX_CONCURRENCY
+        self.lease_seconds = lease_seconds or Config.GPU_SLOT_LEASE_SECONDS
+        self.poll_interval = poll_interval or Config.GPU_SLOT_POLL_INTERVAL
+        self._held = threading.local()
+        self._rows_ready = False
+
+    def _ensure_rows(self):
+        existing = {slot for (slot,) in db.session.query(GpuSlot.slot)}
+        for slot in range(self.size):
+            if slot in existing:
+                continue
+            try:
+                db.session.add(GpuSlot(slot=slot))
+                db.session.commit()
+            except IntegrityError:
+                # Another process created it first
+                db.session.rollback()
+        self._rows_ready = True
+
+    def _try_acquire(self, holder):
+        """Take a free slot for holder; returns its number, or None if all are busy"""
+        with app.app_context():
+            if not self._rows_ready:
+                self._ensure_rows()
+
+            for slot in range(self.size):
+                result = db.session.execute(
+                    update(GpuSlot)
+                    .where(GpuSlot.slot == slot,
+                           or_(GpuSlot.holder.is_(None), GpuSlot.expires_at < db_now()))
+                    .values(holder=holder, expires_at=db_now(self.lease_seconds))
+                )
+                db.session.commit()
+                if result.rowcount:
+                    return slot
+        return None
+
+    def _release(self, slot, holder):
+        with app.app_context():
+            db.session.execute(
+                update(GpuSlot)
+                .where(GpuSlot.slot == slot, GpuSlot.holder == holder)
+                .values(holder=None, expires_at=None)
+            )
+            db.session.commit()
+
+    def __enter__(self):
+        holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        while True:
+            try:
+                slot = self._try_acquire(holder)
+            except Exception as e:
+                logger.error(f"Error taking a GPU slot: {str(e)}")
+                slot = None
+            if slot is not None:
+                break
+            time.sleep(self.poll_interval)
+
+        if not hasattr(self._held, "stack"):
+            self._held.stack = []
+        self._held.stack.append((slot, holder))
+        return self
+
+    def __exit__(self, *exc_info):
+        slot, holder = self._held.stack.pop()
+        try:
+            self._release(slot, holder)
+        except Exception as e:
+            # The lease still runs out on its own
+            logger.error(f"Error releasing GPU slot {slot}: {str(e)}")
+        return False
+
+
+# Create global checkpoint tracker
+sd_checkpoints = SDCheckpointTracker()
+
+# Cap on image generations in flight at once across all GPU backends (SD and Colab).
+# SD jobs take a slot only inside sd_checkpoints.use_checkpoint, never the other way round
+gpu_slots = GpuSlots()
@@ -0,0 +1,148 @@
+import copy
+import json
+import logging
+import threading
+import time
+
+from config import Config
+from app import db
+from models import SophiaSettings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# JSON text columns that are parsed once per snapshot instead of on every access
+JSON_FIELDS = ('instagram_settings', 'telegram_settings', 'paypal_settings', 'webrtc_config')
+
+class SettingsSnapshot:
+    """
+    Read-only, process-local copy of the SophiaSettings row
+
+    Exposes the same attributes and get_*_settings() helpers as the model, so it
+    can be used anywhere settings are only read. It is not bound to a database
+    session and can be shared between threads.
+    """
+
+    def __init__(self, settings):
+        values = {column.name: getattr(settings, column.name) for column in SophiaSettings.__table__.columns}
+
+        parsed = {}
+        for field in JSON_FIELDS:
+            try:
+                parsed[field] = json.loads(values.get(field) or '{}')
+            except ValueError:
+                logger.error(f"Invalid JSON in settings field {field}")
+                parsed[field] = {}
+
+        object.__setattr__(self, '_values', values)
+        object.__setattr__(self, '_parsed', parsed)
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Settings snapshot is read-only; update the SophiaSettings row instead")
+
+    def _get_json(self, field):
+        # Callers get their own copy so they can't modify the shared snapshot
+        return copy.deepcopy(self._parsed[field])
+
+    def get_instagram_settings(self):
+        return self._get_json('instagram_settings')
+
+    def get_telegram_settings(self):
+        return self._get_json('telegram_settings')
+
+    def get_paypal_settings(self):
+        return self._get_json('paypal_settings')
+
+    def get_webrtc_config(self):
+        return self._get_json('webrtc_config')
+
+    def __repr__(self):
+        return f'<SettingsSnapshot {self.id} v{self.version}>'
+
+
+class SettingsCache:
+    """
+    Process-wide settings cache with version-stamp revalidation
+
+    The snapshot is loaded once and reused. At most every check_interval seconds
+    the cache reads SophiaSettings.version, and it reloads only if another
+    process has changed the row. Writers in this process call invalidate() after
+    committing so their own changes are visible immediately.
+    """
+
+    def __init__(self, check_interval=None):
+        self.check_interval = Config.SETTINGS_CACHE_CHECK_INTERVAL if check_interval is None else check_interval
+        self._snapshot = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        settings = SophiaSettings.query.first()
+        if not settings:
+            return None
+        return SettingsSnapshot(settings)
+
+    def _current_version(self):
+        return db.session.query(SophiaSettings.version).order_by(SophiaSettings.id).limit(1).scalar()
+
+    def get(self):
+        """
+        Get the current settings snapshot
+
+        Returns:
+            SettingsSnapshot or None: The snapshot, or None if no settings row exists
+        """
+        snapshot = self._snapshot
+        now = time.monotonic()
+
+        if snapshot is not None and now - self._last_check < self.check_interval:
+            return snapshot
+
+        with self._lock:
+            # Another thread may have refreshed while we waited for the lock
+            snapshot = self._snapshot
+            if snapshot is not None and now - self._last_check < self.check_interval:
+                return snapshot
+
+            try:
+                if snapshot is not None and self._current_version() == snapshot.version:
+                    self._last_check = now
+                    return snapshot
+
+                snapshot = self._load()
+            except Exception as e:
+                logger.error(f"Error refreshing settings cache: {str(e)}")
+                # Keep serving the last good snapshot if the database is unavailable
+                return self._snapshot
+
+            self._snapshot = snapshot
+            self._last_check = now
+
+            if snapshot is not None:
+                logger.debug(f"Loaded settings snapshot version {snapshot.version}")
+
+            return snapshot
+
+    def invalidate(self):
+        """Drop the cached snapshot so the next read reloads it from the database"""
+        with self._lock:
+            self._snapshot = None
+            self._last_check = 0.0
+
+
+# Create global settings cache
+settings_cache = SettingsCache()
+
+def get_settings():
+    """Get the cached, read-only settings snapshot (or None if no settings exist)"""
+    return settings_cache.get()
+
+def invalidate_settings():
+    """Invalidate the settings cache; call after committing changes to SophiaSettings"""
+    settings_cache.invalidate()
@@ -5,11 +5,15 @@ import time
 from datetime import datetime
 import json
 import random
+import threading
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
 from instagrapi import Client as InstagramClient
 from telegram import Bot as TelegramBot
 from telegram.error import TelegramError
 
 from config import Config
+from image_derivatives import image_url
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -18,6 +22,9 @@ logger = logging.getLogger(__name__)
 instagram_client = None
 telegram_bot = None
 
+# Publishing threads may need a client at the same moment; only one of them should log in
+_client_lock = threading.Lock()
+
 def init_instagram_client():
     """Initialize and authenticate Instagram client"""
     global instagram_client
@@ -57,21 +64,24 @@ def publish_to_instagram(post):
     """Publish a content post to Instagram"""
     # Ensure client is initialized
     if not instagram_client:
-        client = init_instagram_client()
-        if not client:
-            raise Exception("Instagram client initialization failed")
+        with _client_lock:
+            if not instagram_client and not init_instagram_client():
+                raise Exception("Instagram client initialization failed")
     
     try:
         # Format caption with hashtags
         caption = f"{post.caption}\n\n{post.hashtags}"
         
         # For demo purposes, we'll log the action rather than actually posting
+        # Instagram crops to 4:5 portrait at most; use the pre-rendered 1080x1350 version when there is one
+        instagram_image_url = image_url(post.image_url, 'ig_portrait')
+        
         logger.info(f"Publishing to Instagram: {post.title}")
         logger.info(f"Caption: {caption}")
-        logger.info(f"Image URL: {post.image_url}")
+        logger.info(f"Image URL: {instagram_image_url}")
         
         # In a real implementation, we would download the image and then upload
-        # image_path = download_image(post.image_url)
+        # image_path = download_image(instagram_image_url)
         # media = instagram_client.photo_upload(image_path, caption)
         # return media.pk
         
@@ -86,9 +96,9 @@ def publish_to_telegram(post):
     """Publish a content post to Telegram"""
     # Ensure bot is initialized
     if not telegram_bot:
-        bot = init_telegram_bot()
-        if not bot:
-            raise Exception("Telegram bot initialization failed")
+        with _client_lock:
+            if not telegram_bot and not init_telegram_bot():
+                raise Exception("Telegram bot initialization failed")
     
     try:
         # Format caption with hashtags
@@ -149,11 +159,38 @@ def reply_to_telegram_message(chat_id, message):
     logger.info(f"Replying to Telegram chat {chat_id}: {message}")
     return True
 
+# Publishers by platform name, each with its own pool so one slow platform can't hold up another
+PUBLISHERS = {
+    "instagram": publish_to_instagram,
+    "telegram": publish_to_telegram,
+}
+
+publish_executors = {
+    "instagram": ThreadPoolExecutor(max_workers=Config.INSTAGRAM_PUBLISH_CONCURRENCY, thread_name_prefix="publish-instagram"),
+    "telegram": ThreadPoolExecutor(max_workers=Config.TELEGRAM_PUBLISH_CONCURRENCY, thread_name_prefix="publish-telegram"),
+}
+
+def _post_snapshot(post):
+    """Plain copy of the fields publishers read, so worker threads never touch the ORM session"""
+    return SimpleNamespace(
+        id=post.id,
+        title=post.title,
+        caption=post.caption,
+        hashtags=post.hashtags,
+        image_url=post.image_url,
+        media_path=post.media_path,
+        content_type=post.content_type
+    )
+
 def publish_scheduled_posts():
     """
     Check for scheduled posts that need to be published and
     publish them to all specified platforms simultaneously
     
+    Every (post, platform) upload is submitted at once to that platform's
+    pool, so uploads overlap up to each platform's concurrency limit. Post
+    statuses are updated once all uploads have finished and committed together.
+    
     Returns:
         list: List of results containing success/error information
     """
@@ -162,17 +199,14 @@ def publish_scheduled_posts():
     
     # Get all scheduled posts that are due to be published
     now = datetime.now()
-    scheduled_posts = ContentPost.query.filter(
-        ContentPost.status == "scheduled",
-        ContentPost.scheduled_for <= now
-    ).all()
+    scheduled_posts = ContentPost.due(now).all()
     
     if not scheduled_posts:
         logger.info("No posts scheduled for publishing at this time")
         return []
     
-    results = []
-    
+    # Fan out every upload before waiting on any of them
+    pending = []
     for post in scheduled_posts:
         post_result = {
             "post_id": post.id,
@@ -188,39 +222,41 @@ def publish_scheduled_posts():
             platforms = []
             post_result["error"] = f"Invalid platforms format: {str(e)}"
         
+        snapshot = _post_snapshot(post)
+        uploads = []
+        for platform in platforms:
+            platform = platform.strip().lower()
+            if platform in PUBLISHERS:
+                future = publish_executors[platform].submit(PUBLISHERS[platform], snapshot)
+            else:
+                future = None
+            uploads.append((platform, future))
+        
+        pending.append((post, post_result, uploads))
+    
+    results = []
+    for post, post_result, uploads in pending:
         # Track if any platform publishing succeeded
         any_success = False
         
-        # Publish to each platform
-        for platform in platforms:
-            platform = platform.strip().lower()
-            
+        for platform, future in uploads:
             platform_result = {
                 "platform": platform,
                 "status": "attempted"
             }
             
-            try:
-                if platform == "instagram":
-                    post_id = publish_to_instagram(post)
-                    platform_result["status"] = "success"
-                    platform_result["platform_post_id"] = post_id
-                    any_success = True
-                    
-                elif platform == "telegram":
-                    message_id = publish_to_telegram(post)
+            if future is None:
+                platform_result["status"] = "error"
+                platform_result["error"] = f"Unknown platform: {platform}"
+            else:
+                try:
+                    platform_result["platform_post_id"] = future.result()
                     platform_result["status"] = "success"
-                    platform_result["platform_post_id"] = message_id
                     any_success = True
-                    
-                else:
+                except Exception as e:
                     platform_result["status"] = "error"
-                    platform_result["error"] = f"Unknown platform: {platform}"
-                    
-            except Exception as e:
-                platform_result["status"] = "error"
-                platform_result["error"] = str(e)
-                logger.error(f"Error publishing to {platform}: {str(e)}")
+                    platform_result["error"] = str(e)
+                    logger.error(f"Error publishing to {platform}: {str(e)}")
             
             post_result["platforms"].append(platform_result)
         
@@ -232,7 +268,9 @@ def publish_scheduled_posts():
             post.status = "failed"
             post.error_message = json.dumps(post_result)
         
-        db.session.commit()
         results.append(post_result)
     
+    # One commit for the whole batch
+    db.session.commit()
+    
     return results
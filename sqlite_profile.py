@@ -0,0 +1,78 @@
+import logging
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import Config
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def is_sqlite_uri(uri):
+    """Check if a database URI points at SQLite"""
+    return uri.startswith("sqlite")
+
+def is_memory_uri(uri):
+    """Check if a SQLite URI is an in-memory database"""
+    return uri in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in uri
+
+def sqlite_engine_options(uri):
+    """
+    Engine options for a file-backed SQLite database shared by web workers and background threads
+
+    The driver-level timeout makes sqlite3 wait for locks instead of failing
+    immediately with "database is locked". Connections are used from several
+    threads (chat workers, scheduler, bots), so the same-thread check is off.
+    SQLAlchemy's pool hands each connection to one thread at a time.
+    """
+    if is_memory_uri(uri):
+        # Let SQLAlchemy pick its in-memory pool; WAL and pooling don't apply
+        return {}
+
+    return {
+        "pool_size": Config.SQLITE_POOL_SIZE,
+        "max_overflow": Config.SQLITE_MAX_OVERFLOW,
+        "pool_timeout": 30,
+        "connect_args": {
+            "timeout": Config.SQLITE_BUSY_TIMEOUT_MS / 1000.0,
+            "check_same_thread": False,
+        },
+    }
+
+def configure_sqlite_connection(dbapi_connection):
+    """Apply the production PRAGMAs to a new SQLite connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        # WAL lets readers run alongside the single writer instead of blocking on it
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is safe with WAL (no corruption on power loss, at most the last commits are lost)
+        cursor.execute(f"PRAGMA synchronous={Config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(Config.SQLITE_BUSY_TIMEOUT_MS)}")
+        # Negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{int(Config.SQLITE_CACHE_SIZE_KB)}")
+        cursor.execute(f"PRAGMA mmap_size={int(Config.SQLITE_MMAP_SIZE)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+@event.listens_for(Engine, "connect")
+def _on_connect(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        configure_sqlite_connection(dbapi_connection)
+
+def engine_options_for(uri):
+    """
+    Pick engine options for the configured database
+
+    SQLite gets the WAL profile above; other databases keep the connection
+    recycling suited to a remote server.
+    """
+    if is_sqlite_uri(uri):
+        logger.info("Using SQLite production profile (WAL, busy timeout, pooled connections)")
+        return sqlite_engine_options(uri)
+
+    return {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+    }
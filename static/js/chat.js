@@ -13,6 +13,10 @@ document.addEventListener('DOMContentLoaded', function() {
     typingIndicator.className = 'typing-indicator';
     typingIndicator.innerHTML = '<span></span><span></span><span></span>';
     
+    // Message element currently being filled by streamed chunks
+    let streamingMessage = null;
+    let streamingText = '';
+    
     // Load chat history
     loadChatHistory();
     
@@ -50,6 +54,36 @@ document.addEventListener('DOMContentLoaded', function() {
         chatMessages.scrollTop = chatMessages.scrollHeight;
     }
     
+    // Append a streamed chunk to Sophia's in-progress message
+    function appendStreamChunk(chunk) {
+        if (!streamingMessage) {
+            hideTypingIndicator();
+            
+            streamingMessage = document.createElement('div');
+            streamingMessage.className = 'message sophia fade-in';
+            streamingMessage.appendChild(document.createTextNode(''));
+            chatMessages.appendChild(streamingMessage);
+            streamingText = '';
+        }
+        
+        streamingText += chunk;
+        streamingMessage.firstChild.textContent = streamingText;
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+    }
+    
+    // Replace the in-progress message with the saved response
+    function finishStreamingMessage(message, timestamp) {
+        if (streamingMessage && streamingMessage.parentNode === chatMessages) {
+            chatMessages.removeChild(streamingMessage);
+        }
+        streamingMessage = null;
+        streamingText = '';
+        
+        if (message !== undefined) {
+            addMessage(message, false, timestamp);
+        }
+    }
+    
     // Load chat history from the server
     function loadChatHistory() {
         fetch('/api/chat_history')
@@ -84,8 +118,8 @@ document.addEventListener('DOMContentLoaded', function() {
         // Show typing indicator
         showTypingIndicator();
         
-        // Emit message to server
-        socket.emit('message', { message: message });
+        // Emit message to server, asking for the reply to be streamed
+        socket.emit('message', { message: message, stream: true });
     }
     
     // Handle form submission
@@ -108,17 +142,31 @@ document.addEventListener('DOMContentLoaded', function() {
         console.log('Disconnected from server');
     });
     
+    socket.on('busy', function(data) {
+        // The server rejected the message because too many are in progress
+        hideTypingIndicator();
+        addMessage(data.error, false);
+    });
+    
+    socket.on('response_chunk', function(data) {
+        // Render partial replies as they arrive
+        if (data.chunk) {
+            appendStreamChunk(data.chunk);
+        }
+    });
+    
     socket.on('response', function(data) {
         // Hide typing indicator
         hideTypingIndicator();
         
         if (data.error) {
             console.error('Error:', data.error);
+            finishStreamingMessage();
             return;
         }
         
-        // Add Sophia's response to the chat
-        addMessage(data.message, false, data.timestamp);
+        // Add Sophia's saved response to the chat, replacing any streamed text
+        finishStreamingMessage(data.message, data.timestamp);
     });
     
     // Initialize
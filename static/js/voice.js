@@ -19,6 +19,51 @@ document.addEventListener('DOMContentLoaded', function() {
     let callInProgress = false;
     let permissionDenied = false;
     
+    // Streaming replies: the server pushes one audio segment per sentence over Socket.IO
+    const socket = (typeof io === 'function') ? io() : null;
+    let currentTurn = null; // Reply being played: {id, segments, next, count, playing}
+    let currentAudio = null;
+    let turnCounter = 0;
+    
+    if (socket) {
+        socket.on('voice_segment', function(data) {
+            if (!currentTurn || data.turn_id !== currentTurn.id) return; // Stale reply
+            
+            // Start buffering the audio now so it is ready when its turn comes
+            if (data.audio_url) {
+                data.audio = new Audio(data.audio_url);
+                data.audio.preload = 'auto';
+            }
+            currentTurn.segments[data.index] = data;
+            playNextSegment();
+        });
+        
+        socket.on('voice_done', function(data) {
+            if (!currentTurn || data.turn_id !== currentTurn.id) return;
+            
+            if (data.error) {
+                console.error('Error getting Sophia response:', data.error);
+                sophiaResponseText.textContent = "I'm sorry, I couldn't process your request right now.";
+                updateCallStatus('Error occurred');
+                currentTurn = null;
+                if (callInProgress && !permissionDenied) {
+                    setTimeout(startListening, 3000);
+                }
+                return;
+            }
+            
+            sophiaResponseText.textContent = data.text;
+            currentTurn.count = data.count;
+            
+            // Also add to chat history in the main chat window
+            if (typeof addSophiaMessage === 'function') {
+                addSophiaMessage(data.text);
+            }
+            
+            playNextSegment();
+        });
+    }
+    
     // Speech recognition setup
     let recognition = null;
     if ('webkitSpeechRecognition' in window) {
@@ -150,6 +195,13 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         }
         
+        // Drop the reply being played
+        currentTurn = null;
+        if (currentAudio) {
+            currentAudio.pause();
+            currentAudio = null;
+        }
+        
         // Stop any playing audio
         const audios = document.getElementsByTagName('audio');
         for (let i = 0; i < audios.length; i++) {
@@ -207,6 +259,14 @@ document.addEventListener('DOMContentLoaded', function() {
     function getSophiaResponse(userText) {
         updateCallStatus('Thinking...');
         
+        if (socket) {
+            // Stream the reply: segments arrive per sentence and play in order
+            turnCounter += 1;
+            currentTurn = {id: 'turn-' + Date.now() + '-' + turnCounter, segments: {}, next: 0, count: null, playing: false};
+            socket.emit('voice_message', {message: userText, turn_id: currentTurn.id});
+            return;
+        }
+        
         // Make API call to get Sophia's response
         fetch('/api/chat', {
             method: 'POST',
@@ -254,27 +314,102 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    /**
+     * Play the next segment of the current reply once it has arrived
+     */
+    function playNextSegment() {
+        const turn = currentTurn;
+        if (!turn || turn.playing || !callInProgress) return;
+        
+        // Every segment played: hand the floor back to the user
+        if (turn.count !== null && turn.next >= turn.count) {
+            currentTurn = null;
+            if (!permissionDenied) {
+                updateCallStatus('Listening...');
+                startListening();
+            }
+            return;
+        }
+        
+        const segment = turn.segments[turn.next];
+        if (!segment) return; // Not synthesized yet; its voice_segment event will call us again
+        
+        turn.playing = true;
+        updateCallStatus('Speaking...');
+        
+        let finished = false;
+        const done = function() {
+            if (finished) return;
+            finished = true;
+            currentAudio = null;
+            if (turn !== currentTurn) return; // Call ended or a new turn started
+            delete turn.segments[turn.next];
+            turn.next += 1;
+            turn.playing = false;
+            playNextSegment();
+        };
+        
+        if (!segment.audio) {
+            speakSegment(segment.text, done);
+            return;
+        }
+        
+        currentAudio = segment.audio;
+        currentAudio.onended = done;
+        currentAudio.onerror = function() {
+            // Fall back to browser TTS for this sentence
+            speakSegment(segment.text, done);
+        };
+        currentAudio.play().catch(function() {
+            speakSegment(segment.text, done);
+        });
+    }
+    
+    /**
+     * Speak one segment with the browser's speech synthesis, then call done
+     */
+    function speakSegment(text, done) {
+        if (!('speechSynthesis' in window)) {
+            done();
+            return;
+        }
+        
+        const speech = createUtterance(text);
+        speech.onend = done;
+        speech.onerror = done;
+        window.speechSynthesis.speak(speech);
+    }
+    
+    /**
+     * Build a speech synthesis utterance with Sophia's voice settings
+     */
+    function createUtterance(text) {
+        const speech = new SpeechSynthesisUtterance(text);
+        speech.lang = 'en-US';
+        speech.rate = 1.0;
+        speech.pitch = 1.0;
+        
+        // Use a female voice if available
+        const voices = window.speechSynthesis.getVoices();
+        const femaleVoice = voices.find(voice => 
+            voice.name.includes('female') || 
+            voice.name.includes('woman') || 
+            voice.name.includes('girl')
+        );
+        
+        if (femaleVoice) {
+            speech.voice = femaleVoice;
+        }
+        
+        return speech;
+    }
+    
     /**
      * Speak text using browser's speech synthesis
      */
     function speakText(text) {
         if ('speechSynthesis' in window) {
-            const speech = new SpeechSynthesisUtterance(text);
-            speech.lang = 'en-US';
-            speech.rate = 1.0;
-            speech.pitch = 1.0;
-            
-            // Use a female voice if available
-            const voices = window.speechSynthesis.getVoices();
-            const femaleVoice = voices.find(voice => 
-                voice.name.includes('female') || 
-                voice.name.includes('woman') || 
-                voice.name.includes('girl')
-            );
-            
-            if (femaleVoice) {
-                speech.voice = femaleVoice;
-            }
+            const speech = createUtterance(text);
             
             speech.onend = function() {
                 // Resume listening after speech completes only if call is still active
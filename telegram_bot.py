@@ -13,9 +13,10 @@ except ImportError:
 
 from config import Config
 from app import db
-from models import Conversation, Message
+from models import Conversation
 from ai_service import generate_text_response
-from language_processor import detect_language
+from language_processor import detect_conversation_language
+from chat_store import save_turn
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -30,6 +31,10 @@ class SophiaTelegramBot:
         self.bot = None
         self.application = None
         self.is_running = False
+        self._loop = None
+        self._stop_signal = None
+        self._stop_requested = threading.Event()
+        self._thread = None
 
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Send a welcome message when the command /start is issued."""
@@ -64,29 +69,13 @@ class SophiaTelegramBot:
         # Get or create conversation for this user
         conversation = self._get_or_create_conversation(external_id=str(user_id), source="telegram")
         
-        # Detect language
-        detected_lang = detect_language(user_message)
-        if detected_lang != conversation.detected_language:
-            conversation.detected_language = detected_lang
-            db.session.commit()
+        # Detect language, keeping the conversation's language unless it clearly changed
+        detected_lang = detect_conversation_language(conversation, user_message)
         
-        # Save user message to database
-        user_msg = Message(
-            conversation_id=conversation.id,
-            content=user_message,
-            is_from_user=True
-        )
-        db.session.add(user_msg)
-        
-        # Update conversation last interaction
-        conversation.last_interaction = datetime.utcnow()
-        db.session.commit()
+        received_at = datetime.utcnow()
         
-        # Count messages for this conversation
-        from app import app
-        message_count = 0
-        with app.app_context():
-            message_count = Message.query.filter_by(conversation_id=conversation.id).count()
+        # Messages so far in this conversation, counting this one (maintained on insert, no COUNT needed)
+        message_count = (conversation.message_count or 0) + 1
         
         # Check if we've reached the message limit (50)
         if message_count > 50:
@@ -104,14 +93,8 @@ class SophiaTelegramBot:
                 language=detected_lang
             )
         
-        # Save AI response to database
-        ai_msg = Message(
-            conversation_id=conversation.id,
-            content=response,
-            is_from_user=False
-        )
-        db.session.add(ai_msg)
-        db.session.commit()
+        # Save the message, AI response and conversation updates in one transaction
+        save_turn(conversation, user_message, response, language=detected_lang, received_at=received_at)
         
         # Send typing action
         await context.bot.send_chat_action(chat_id=chat_id, action="typing")
@@ -126,10 +109,7 @@ class SophiaTelegramBot:
         """Get existing conversation or create a new one."""
         from app import app
         with app.app_context():
-            conversation = Conversation.query.filter_by(
-                external_id=external_id,
-                source=source
-            ).first()
+            conversation = Conversation.for_external_id(external_id, source).first()
             
             if not conversation:
                 conversation = Conversation(
@@ -166,32 +146,61 @@ class SophiaTelegramBot:
             return False
 
     async def run(self):
-        """Run the bot."""
+        """Run the bot until stop() is called."""
         if not await self.setup():
             return
             
+        # run_polling() owns the event loop and signal handlers, so drive polling ourselves on this thread's loop
+        self._stop_signal = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        if self._stop_requested.is_set():
+            # stop() came while setup() was running, before it could signal this loop
+            self._loop = None
+            logger.info("Telegram bot stopped before polling started")
+            return
         try:
             logger.info("Starting Telegram bot")
             self.is_running = True
-            await self.application.run_polling()
+            async with self.application:
+                await self.application.start()
+                await self.application.updater.start_polling()
+                await self._stop_signal.wait()
+                await self.application.updater.stop()
+                await self.application.stop()
         except Exception as e:
             logger.error(f"Error running Telegram bot: {str(e)}")
+        finally:
             self.is_running = False
+            self._loop = None
+            logger.info("Telegram bot stopped")
 
     def start(self):
-        """Start the bot in a separate thread."""
-        if self.is_running:
-            logger.warning("Telegram bot is already running")
-            return
+        """Start the bot in a separate thread (also after a stop(), e.g. on regaining leadership)."""
+        if self._thread is not None and self._thread.is_alive():
+            if not self._stop_requested.is_set():
+                logger.warning("Telegram bot is already running")
+                return
+            # Still finishing a stop(); let the old application shut down before polling again
+            self._thread.join()
             
         def run_async_bot():
             asyncio.run(self.run())
             
-        thread = threading.Thread(target=run_async_bot)
-        thread.daemon = True
-        thread.start()
+        self._stop_requested.clear()
+        self._thread = threading.Thread(target=run_async_bot)
+        self._thread.daemon = True
+        self._thread.start()
         logger.info("Telegram bot started in background thread")
 
+    def stop(self):
+        """Stop polling; the bot thread exits once the application has shut down."""
+        # run() checks this once setup() is done, in case the loop below isn't there yet
+        self._stop_requested.set()
+        loop = self._loop
+        if loop is not None and self._stop_signal is not None:
+            loop.call_soon_threadsafe(self._stop_signal.set)
+            logger.info("Telegram bot stopping...")
+
 # Create global bot instance
 telegram_bot = SophiaTelegramBot()
 
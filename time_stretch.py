@@ -0,0 +1,154 @@
+import logging
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class TimeStretcher:
+    """
+    Streaming WSOLA (waveform-similarity overlap-add) time-stretch for 16-bit mono PCM
+
+    Changes the speed of speech without changing its pitch. Frames are read
+    from the input every speed * hop samples and overlap-added every hop
+    samples. Each frame is shifted by up to a quarter frame so that it lines up
+    with the waveform already written, which avoids the phasing artefacts of
+    plain overlap-add. The alignment search scores all candidate offsets of a
+    frame with one matrix-vector product (on a decimated grid, then refined at
+    full resolution), and the overlap-add for a block is done in one vectorized
+    step.
+
+    Input can be fed in blocks of any size (e.g. as a TTS engine produces them)
+    with process(); flush() returns the rest once the input has ended.
+    """
+
+    def __init__(self, speed, sample_rate=22050, frame_ms=30):
+        if speed <= 0:
+            raise ValueError("speed must be positive")
+
+        self.speed = speed
+
+        # Even frame length so a periodic Hann window at 50% overlap sums to exactly one
+        self.frame = max(2, int(sample_rate * frame_ms / 1000) // 2 * 2)
+        self.hop = self.frame // 2
+        self.analysis_hop = self.hop * speed
+        self.tolerance = self.frame // 4
+        self.window = np.hanning(self.frame + 1)[:-1].astype(np.float32)
+        self._frame_offsets = np.arange(self.frame)
+
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._buffer_start = 0  # Stream position of self._buffer[0]
+        self._frame_index = 0
+        self._previous = None  # Stream position of the last frame used
+        self._tail = np.zeros(self.hop, dtype=np.float32)  # Second half of the last windowed frame
+        self._samples_in = 0
+        self._samples_out = 0
+
+    def process(self, block):
+        """
+        Stretch the next block of input
+
+        Args:
+            block (bytes or numpy.ndarray): 16-bit PCM samples
+
+        Returns:
+            numpy.ndarray: int16 output samples that are complete so far
+        """
+        if isinstance(block, (bytes, bytearray, memoryview)):
+            block = np.frombuffer(block, dtype=np.int16)
+        self._samples_in += len(block)
+        self._buffer = np.concatenate([self._buffer, block.astype(np.float32)])
+        return self._emit(self._stretch())
+
+    def flush(self):
+        """
+        Finish the stream
+
+        Returns:
+            numpy.ndarray: The remaining int16 output samples
+        """
+        # Pad with silence so the last input samples get frames, then trim to the exact stretched length
+        self._buffer = np.concatenate([self._buffer, np.zeros(self.frame + self.tolerance + self.hop, dtype=np.float32)])
+        output = np.concatenate([self._stretch(), self._tail])
+        self._tail = np.zeros(self.hop, dtype=np.float32)
+
+        expected = int(round(self._samples_in / self.speed))
+        return self._emit(output[:max(0, expected - self._samples_out)])
+
+    def _stretch(self):
+        buffer = self._buffer
+        start = self._buffer_start
+        frame, hop, tolerance = self.frame, self.hop, self.tolerance
+
+        positions = []
+        previous = self._previous
+        while True:
+            nominal = int(round(self._frame_index * self.analysis_hop)) - start
+            low = max(nominal - tolerance, 0)
+            high = nominal + tolerance
+            if high + frame > len(buffer):
+                break
+
+            if previous is None:
+                position = max(nominal, 0)
+            else:
+                # Natural continuation of the previous frame is what the next frame should look like
+                follow = previous - start + hop
+                if follow + frame > len(buffer):
+                    break
+                template = buffer[follow:follow + frame]
+                candidates = sliding_window_view(buffer[low:high + frame], frame)
+
+                # Coarse search over every other offset on every fourth sample, then refine around the best one
+                coarse = 2 * int(np.argmax(candidates[::2, ::4] @ template[::4]))
+                fine_low = max(coarse - 1, 0)
+                fine = candidates[fine_low:coarse + 2] @ template
+                position = low + fine_low + int(np.argmax(fine))
+
+            positions.append(position)
+            previous = position + start
+            self._frame_index += 1
+
+        self._previous = previous
+        if not positions:
+            return np.zeros(0, dtype=np.float32)
+
+        # Window every frame at once and overlap-add: each output hop is a frame's first half
+        # plus the previous frame's second half
+        frames = buffer[np.array(positions)[:, None] + self._frame_offsets] * self.window
+        previous_tails = np.vstack([self._tail[None, :], frames[:-1, hop:]])
+        output = (frames[:, :hop] + previous_tails).ravel()
+        self._tail = frames[-1, hop:].copy()
+
+        # Drop input that no later frame can reach
+        keep_from = min(int(round(self._frame_index * self.analysis_hop)) - start - tolerance,
+                        self._previous - start + hop)
+        if keep_from > 0:
+            self._buffer = buffer[keep_from:]
+            self._buffer_start += keep_from
+
+        return output
+
+    def _emit(self, output):
+        self._samples_out += len(output)
+        return np.clip(np.rint(output), -32768, 32767).astype(np.int16)
+
+
+def time_stretch(samples, speed, sample_rate=22050):
+    """
+    Change the speed of a whole clip without changing its pitch
+
+    Args:
+        samples (numpy.ndarray or bytes): 16-bit mono PCM
+        speed (float): Playback speed, e.g. 0.9 for 10% slower
+        sample_rate (int): Sample rate of the clip
+
+    Returns:
+        numpy.ndarray: int16 samples, about len(samples) / speed long
+    """
+    if speed == 1.0:
+        return np.frombuffer(samples, dtype=np.int16) if isinstance(samples, (bytes, bytearray)) else samples
+
+    stretcher = TimeStretcher(speed, sample_rate)
+    return np.concatenate([stretcher.process(samples), stretcher.flush()])
@@ -1,9 +1,12 @@
 import os
+import time
+import hashlib
 import requests
 import logging
 import json
 import base64
 import tempfile
+import threading
 from pathlib import Path
 
 from config import Config
@@ -14,6 +17,126 @@ logger = logging.getLogger(__name__)
 # Define Piper TTS API endpoint
 PIPER_API_BASE_URL = "https://api.pipertts.ai/v1"
 
+# Where synthesized speech is stored and served from
+AUDIO_DIR = os.path.join('static', 'audio')
+
+class AudioCache:
+    """
+    Persistent cache of synthesized speech in static/audio/
+
+    Files are named by a hash of everything that affects the audio (enhanced
+    text, voice, format, speed, pitch, intensity), so a hit can be served as a
+    static file without calling the TTS API. Files older than max_age or past
+    the size limit (least recently used first) are evicted.
+    """
+
+    def __init__(self, directory=AUDIO_DIR, max_bytes=None, max_age=None):
+        self.directory = directory
+        self.max_bytes = max_bytes if max_bytes is not None else Config.TTS_CACHE_MAX_MB * 1024 * 1024
+        self.max_age = max_age if max_age is not None else Config.TTS_CACHE_MAX_AGE_DAYS * 86400
+        self._lock = threading.Lock()
+        self._last_eviction = 0
+
+    @staticmethod
+    def make_key(params):
+        canonical = json.dumps(params, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+    def path_for(self, key, output_format):
+        return os.path.join(self.directory, f"tts_{key}.{output_format}")
+
+    def get(self, key, output_format):
+        """Return the cached file's path, or None on a miss"""
+        path = self.path_for(key, output_format)
+        try:
+            # Refresh the modification time so eviction treats it as recently used
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key, output_format, audio_bytes):
+        """Store audio and return its path"""
+        path = self.path_for(key, output_format)
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Write to a temp file and rename, so a half-written file is never served
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(audio_bytes)
+            os.replace(temp_path, path)
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+        self.maybe_evict()
+        return path
+
+    def maybe_evict(self, interval=60):
+        """Run eviction at most once per interval seconds"""
+        now = time.time()
+        if now - self._last_eviction < interval:
+            return
+        self._last_eviction = now
+        self.evict()
+
+    def evict(self):
+        """Remove expired files, then least recently used ones until under the size limit"""
+        with self._lock:
+            now = time.time()
+            entries = []
+            removed = 0
+
+            try:
+                names = os.listdir(self.directory)
+            except FileNotFoundError:
+                return 0
+
+            for name in names:
+                if not name.startswith('tts_'):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+
+                if now - stat.st_mtime > self.max_age:
+                    try:
+                        os.remove(path)
+                        removed += 1
+                    except OSError:
+                        pass
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+
+        if removed:
+            logger.info(f"Evicted {removed} files from the TTS audio cache")
+        return removed
+
+
+# Create global audio cache instance
+audio_cache = AudioCache()
+
+def audio_url(path):
+    """URL for an audio file stored in static/audio/"""
+    return f"/static/audio/{os.path.basename(path)}"
+
 def add_speech_enhancements(text):
     """
     Enhance text with SSML tags for more sensual, intimate voice output
@@ -75,7 +198,7 @@ def generate_speech(text, voice_id="female_sensual", output_format="mp3", speed=
         pitch_adjustment (float): Slight pitch adjustment for more attractive sound (-0.5 to 0.5)
         
     Returns:
-        str: Path to the generated audio file, or None if failed
+        str: Path to the generated audio file in static/audio/, or None if failed
     """
     api_key = Config.PIPER_TTS_API_KEY
     
@@ -90,6 +213,20 @@ def generate_speech(text, voice_id="female_sensual", output_format="mp3", speed=
     # Add breathy quality and pauses for more intimate speech
     enhanced_text = add_speech_enhancements(text)
     
+    # Identical speech (greetings, farewells, repeated replies) is served from the cache
+    cache_key = AudioCache.make_key({
+        "text": enhanced_text,
+        "voice_id": voice_id,
+        "output_format": output_format,
+        "speed": speed,
+        "pitch_adjustment": pitch_adjustment,
+        "emotional_intensity": emotional_intensity
+    })
+    cached_path = audio_cache.get(cache_key, output_format)
+    if cached_path:
+        logger.debug(f"TTS cache hit for {cache_key}")
+        return cached_path
+    
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
@@ -123,14 +260,8 @@ def generate_speech(text, voice_id="female_sensual", output_format="mp3", speed=
                 # Decode the base64 audio content
                 audio_bytes = base64.b64decode(audio_content)
                 
-                # Create temporary file
-                temp_file = tempfile.NamedTemporaryFile(
-                    suffix=f".{output_format}", delete=False
-                )
-                temp_file.write(audio_bytes)
-                temp_file.close()
-                
-                return temp_file.name
+                # Store it in the cache, which is also where it is served from
+                return audio_cache.put(cache_key, output_format, audio_bytes)
             else:
                 logger.error("No audio content in response")
                 return None
@@ -1,10 +1,8 @@
-import os
 import logging
 import random
-from datetime import datetime
-import base64
 
 from config import Config
+from media_store import save_media
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -126,21 +124,14 @@ def save_video_from_b64(b64_string):
     """
     Save a base64 video to disk and return the URL
     In a real implementation, this would save to cloud storage
+    
+    Args:
+        b64_string (str or iterable): The base64 data, whole or as a stream of pieces
     """
     try:
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        video_path = f"static/generated/video_{timestamp}.mp4"
-        
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(video_path), exist_ok=True)
-        
-        # Decode and save video
-        with open(video_path, "wb") as f:
-            f.write(base64.b64decode(b64_string))
-        
-        # Return the URL path
-        return f"/{video_path}"
+        # Decoded in chunks straight to a temp file, then renamed into static/generated/
+        return save_media(b64=b64_string, prefix="video", extension="mp4")
     
     except Exception as e:
         logger.error(f"Error saving video: {str(e)}")
-        return get_stock_video()
\ No newline at end of file
+        return get_stock_video()
@@ -0,0 +1,120 @@
+import re
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from tts_service import generate_speech, audio_url
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# A sentence ends at . ! ? or … (optionally followed by quotes/brackets) and whitespace
+SENTENCE_END = re.compile(r'[.!?…]+["\')\]]*\s+')
+
+# Segments need something speakable; emoji-only or punctuation-only pieces are skipped
+SPEAKABLE = re.compile(r'\w')
+
+class SentenceSplitter:
+    """
+    Splits streamed text into sentences as soon as each one is complete
+
+    feed() takes pieces of text in arbitrary sizes and returns the sentences
+    they completed; flush() returns whatever is left once the text has ended.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, text):
+        self._buffer += text
+        sentences = []
+        position = 0
+        for match in SENTENCE_END.finditer(self._buffer):
+            sentences.append(self._buffer[position:match.end()].strip())
+            position = match.end()
+        self._buffer = self._buffer[position:]
+        return [sentence for sentence in sentences if sentence]
+
+    def flush(self):
+        remainder = self._buffer.strip()
+        self._buffer = ""
+        return [remainder] if remainder else []
+
+
+def synthesize_sentence(text, voice_id="female_sensual"):
+    """
+    Synthesize one sentence of a voice reply
+
+    Returns:
+        str or None: URL of the audio file, or None if TTS is unavailable (the client then speaks it itself)
+    """
+    try:
+        path = generate_speech(text, voice_id)
+    except ValueError as e:
+        # No API key configured
+        logger.debug(f"TTS unavailable: {str(e)}")
+        return None
+    except Exception as e:
+        logger.error(f"Error synthesizing sentence: {str(e)}")
+        return None
+
+    return audio_url(path) if path else None
+
+class VoiceReplyStream:
+    """
+    Turns a reply into audio segments while the reply is still being generated
+
+    Each completed sentence is synthesized on the TTS pool as soon as it is
+    available, and on_segment(index, text, audio_url) is called as each one
+    finishes. Segments can finish out of order; index gives the playback order.
+    """
+
+    def __init__(self, on_segment, voice_id="female_sensual", synthesize=None, executor=None):
+        self.on_segment = on_segment
+        self.voice_id = voice_id
+        self.synthesize = synthesize or synthesize_sentence
+        self.executor = executor or tts_executor
+        self._splitter = SentenceSplitter()
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def add_text(self, text):
+        """Add a piece of the reply; complete sentences are sent for synthesis"""
+        for sentence in self._splitter.feed(text):
+            self._submit(sentence)
+
+    def discard_partial(self):
+        """Drop text that hasn't completed a sentence yet, e.g. the tail of a reply that was cut off"""
+        self._splitter = SentenceSplitter()
+
+    def finish(self):
+        """
+        Mark the reply as complete and synthesize the final sentence
+
+        Returns:
+            int: Total number of segments the client should expect
+        """
+        for sentence in self._splitter.flush():
+            self._submit(sentence)
+        return self.count
+
+    def _submit(self, sentence):
+        if not SPEAKABLE.search(sentence):
+            return
+
+        with self._lock:
+            index = self.count
+            self.count += 1
+        self.executor.submit(self._synthesize, index, sentence)
+
+    def _synthesize(self, index, sentence):
+        url = self.synthesize(sentence, self.voice_id)
+        try:
+            self.on_segment(index, sentence, url)
+        except Exception as e:
+            logger.error(f"Error delivering voice segment {index}: {str(e)}")
+
+
+# Create global TTS worker pool
+tts_executor = ThreadPoolExecutor(max_workers=Config.TTS_WORKERS, thread_name_prefix="tts-worker")